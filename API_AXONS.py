@@ -8,19 +8,67 @@ import logging
 import json
 import os
 import re
+from functools import lru_cache
+from types import MappingProxyType
 from datetime import datetime, timezone, timedelta
 from config import Config
+from submission_archive import get_default_archive
+from gazetteer import get_gazetteer
+from metrics import timed
+from token_store import TokenStore
+import tracing
+from tracing import traced
 
 logger = logging.getLogger(__name__)
 
+# Base64 alphabet: such strings can be embedded in JSON without escaping.
+# Only a prefix is matched; the rest is checked for the characters JSON escapes
+_BASE64_RE = re.compile(r'[A-Za-z0-9+/=]*')
+_BASE64_PREFIX_CHARS = 64
+_JSON_ESCAPED = ('"', '\\', '\n', '\r')
+
+
+def _line_information_note() -> list:
+    """Constant line-item InformationNote (a new list per line, safe to modify)."""
+    return [
+        {"content": ["0.00"], "subject": "ProductRemark7"},
+        {"content": ["0.00"], "subject": "ProductRemark8"}
+    ]
+
+
+def _line_allowance_charge() -> list:
+    """Constant line-item SpecifiedTradeAllowanceCharge (a new list per line)."""
+    return [
+        {
+            "TypeCode": None,
+            "ActualAmount": ["0.00"],
+            "ChargeIndicator": False,
+            "Reason": None,
+            "ReasonCode": None
+        }
+    ]
+
+# Address / branch patterns (compiled once, used by the memoized parsers)
+_FIVE_DIGITS_RE = re.compile(r'(\d{5})')
+_DIGITS_RE = re.compile(r'\d+')
+_PROVINCE_RE = re.compile(r'(?:จ\.|จังหวัด)\s*([^\s]+)')
+_DISTRICT_RE = re.compile(r'(?:อ\.|อำเภอ|เขต)\s*([^\s]+)')
+_SUBDISTRICT_RE = re.compile(r'(?:ต\.|ตำบล|แขวง)\s*([^\s]+)')
+_BUILDING_NO_RE = re.compile(r'^([\d/]+)')
+
 
 class AxonsETaxService:
     """Main service class for AXONS E-TAX API integration."""
 
-    def __init__(self):
+    TOKEN_NAME = "tsp"
+
+    def __init__(self, token_store: TokenStore = None):
         self._access_token = None
         self._token_expiry = 0
         self.config = Config
+        self.archive = get_default_archive()
+        # Shared with the other server processes (see token_store.py)
+        self.token_store = token_store or TokenStore()
 
     # =========================================================================
     # 1. AUTH MODULE - OAuth2 Token Management
@@ -30,15 +78,28 @@ class AxonsETaxService:
         Get OAuth2 access token using client_credentials grant.
         Caches token and auto-refreshes when expired.
         """
-        # DEBUG: Use manual token provided by user
-        manual_token = "qghc4TRv3l6w0r9phn6mMMdz9mIQwK2O"
-        logger.warning(f"DEBUG: Using manual token: {manual_token[:5]}...")
-        return manual_token
-        
+        manual_token = self.config.ETAX_MANUAL_TOKEN
+        if manual_token:
+            logger.warning(f"DEBUG: Using manual token from ETAX_MANUAL_TOKEN: {manual_token[:5]}...")
+            return manual_token
+
         # Return cached token if still valid (with 60s buffer)
         if self._access_token and time.time() < (self._token_expiry - 60):
             return self._access_token
 
+        # Otherwise take the one shared by all workers (fetched by one of them when expired)
+        self._access_token, self._token_expiry = self.token_store.get(
+            self.TOKEN_NAME, self._request_access_token, margin=60
+        )
+        return self._access_token
+
+    def _request_access_token(self) -> tuple:
+        """
+        Request a new OAuth2 token.
+
+        Returns:
+            (access_token, expires_at epoch seconds)
+        """
         logger.info("Requesting new OAuth2 access token...")
         try:
             headers = {
@@ -61,21 +122,25 @@ class AxonsETaxService:
             token_data = response.json()
             logger.debug(f"Raw token response: {json.dumps(token_data)}")
 
-            self._access_token = token_data["access_token"]
             # Default to 3600s if expires_in not provided
             expires_in = token_data.get("expires_in", 3600)
-            self._token_expiry = time.time() + expires_in
-
             logger.info(f"OAuth2 token acquired, expires in {expires_in}s")
-            return self._access_token
+            return token_data["access_token"], time.time() + expires_in
 
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to acquire OAuth2 token: {e}")
             raise Exception(f"OAuth2 authentication failed: {e}")
 
+    def invalidate_access_token(self):
+        """Forget a token the API rejected (here and for the other workers)."""
+        self._access_token, self._token_expiry = None, 0
+        self.token_store.invalidate(self.TOKEN_NAME)
+
     # =========================================================================
     # 2. PDF SERVICE - Generate PDF via Gen PDF API
     # =========================================================================
+    @timed("generate_pdf")
+    @traced("generate_pdf")
     def generate_pdf(self, et_invoice_json: dict) -> str:
         """
         Generate PDF from ET_INVOICE JSON format.
@@ -116,6 +181,7 @@ class AxonsETaxService:
                 timeout=60
             )
             
+            tracing.current_span().set_attribute("http.status_code", response.status_code)
             if response.status_code != 200:
                 logger.error(f"Gen PDF API returned {response.status_code}: {response.text}")
                 response.raise_for_status()
@@ -145,6 +211,8 @@ class AxonsETaxService:
     # =========================================================================
     # 3. DATA TRANSFORMER - ET_INVOICE → ETDA v2.0 (ER3-2560)
     # =========================================================================
+    @timed("transform_to_etda", items=lambda _: 1)
+    @traced("transform_to_etda")
     def transform_to_etda(self, et_invoice_json: dict, base64_pdf: str) -> dict:
         """
         Transform ET_INVOICE format to ETDA v2.0 (ER3-2560) format.
@@ -224,98 +292,16 @@ class AxonsETaxService:
         # --- Build Seller Trade Party ---
         seller_name = str(hdr.get("COM_NAME_LOCAL", self.config.SELLER_NAME)).strip()
         seller_address_str = str(hdr.get("COM_ADDRESS1", "")).strip()
-        s_addr = self._parse_address(seller_address_str)
-        
-        seller_trade_party = {
-            "postalTradeAddress": {
-                "PostcodeCode": s_addr["postcode"],
-                "BuildingName": "",
-                "LineOne": s_addr["line_one"],
-                "LineTwo": "",
-                "LineThree": None,
-                "LineFour": None,
-                "LineFive": None,
-                "StreetName": None,
-                "CityName": "1026",
-                "CitySubDivisionName": "102601",
-                "CountryID": {
-                    "schemeID": "3166-1 alpha-2",
-                    "value": "TH"
-                },
-                "CountrySubDivisionID": "10",  # Default to Bangkok for UAT
-                "BuildingNumber": s_addr["building_number"]
-            },
-            "definedTradeContact": None,
-            "id": ["0107566000135"],
-            "name": seller_name,
-            "SpecifiedTaxRegistration": {
-                "ID": {
-                    "value": "010554507034500000",
-                    "schemeID": "TXID",
-                    "schemeName": None,
-                    "schemeAgencyID": None,
-                    "schemeAgencyName": None,
-                    "schemeVersionID": None,
-                    "schemeDataURI": None,
-                    "schemeURI": None
-                }
-            }
-        }
+        seller_trade_party = self._build_seller_party(seller_name, seller_address_str)
 
         # --- Build Buyer Trade Party ---
         buyer_name = str(hdr.get("BILL_NAME", "")).strip()
         buyer_address_str = str(hdr.get("BILL_ADDRESS1", "")).strip()
-        b_addr = self._parse_address(buyer_address_str)
         buyer_branch_name = str(hdr.get("CV_SHORT_NAME", "สำนักงานใหญ่")).strip()
         cv_code = str(hdr.get("CV_CODE", "")).strip()
-
-        buyer_trade_party = {
-            "ID": [cv_code],
-            "Name": buyer_name,
-            "PostalTradeAddress": {
-                "PostcodeCode": b_addr["postcode"] if b_addr["postcode"] else "10500",
-                "BuildingName": None,
-                "LineOne": b_addr["line_one"],
-                "LineTwo": "",
-                "LineThree": None,
-                "LineFour": None,
-                "LineFive": None,
-                "StreetName": None,
-                "CityName": "1026",
-                "CitySubDivisionName": "102601",
-                "CountryID": {
-                    "schemeID": "3166-1 alpha-2",
-                    "value": "TH"
-                },
-                "CountrySubDivisionID": "10",
-                "BuildingNumber": b_addr["building_number"] or "1"
-            },
-            "SpecifiedTaxRegistration": {
-                "ID": {
-                    "value": buyer_tax_18,
-                    "schemeID": "TXID",
-                    "schemeName": None,
-                    "schemeAgencyID": None,
-                    "schemeAgencyName": None,
-                    "schemeVersionID": None,
-                    "schemeDataURI": None,
-                    "schemeURI": None
-                }
-            },
-            "DefinedTradeContact": [
-                {
-                    "TelephoneUniversalCommunication": {
-                        "CompleteNumber": ""
-                    },
-                    "PersonName": buyer_name,
-                    "DepartmentName": buyer_branch_name,
-                    "EmailURIUniversalCommunication": {
-                        "URIID": ""
-                    }
-                }
-            ],
-            "GlobalID": None
-        }
+        buyer_trade_party = self._build_buyer_party(
+            cv_code, buyer_name, buyer_address_str, buyer_branch_name, buyer_tax_18
+        )
 
         # --- Build Referenced Document (for CN/DN) ---
         additional_ref = None
@@ -396,98 +382,7 @@ class AxonsETaxService:
         }
 
         # --- Build Line Items ---
-        line_items = []
-        for dtl in dtl_list:
-            line_id = str(dtl.get("EXT_NUMBER", 1))
-            product_name = str(dtl.get("PRODUCT_NAME", "")).strip()
-            qty = self._fmt_amount(dtl.get("COSTPRICE_QTY", 1), decimals=3)
-            unit_price = self._fmt_amount(dtl.get("GROSS_PRODUCT", 0))
-            line_total = self._fmt_amount(dtl.get("TOTAL_NET_PRODUCT", 0))
-
-            # Calculate line-level tax (proportional)
-            total_before_vat = float(hdr.get("TOTAL_NETT", 0) or 0)
-            line_total_f = float(dtl.get("TOTAL_NET_PRODUCT", 0) or 0)
-            if total_before_vat > 0:
-                line_tax = round(line_total_f * float(hdr.get("TAX_AMT", 0) or 0) / total_before_vat, 2)
-            else:
-                line_tax = 0.0
-            line_incl_tax = round(line_total_f + line_tax, 2)
-
-            line_item = {
-                "AssociatedDocumentLineDocument": {
-                    "LineID": line_id
-                },
-                "SpecifiedTradeProduct": {
-                    "ID": None,
-                    "Name": [product_name],
-                    "IndividualTradeProductInstance": None,
-                    "DesignatedProductClassification": None,
-                    "OriginTradeCountry": None,
-                    "InformationNote": [
-                        {"content": ["0.00"], "subject": "ProductRemark7"},
-                        {"content": ["0.00"], "subject": "ProductRemark8"}
-                    ],
-                    "GlobalID": None,
-                    "Description": [product_name]
-                },
-                "SpecifiedLineTradeAgreement": {
-                    "grossPriceProductTradePrice": {
-                        "chargeAmount": [{
-                            "currencyID": "THB",
-                            "currencyCodeListVersionID": None,
-                            "value": line_total
-                        }],
-                        "appliedTradeAllowanceCharge": None
-                    }
-                },
-                "SpecifiedLineTradeDelivery": {
-                    "BilledQuantity": {
-                        "unitCode": "AU",
-                        "unitCodeListID": None,
-                        "unitCodeListAgencyID": None,
-                        "unitCodeListAgencyName": None,
-                        "Value": qty
-                    },
-                    "PerPackageUnitQuantity": None
-                },
-                "SpecifiedLineTradeSettlement": {
-                    "SpecifiedTradeSettlementLineMonetarySummation": {
-                        "netLineTotalAmount": [{
-                            "currencyID": "THB",
-                            "currencyCodeListVersionID": None,
-                            "value": line_total
-                        }],
-                        "netIncludingTaxesLineTotalAmount": [{
-                            "currencyID": "THB",
-                            "currencyCodeListVersionID": None,
-                            "value": self._fmt_amount(line_incl_tax)
-                        }],
-                        "taxTotalAmount": [{
-                            "currencyID": "THB",
-                            "currencyCodeListVersionID": None,
-                            "value": self._fmt_amount(line_tax)
-                        }]
-                    },
-                    "ApplicableTradeTax": [
-                        {
-                            "TypeCode": "VAT",
-                            "CalculatedRate": "7",
-                            "BasisAmount": [line_total],
-                            "CalculatedAmount": [self._fmt_amount(line_tax)]
-                        }
-                    ],
-                    "SpecifiedTradeAllowanceCharge": [
-                        {
-                            "TypeCode": None,
-                            "ActualAmount": ["0.00"],
-                            "ChargeIndicator": False,
-                            "Reason": None,
-                            "ReasonCode": None
-                        }
-                    ]
-                }
-            }
-            line_items.append(line_item)
+        line_items = self._build_line_items(dtl_list, hdr.get("TAX_AMT", 0))
 
         # --- Build LineOA ---
         line_oa = {
@@ -501,7 +396,7 @@ class AxonsETaxService:
         # --- Assemble Final ETDA v2.0 Document ---
         etda_document = {
             "RequestSendMail": "X",
-            "InternalDocNo": "1230572800",
+            "InternalDocNo": self.config.INTERNAL_DOC_NO,
             "Email": "test@gmail.co.th",
             "Branch": "00000",
             "RequestSendSMS": "",
@@ -545,9 +440,215 @@ class AxonsETaxService:
 
         return etda_document, endpoint_key
 
+    # --- Trade party builders ---
+    # A batch usually has one or a few sellers and a bounded set of buyers, so
+    # the expensive part (address parsing and area-code lookup) is memoized
+    # as read-only data. The party dicts themselves are deliberately not
+    # cached: each document needs its own mutable blocks, and copying a
+    # cached block costs several times more than building the literal from
+    # the memoized parts.
+    @staticmethod
+    def _build_seller_party(seller_name: str, seller_address_str: str) -> dict:
+        """Build the SellerTradeParty block."""
+        s_addr = AxonsETaxService._parse_address(seller_address_str)
+        return {
+            "postalTradeAddress": {
+                "PostcodeCode": s_addr["postcode"],
+                "BuildingName": "",
+                "LineOne": s_addr["line_one"],
+                "LineTwo": "",
+                "LineThree": None,
+                "LineFour": None,
+                "LineFive": None,
+                "StreetName": None,
+                "CityName": s_addr["area_codes"][1],
+                "CitySubDivisionName": s_addr["area_codes"][2],
+                "CountryID": {
+                    "schemeID": "3166-1 alpha-2",
+                    "value": "TH"
+                },
+                "CountrySubDivisionID": s_addr["area_codes"][0],
+                "BuildingNumber": s_addr["building_number"]
+            },
+            "definedTradeContact": None,
+            "id": ["0107566000135"],
+            "name": seller_name,
+            "SpecifiedTaxRegistration": {
+                "ID": {
+                    "value": "010554507034500000",
+                    "schemeID": "TXID",
+                    "schemeName": None,
+                    "schemeAgencyID": None,
+                    "schemeAgencyName": None,
+                    "schemeVersionID": None,
+                    "schemeDataURI": None,
+                    "schemeURI": None
+                }
+            }
+        }
+
+    @staticmethod
+    def _build_buyer_party(cv_code: str, buyer_name: str, buyer_address_str: str,
+                           buyer_branch_name: str, buyer_tax_18: str) -> dict:
+        """Build the BuyerTradeParty block."""
+        b_addr = AxonsETaxService._parse_address(buyer_address_str)
+        return {
+            "ID": [cv_code],
+            "Name": buyer_name,
+            "PostalTradeAddress": {
+                "PostcodeCode": b_addr["postcode"] if b_addr["postcode"] else "10500",
+                "BuildingName": None,
+                "LineOne": b_addr["line_one"],
+                "LineTwo": "",
+                "LineThree": None,
+                "LineFour": None,
+                "LineFive": None,
+                "StreetName": None,
+                "CityName": b_addr["area_codes"][1],
+                "CitySubDivisionName": b_addr["area_codes"][2],
+                "CountryID": {
+                    "schemeID": "3166-1 alpha-2",
+                    "value": "TH"
+                },
+                "CountrySubDivisionID": b_addr["area_codes"][0],
+                "BuildingNumber": b_addr["building_number"] or "1"
+            },
+            "SpecifiedTaxRegistration": {
+                "ID": {
+                    "value": buyer_tax_18,
+                    "schemeID": "TXID",
+                    "schemeName": None,
+                    "schemeAgencyID": None,
+                    "schemeAgencyName": None,
+                    "schemeVersionID": None,
+                    "schemeDataURI": None,
+                    "schemeURI": None
+                }
+            },
+            "DefinedTradeContact": [
+                {
+                    "TelephoneUniversalCommunication": {
+                        "CompleteNumber": ""
+                    },
+                    "PersonName": buyer_name,
+                    "DepartmentName": buyer_branch_name,
+                    "EmailURIUniversalCommunication": {
+                        "URIID": ""
+                    }
+                }
+            ],
+            "GlobalID": None
+        }
+
+    # --- Line item builder ---
+    @classmethod
+    def _build_line_items(cls, dtl_list: list, header_tax) -> list:
+        """
+        Build IncludedSupplyChainTradeLineItem for all detail lines.
+        Line taxes are allocated from the header TAX_AMT in one pass so that
+        they sum exactly to it.
+        """
+        line_totals = [cls._to_float(dtl.get("TOTAL_NET_PRODUCT", 0)) for dtl in dtl_list]
+        line_taxes = cls._allocate_line_taxes(line_totals, cls._to_float(header_tax))
+
+        line_items = []
+        for dtl, line_total_f, line_tax_satang in zip(dtl_list, line_totals, line_taxes):
+            product_name = str(dtl.get("PRODUCT_NAME", "")).strip()
+            line_total = f"{line_total_f:.2f}"
+            line_tax = f"{line_tax_satang / 100:.2f}"
+            line_incl_tax = f"{round(line_total_f + line_tax_satang / 100, 2):.2f}"
+            line_total_amount = [cls._thb_amount(line_total)]
+            name_list = [product_name]
+
+            line_items.append({
+                "AssociatedDocumentLineDocument": {
+                    "LineID": str(dtl.get("EXT_NUMBER", 1))
+                },
+                "SpecifiedTradeProduct": {
+                    "ID": None,
+                    "Name": name_list,
+                    "IndividualTradeProductInstance": None,
+                    "DesignatedProductClassification": None,
+                    "OriginTradeCountry": None,
+                    "InformationNote": _line_information_note(),
+                    "GlobalID": None,
+                    "Description": name_list
+                },
+                "SpecifiedLineTradeAgreement": {
+                    "grossPriceProductTradePrice": {
+                        "chargeAmount": line_total_amount,
+                        "appliedTradeAllowanceCharge": None
+                    }
+                },
+                "SpecifiedLineTradeDelivery": {
+                    "BilledQuantity": {
+                        "unitCode": "AU",
+                        "unitCodeListID": None,
+                        "unitCodeListAgencyID": None,
+                        "unitCodeListAgencyName": None,
+                        "Value": cls._fmt_amount(dtl.get("COSTPRICE_QTY", 1), decimals=3)
+                    },
+                    "PerPackageUnitQuantity": None
+                },
+                "SpecifiedLineTradeSettlement": {
+                    "SpecifiedTradeSettlementLineMonetarySummation": {
+                        "netLineTotalAmount": line_total_amount,
+                        "netIncludingTaxesLineTotalAmount": [cls._thb_amount(line_incl_tax)],
+                        "taxTotalAmount": [cls._thb_amount(line_tax)]
+                    },
+                    "ApplicableTradeTax": [
+                        {
+                            "TypeCode": "VAT",
+                            "CalculatedRate": "7",
+                            "BasisAmount": [line_total],
+                            "CalculatedAmount": [line_tax]
+                        }
+                    ],
+                    "SpecifiedTradeAllowanceCharge": _line_allowance_charge()
+                }
+            })
+        return line_items
+
+    @staticmethod
+    def _allocate_line_taxes(line_totals: list, total_tax: float) -> list:
+        """
+        Split total_tax across lines proportionally to line_totals.
+        Works in satang with the largest-remainder method on the signed
+        amounts, so a discount / return line gets a negative share and the
+        result (a list of ints, satang) always sums exactly to the rounded
+        total. Lines that cancel out (signed sum 0) are weighted by size.
+        """
+        total_satang = int(round(total_tax * 100))
+        weights = [int(round(v * 100)) for v in line_totals]
+        weight_sum = sum(weights)
+        if weight_sum == 0:
+            weights = [abs(w) for w in weights]
+            weight_sum = sum(weights)
+        if weight_sum == 0 or total_satang == 0:
+            return [0] * len(weights)
+
+        # Exact share w * total / weight_sum = floor + remainder / |weight_sum|
+        sign = -1 if weight_sum < 0 else 1
+        divisor = abs(weight_sum)
+        shares = []
+        remainders = []
+        for w in weights:
+            q, r = divmod(sign * w * total_satang, divisor)
+            shares.append(q)
+            remainders.append(r)
+
+        # Floors sum to at most the total; round up the largest remainders
+        leftover = total_satang - sum(shares)
+        if leftover:
+            for idx in sorted(range(len(weights)), key=remainders.__getitem__, reverse=True)[:leftover]:
+                shares[idx] += 1
+        return shares
+
     # =========================================================================
     # 4. SUBMIT SERVICE - Submit Document to Revenue Department
     # =========================================================================
+    @timed("submit_document", outcome=lambda r: "ok" if r["http_status"] < 400 else "error")
+    @traced("submit_document")
     def submit_document(self, etda_json: dict, doc_type: str) -> dict:
         """
         Submit document to AXONS E-TAX TSP API.
@@ -569,23 +670,23 @@ class AxonsETaxService:
         }
         
         logger.info(f"Submitting {doc_type} to {url}")
-        
-        # Archive the submitted JSON for review
+
+        # Serialize once; the PDF is spliced into the POST body and handed
+        # to the background archive writer without re-encoding
+        head_bytes, base64_pdf = self._serialize_payload(etda_json)
+        body = self._splice_field(head_bytes, "Document", base64_pdf)
+
+        # Archive the submitted JSON for review (written off the submit path)
         try:
             doc_id = etda_json.get("ExchangedDocument", {}).get("ID", f"unknown_{int(datetime.now().timestamp())}")
-            archive_path = os.path.join(self.config.SUBMITTED_JSON_DIR, f"{doc_id}_submitted.json")
-            if not os.path.exists(self.config.SUBMITTED_JSON_DIR):
-                os.makedirs(self.config.SUBMITTED_JSON_DIR)
-            with open(archive_path, 'w', encoding='utf-8') as af:
-                json.dump(etda_json, af, ensure_ascii=False, indent=2)
-            logger.info(f"Archived submission payload to {archive_path}")
+            self.archive.enqueue(doc_id, head_bytes, base64_pdf)
         except Exception as ae:
             logger.warning(f"Failed to archive submission payload: {ae}")
 
         try:
             response = requests.post(
                 url,
-                json=etda_json,
+                data=body,
                 headers=headers,
                 timeout=60
             )
@@ -593,9 +694,13 @@ class AxonsETaxService:
             # For 401, we want to see the response body clearly
             if response.status_code == 401:
                 logger.error(f"401 Unauthorized for {doc_type}. Response: {response.text}")
+                self.invalidate_access_token()
                 
+            span = tracing.current_span()
+            span.set_attribute("http.status_code", response.status_code)
+            span.set_attribute("http.request_bytes", len(body))
             result = response.json()
-            logger.info(f"Submit response: status={response.status_code}, body={json.dumps(result, ensure_ascii=False)[:200]}")
+            logger.info(f"Submit response: status={response.status_code}, body={response.text[:200]}")
 
             return {
                 "http_status": response.status_code,
@@ -671,33 +776,61 @@ class AxonsETaxService:
         doc_number = et_invoice_json["ET_INVOICE_HDR"][0].get("DOC_NUMBER", "unknown")
         logger.info(f"=== Processing document: {doc_number} ===")
 
-        try:
-            # Step 1: Generate PDF
-            logger.info(f"[{doc_number}] Step 1: Generating PDF...")
-            base64_pdf = self.generate_pdf(et_invoice_json)
+        # All attempts for one DOC_NUMBER share a trace
+        with tracing.start_trace("document", trace_id=tracing.doc_trace_id(doc_number),
+                                 doc_number=doc_number) as doc_span:
+            try:
+                # Step 1: Generate PDF
+                logger.info(f"[{doc_number}] Step 1: Generating PDF...")
+                base64_pdf = self.generate_pdf(et_invoice_json)
+
+                # Step 2: Transform to ETDA v2.0
+                logger.info(f"[{doc_number}] Step 2: Transforming to ETDA v2.0...")
+                etda_json, endpoint_key = self.transform_to_etda(et_invoice_json, base64_pdf)
+
+                # Step 3: Submit
+                logger.info(f"[{doc_number}] Step 3: Submitting as {endpoint_key}...")
+                submit_result = self.submit_document(etda_json, endpoint_key)
+
+                doc_span.set_attribute("doc_type", endpoint_key)
+                return {
+                    "status": "success",
+                    "doc_number": doc_number,
+                    "doc_type": endpoint_key,
+                    "submission": submit_result,
+                    "status_query": self._status_query(etda_json),
+                    "trace_id": doc_span.trace_id
+                }
 
-            # Step 2: Transform to ETDA v2.0
-            logger.info(f"[{doc_number}] Step 2: Transforming to ETDA v2.0...")
-            etda_json, endpoint_key = self.transform_to_etda(et_invoice_json, base64_pdf)
+            except Exception as e:
+                logger.error(f"[{doc_number}] Pipeline failed: {e}")
+                doc_span.error = str(e)
+                return {
+                    "status": "error",
+                    "doc_number": doc_number,
+                    "error": str(e),
+                    "trace_id": doc_span.trace_id
+                }
 
-            # Step 3: Submit
-            logger.info(f"[{doc_number}] Step 3: Submitting as {endpoint_key}...")
-            submit_result = self.submit_document(etda_json, endpoint_key)
+    @staticmethod
+    def _status_query(etda_json: dict) -> dict:
+        """Build the check_status arguments (API field names) for a submitted document."""
+        exchanged = etda_json.get("ExchangedDocument", {})
+        seller = etda_json["SupplyChainTradeTransaction"]["ApplicableHeaderTradeAgreement"]["SellerTradeParty"]
+        seller_tax_18 = seller["SpecifiedTaxRegistration"]["ID"]["value"]
+        return {
+            "docNumber": exchanged.get("ID", ""),
+            "docDate": exchanged.get("IssueDateTime", ""),
+            "comTaxId": seller_tax_18[:13],
+            "branch": seller_tax_18[13:] or "00000",
+            "internalDocNo": etda_json.get("InternalDocNo") or Config.INTERNAL_DOC_NO,
+            "docType": exchanged.get("TypeCode", "")
+        }
 
-            return {
-                "status": "success",
-                "doc_number": doc_number,
-                "doc_type": endpoint_key,
-                "submission": submit_result
-            }
-
-        except Exception as e:
-            logger.error(f"[{doc_number}] Pipeline failed: {e}")
-            return {
-                "status": "error",
-                "doc_number": doc_number,
-                "error": str(e)
-            }
+    def status_query_for_file(self, filepath: str) -> dict:
+        """check_status arguments (API field names) for the document in a batch file, without a PDF."""
+        etda_json, _ = self.transform_to_etda(self._load_invoice_file(filepath), "")
+        return self._status_query(etda_json)
 
     def process_and_submit_batch(self, json_dir: str = None) -> list:
         """
@@ -709,40 +842,43 @@ class AxonsETaxService:
         Returns:
             List of results for each document.
         """
+        return [self.process_and_submit_file(path) for path in self.list_batch_files(json_dir)]
+
+    def list_batch_files(self, json_dir: str = None) -> list:
+        """Sorted paths of the ET_INVOICE JSON files in a batch directory."""
         if json_dir is None:
             json_dir = self.config.OUTPUT_JSON_DIR
 
         if not os.path.exists(json_dir):
             raise FileNotFoundError(f"JSON directory not found: {json_dir}")
 
-        results = []
         json_files = sorted([f for f in os.listdir(json_dir) if f.endswith('.json')])
         logger.info(f"Found {len(json_files)} JSON files in {json_dir}")
+        return [os.path.join(json_dir, f) for f in json_files]
 
-        for filename in json_files:
-            filepath = os.path.join(json_dir, filename)
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-
-                # JSON files contain an array with one record
-                if isinstance(data, list) and len(data) > 0:
-                    et_invoice = data[0]
-                else:
-                    et_invoice = data
-
-                result = self.process_and_submit(et_invoice)
-                results.append(result)
-
-            except Exception as e:
-                logger.error(f"Failed to process {filename}: {e}")
-                results.append({
-                    "status": "error",
-                    "doc_number": filename,
-                    "error": str(e)
-                })
+    @staticmethod
+    def _load_invoice_file(filepath: str) -> dict:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        # JSON files contain an array with one record
+        if isinstance(data, list) and len(data) > 0:
+            return data[0]
+        return data
+
+    def process_and_submit_file(self, filepath: str) -> dict:
+        """Load one ET_INVOICE JSON file and run the full pipeline on it."""
+        filename = os.path.basename(filepath)
+        try:
+            return self.process_and_submit(self._load_invoice_file(filepath))
 
-        return results
+        except Exception as e:
+            logger.error(f"Failed to process {filename}: {e}")
+            return {
+                "status": "error",
+                "doc_number": filename,
+                "error": str(e)
+            }
 
     # =========================================================================
     # HELPER METHODS
@@ -784,6 +920,7 @@ class AxonsETaxService:
         return date_str
 
     @staticmethod
+    @lru_cache(maxsize=Config.PARTY_CACHE_SIZE)
     def _extract_branch_code(operation_code: str) -> str:
         """
         Extract 5-digit branch code from OPERATION_CODE.
@@ -795,58 +932,119 @@ class AxonsETaxService:
         op_str = str(operation_code).strip()
 
         # Try to find 5 consecutive digits
-        import re
-        match = re.search(r'(\d{5})', op_str)
+        match = _FIVE_DIGITS_RE.search(op_str)
         if match:
             return match.group(1)
 
         # Try to find any digits and pad
-        digits = re.findall(r'\d+', op_str)
+        digits = _DIGITS_RE.findall(op_str)
         if digits:
             return digits[-1].zfill(5)
 
         return "00000"
 
     @staticmethod
+    @lru_cache(maxsize=Config.PARTY_CACHE_SIZE)
     def _parse_address(address_str: str) -> dict:
         """
         Heuristic parsing of Thai address strings.
         Extracts Postcode, City (Province), District, etc.
+        Results are memoized per address and returned as a read-only mapping
+        (all values are strings / tuples), so no caller can alter the cache.
         """
+        # Administrative codes: (CountrySubDivisionID, CityName, CitySubDivisionName)
+        area_codes = get_gazetteer().area_codes(address_str)
+
         if not address_str:
-            return {
+            return MappingProxyType({
                 "postcode": "", "city": "กรุงเทพมหานคร", "district": "",
-                "subdistrict": "", "building_number": "", "line_one": ""
-            }
+                "subdistrict": "", "building_number": "", "line_one": "",
+                "area_codes": area_codes
+            })
 
         # Postcode: 5 digits
-        postcode_match = re.search(r'(\d{5})', address_str)
+        postcode_match = _FIVE_DIGITS_RE.search(address_str)
         postcode = postcode_match.group(1) if postcode_match else ""
 
         # City (Province): Look for จ. or จังหวัด
-        city_match = re.search(r'(?:จ\.|จังหวัด)\s*([^\s]+)', address_str)
+        city_match = _PROVINCE_RE.search(address_str)
         city = city_match.group(1) if city_match else "กรุงเทพมหานคร"
 
         # District: Look for อ. or อำเภอ or เขต
-        district_match = re.search(r'(?:อ\.|อำเภอ|เขต)\s*([^\s]+)', address_str)
+        district_match = _DISTRICT_RE.search(address_str)
         district = district_match.group(1) if district_match else ""
 
         # Sub-district: Look for ต. or ตำบล or แขวง
-        subdistrict_match = re.search(r'(?:ต\.|ตำบล|แขวง)\s*([^\s]+)', address_str)
+        subdistrict_match = _SUBDISTRICT_RE.search(address_str)
         subdistrict = subdistrict_match.group(1) if subdistrict_match else ""
 
         # Building Number: Usually at the start
         # E.g., "61/2 ม.2" -> "61/2"
-        building_match = re.match(r'^([\d/]+)', address_str.strip())
+        building_match = _BUILDING_NO_RE.match(address_str.strip())
         building_number = building_match.group(1) if building_match else "1"
 
-        return {
+        return MappingProxyType({
             "postcode": postcode,
             "city": city,
             "district": district,
             "subdistrict": subdistrict,
             "building_number": building_number,
-            "line_one": address_str
+            "line_one": address_str,
+            "area_codes": area_codes
+        })
+
+    @staticmethod
+    def _serialize_payload(etda_json: dict) -> tuple:
+        """
+        Serialize an ETDA document without its "Document" field.
+        Returns (head_bytes, base64_pdf): head is a compact JSON object and the
+        PDF is left as-is so callers can splice it in without re-encoding it.
+        """
+        head = {k: v for k, v in etda_json.items() if k != "Document"}
+        # allow_nan=False like requests' json=: a NaN amount fails loudly instead of sending invalid JSON
+        head_bytes = json.dumps(head, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+        return head_bytes, etda_json.get("Document")
+
+    @staticmethod
+    def _splice_field(head_bytes: bytes, key: str, value) -> bytes:
+        """
+        Append a string field to a serialized JSON object.
+        Base64 needs no JSON escaping, so it is written through verbatim;
+        anything else falls back to json.dumps. A multi-MB PDF is not
+        regex-matched in full: isascii() is O(1) and the scans for quotes,
+        backslashes and line breaks (MIME-wrapped base64) run at memchr speed.
+        """
+        if (isinstance(value, str) and value.isascii()
+                and _BASE64_RE.fullmatch(value, 0, _BASE64_PREFIX_CHARS)
+                and not any(c in value for c in _JSON_ESCAPED)):
+            encoded = b'"' + value.encode("ascii") + b'"'
+        else:
+            encoded = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        sep = b"" if head_bytes == b"{}" else b","
+        return b"".join((head_bytes[:-1], sep, b'"', key.encode("utf-8"), b'":', encoded, b"}"))
+
+    def _build_submit_body(self, etda_json: dict) -> bytes:
+        """Build the HTTP body for submit_document with the PDF spliced in once."""
+        head_bytes, base64_pdf = self._serialize_payload(etda_json)
+        return self._splice_field(head_bytes, "Document", base64_pdf)
+
+    @staticmethod
+    def _to_float(value) -> float:
+        """Parse a numeric header/detail value, treating blanks and junk as 0."""
+        try:
+            if value is None or str(value).strip() in ("", "nan"):
+                return 0.0
+            return float(value)
+        except (ValueError, TypeError):
+            return 0.0
+
+    @staticmethod
+    def _thb_amount(value: str) -> dict:
+        """THB amount element used throughout the settlement blocks."""
+        return {
+            "currencyID": "THB",
+            "currencyCodeListVersionID": None,
+            "value": value
         }
 
     @staticmethod
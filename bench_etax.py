@@ -0,0 +1,242 @@
+"""
+bench_etax.py - Performance benchmarks for the e-Tax hot paths.
+Measures load_csv, process_etax, save_to_individual_json, transform_to_etda
+and end-to-end batch submission (against mock_upstream.py) over synthetic
+datasets from synth_data.py. Reports throughput, latency percentiles and
+peak memory, and compares against a stored baseline.
+
+Usage:
+    python bench_etax.py --sizes 1000,10000
+    python bench_etax.py --sizes 1000,10000,100000,1000000 --save-baseline
+    python bench_etax.py --compare            # exit 1 on regressions
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# Metrics where a larger value is better; everything else is "lower is better"
+HIGHER_IS_BETTER = ("throughput",)
+
+
+# =============================================================================
+# MEASUREMENT
+# =============================================================================
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "p50_ms": round(pct(50), 3),
+        "p95_ms": round(pct(95), 3),
+        "p99_ms": round(pct(99), 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3)
+    }
+
+
+def measure(fn, items: int, track_memory: bool = True) -> tuple:
+    """Run fn() once; returns (result, metrics)."""
+    if track_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = 0
+    if track_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, {
+        "seconds": round(elapsed, 4),
+        "items": items,
+        "throughput": round(items / elapsed, 2) if elapsed > 0 else None,
+        "peak_mb": round(peak / 1024 / 1024, 2) if track_memory else None
+    }
+
+
+def measure_each(fn, inputs: list, track_memory: bool = True) -> dict:
+    """Run fn(x) for every input; returns throughput, latency percentiles and peak memory."""
+    latencies = []
+
+    def run():
+        for x in inputs:
+            t = time.perf_counter()
+            fn(x)
+            latencies.append(time.perf_counter() - t)
+
+    _, metrics = measure(run, len(inputs), track_memory)
+    metrics.update(percentiles(latencies))
+    return metrics
+
+
+# =============================================================================
+# BENCHMARKS
+# =============================================================================
+def bench_size(rows: int, args) -> dict:
+    from processor import load_csv, process_etax, save_to_individual_json
+    from API_AXONS import AxonsETaxService
+    from config import Config
+    from synth_data import generate
+    from token_store import TokenStore
+
+    import tracing
+
+    work_dir = tempfile.mkdtemp(prefix=f"etax_bench_{rows}_")
+    previous_exporter = tracing.set_exporter(tracing.FileExporter(os.path.join(work_dir, "traces.jsonl")))
+    # Snapshots of the synthetic master data stay out of the server's snapshot directory
+    previous_snapshot_dir, Config.MASTER_SNAPSHOT_DIR = Config.MASTER_SNAPSHOT_DIR, os.path.join(work_dir, "snapshots")
+    try:
+        dataset = generate(work_dir, rows=rows, lines_per_invoice=args.lines_per_invoice,
+                           miss_rate=args.miss_rate, sci_notation=args.sci_notation,
+                           encoding=args.encoding, seed=args.seed)
+        transaction_path, master_dir = dataset["transactions"][0], dataset["master_dir"]
+        results = {}
+
+        _, results["load_csv"] = measure(lambda: load_csv(transaction_path), rows, args.memory)
+        df, results["process_etax"] = measure(lambda: process_etax(transaction_path, master_dir), rows, args.memory)
+
+        json_dir = os.path.join(work_dir, "output_json")
+        saved, results["save_to_individual_json"] = measure(
+            lambda: save_to_individual_json(df, json_dir), rows, args.memory
+        )
+
+        # Own token cache: the mock's tokens must never reach the shared one
+        service = AxonsETaxService(token_store=TokenStore(os.path.join(work_dir, "tokens.sqlite3")))
+        docs = []
+        for name in saved[:args.max_docs]:
+            with open(os.path.join(json_dir, name), "r", encoding="utf-8") as f:
+                docs.append(json.load(f)[0])
+        results["transform_to_etda"] = measure_each(
+            lambda doc: service.transform_to_etda(doc, "JVBERi0xLjQK"), docs, args.memory
+        )
+
+        if args.submit_docs > 0:
+            results["batch_submit"] = bench_submit(service, json_dir, saved[:args.submit_docs], work_dir, args)
+        return results
+    finally:
+        tracing.set_exporter(previous_exporter)
+        Config.MASTER_SNAPSHOT_DIR = previous_snapshot_dir
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def bench_submit(service, json_dir: str, names: list, work_dir: str, args) -> dict:
+    """End-to-end process_and_submit against the local mock upstream."""
+    import mock_upstream
+    from submission_archive import SubmissionArchive
+
+    server = mock_upstream.run_in_thread(port=args.mock_port)
+    try:
+        # The service gets its own settings and archive; the process-wide
+        # Config and default archive keep pointing at the real upstream
+        base = f"http://127.0.0.1:{args.mock_port}"
+        service.config = type("MockUpstreamConfig", (service.config,), {
+            "GENPDF_URL": f"{base}/api/v1/pdf/generate",
+            "TSP_BASE_URL": base,
+            "TSP_TOKEN_URL": f"{base}/oauth2/token",
+        })
+        service.archive = SubmissionArchive(os.path.join(work_dir, "submitted_json"))
+        mock_upstream.settings.latency = args.mock_latency
+
+        metrics = measure_each(
+            lambda name: service.process_and_submit_file(os.path.join(json_dir, name)), names, args.memory
+        )
+        service.archive.flush()
+        return metrics
+    finally:
+        server.should_exit = True
+
+
+# =============================================================================
+# BASELINE
+# =============================================================================
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """List of human-readable regressions beyond threshold (fraction)."""
+    regressions = []
+    for size, stages in current.items():
+        for stage, metrics in stages.items():
+            base = baseline.get(size, {}).get(stage, {})
+            for key in ("throughput", "p95_ms", "peak_mb"):
+                new, old = metrics.get(key), base.get(key)
+                if not new or not old:
+                    continue
+                change = (new - old) / old
+                worse = -change if key in HIGHER_IS_BETTER else change
+                if worse > threshold:
+                    regressions.append(f"{size} rows {stage}.{key}: {old} -> {new} ({worse:+.0%} worse)")
+    return regressions
+
+
+def print_table(results: dict):
+    print(f"{'rows':>9} {'stage':<26} {'seconds':>9} {'items/s':>11} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak MB':>9}")
+    for size, stages in results.items():
+        for stage, m in stages.items():
+            print(f"{size:>9} {stage:<26} {m['seconds']:>9} {str(m['throughput']):>11} "
+                  f"{str(m.get('p50_ms', '')):>9} {str(m.get('p95_ms', '')):>9} {str(m.get('p99_ms', '')):>9} "
+                  f"{str(m['peak_mb']):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="E-Tax pipeline benchmarks")
+    parser.add_argument("--sizes", default="1000,10000", help="Comma-separated row counts (1000 to 1000000)")
+    parser.add_argument("--lines-per-invoice", type=int, default=5)
+    parser.add_argument("--miss-rate", type=float, default=0.02, help="Synthetic customer master miss rate")
+    parser.add_argument("--sci-notation", type=float, default=0.1, help="Share of rows with E+ notation IDs")
+    parser.add_argument("--encoding", default="utf-8", choices=["utf-8", "tis-620"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-docs", type=int, default=5000, help="Documents used for transform_to_etda")
+    parser.add_argument("--submit-docs", type=int, default=200, help="Documents submitted end-to-end (0 to skip)")
+    parser.add_argument("--mock-port", type=int, default=9765)
+    parser.add_argument("--mock-latency", default="fixed:0", help="Mock upstream latency spec")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="Skip tracemalloc (faster)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="Fail when results regress past --threshold")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--output", help="Also write results as JSON to this path")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    results = {}
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        print(f"Benchmarking {size} rows...", file=sys.stderr)
+        results[str(size)] = bench_size(size, args)
+
+    print_table(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
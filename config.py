@@ -8,6 +8,10 @@ from dotenv import load_dotenv
 # Load .env file from project root
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 
+# Point every upstream URL at a local mock_upstream.py instance when set,
+# e.g. MOCK_UPSTREAM_URL=http://127.0.0.1:9000 (explicit URL variables still win)
+_MOCK_UPSTREAM_URL = os.getenv("MOCK_UPSTREAM_URL", "").rstrip("/")
+
 
 class Config:
     """Centralized configuration for E-Tax API integration."""
@@ -15,7 +19,8 @@ class Config:
     # --- Gen PDF API ---
     GENPDF_URL = os.getenv(
         "GENPDF_URL",
-        "https://etaxapi-uat.axonstech.com/api/v1/pdf/generate"
+        f"{_MOCK_UPSTREAM_URL}/api/v1/pdf/generate" if _MOCK_UPSTREAM_URL
+        else "https://etaxapi-uat.axonstech.com/api/v1/pdf/generate"
     )
     GENPDF_API_KEY = os.getenv(
         "GENPDF_API_KEY",
@@ -25,11 +30,12 @@ class Config:
     # --- AXONS E-TAX TSP Submit API ---
     TSP_BASE_URL = os.getenv(
         "TSP_BASE_URL",
-        "https://apigwc-clnp.cpf.co.th/etaxtsp-api-sh-uat"
+        _MOCK_UPSTREAM_URL or "https://apigwc-clnp.cpf.co.th/etaxtsp-api-sh-uat"
     )
     TSP_TOKEN_URL = os.getenv(
         "TSP_TOKEN_URL",
-        "https://apigwc-clnp.cpf.co.th/etaxtsp-api-sh-uat/oauth2/token"
+        f"{_MOCK_UPSTREAM_URL}/oauth2/token" if _MOCK_UPSTREAM_URL
+        else "https://apigwc-clnp.cpf.co.th/etaxtsp-api-sh-uat/oauth2/token"
     )
     TSP_CLIENT_ID = os.getenv(
         "TSP_CLIENT_ID",
@@ -39,11 +45,15 @@ class Config:
         "TSP_CLIENT_SECRET",
         "N8DIHvpNthapVtbyGyu07JPPE3OFxrWv"
     )
+    # Debugging only: use this access token instead of requesting one
+    ETAX_MANUAL_TOKEN = os.getenv("ETAX_MANUAL_TOKEN", "")
 
     # --- Seller (Company) Info ---
     SELLER_TAX_ID = os.getenv("SELLER_TAX_ID", "0105545070345")
     SELLER_NAME = os.getenv("SELLER_NAME", "บริษัท ซีพีเอฟ โกลบอล ฟู้ด โซลูชั่น จำกัด (มหาชน)")
     SELLER_BRANCH = os.getenv("SELLER_BRANCH", "00000")
+    # InternalDocNo sent with submissions and status queries
+    INTERNAL_DOC_NO = os.getenv("INTERNAL_DOC_NO", "1230572800")
 
     # --- Submit API Endpoints ---
     SUBMIT_ENDPOINT = "/api/v1/document/submit"
@@ -58,9 +68,95 @@ class Config:
         "3": ("80", "ใบเพิ่มหนี้", "debitnote"),
     }
 
+    # --- Deployment ---
+    # Web server processes (python main.py -> uvicorn --workers). Tokens, master
+    # snapshots, result sessions and jobs are shared between them on disk.
+    WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+    # Submission-only service (python submit_main.py): /api/submit, status and
+    # batch submission without the upload processing stack
+    SUBMIT_SERVICE_PORT = int(os.getenv("SUBMIT_SERVICE_PORT", "8001"))
+
+    # --- Transform Caches ---
+    # Max distinct addresses / branch codes memoized per process
+    PARTY_CACHE_SIZE = int(os.getenv("PARTY_CACHE_SIZE", "4096"))
+
     # --- Paths ---
     BASE_DIR = os.path.dirname(__file__)
     OUTPUT_JSON_DIR = os.path.join(BASE_DIR, "etax_data", "output_json")
     SUBMITTED_JSON_DIR = os.path.join(BASE_DIR, "etax_data", "submitted_json")
     UPLOAD_DIR = os.path.join(BASE_DIR, "etax_data", "uploads")
     MASTER_DIR = os.path.join(BASE_DIR, "Master")
+    # Parsed master data, one pickle per master version, loaded by every worker
+    # process instead of re-parsing the CSVs ("" = per-process parsing only)
+    MASTER_SNAPSHOT_DIR = os.getenv("MASTER_SNAPSHOT_DIR", os.path.join(BASE_DIR, "etax_data", "master_snapshots"))
+    # OAuth2 access token shared by all web workers
+    TOKEN_DB_PATH = os.getenv("TOKEN_DB_PATH", os.path.join(BASE_DIR, "etax_data", "tokens.sqlite3"))
+    GAZETTEER_PATH = os.getenv(
+        "GAZETTEER_PATH",
+        os.path.join(BASE_DIR, "data", "thai_admin_areas.csv")
+    )
+
+    # --- Submission Archive ---
+    # gzip | zstd (needs the zstandard package) | none
+    ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "gzip")
+    # Records older than this are removed by compaction (0 = keep forever)
+    ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "90"))
+    ARCHIVE_COMPACT_INTERVAL_HOURS = float(os.getenv("ARCHIVE_COMPACT_INTERVAL_HOURS", "24"))
+    ARCHIVE_QUEUE_SIZE = int(os.getenv("ARCHIVE_QUEUE_SIZE", "256"))
+
+    # --- Bulk Status Polling ---
+    STATUS_DB_PATH = os.getenv(
+        "STATUS_DB_PATH",
+        os.path.join(BASE_DIR, "etax_data", "status_poll.sqlite3")
+    )
+    STATUS_POLL_WORKERS = int(os.getenv("STATUS_POLL_WORKERS", "8"))
+    STATUS_POLL_RATE = float(os.getenv("STATUS_POLL_RATE", "10"))  # requests per second, per web worker
+    # Seconds to wait before each poll: frequent at first, then sparse
+    STATUS_POLL_SCHEDULE = [
+        int(s) for s in os.getenv("STATUS_POLL_SCHEDULE", "30,60,120,300,900,1800,3600").split(",")
+    ]
+    STATUS_POLL_MAX_ATTEMPTS = int(os.getenv("STATUS_POLL_MAX_ATTEMPTS", "48"))
+    STATUS_DONE_VALUES = {
+        s.strip().upper() for s in os.getenv("STATUS_DONE_VALUES", "SUCCESS,COMPLETED,ACCEPTED,APPROVED").split(",")
+    }
+    STATUS_FAILED_VALUES = {
+        s.strip().upper() for s in os.getenv("STATUS_FAILED_VALUES", "REJECTED,FAILED,ERROR,CANCELLED").split(",")
+    }
+
+    # --- Background Jobs ---
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+    JOB_HISTORY = int(os.getenv("JOB_HISTORY", "50"))  # finished jobs kept for lookup
+    # Persistent queue; a job whose worker stops renewing its lease is requeued
+    JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(BASE_DIR, "etax_data", "jobs.sqlite3"))
+    JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+    # --- Upload Processing ---
+    # Worker processes for process_etax; uploads beyond workers + queue get 503
+    # (per web worker: the cores are split between WEB_WORKERS by default)
+    UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", str(max(1, min(4, (os.cpu_count() or 1) // WEB_WORKERS)))))
+    UPLOAD_QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", "8"))
+    UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_MB", "200")) * 1024 * 1024  # 0 = unlimited
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+
+    # --- Result Sessions ---
+    # Processed uploads kept server-side for exports (sliding TTL, LRU by memory)
+    RESULT_TTL_SECONDS = int(os.getenv("RESULT_TTL_MINUTES", "60")) * 60
+    RESULT_STORE_MAX_BYTES = int(os.getenv("RESULT_STORE_MB", "512")) * 1024 * 1024
+    # Results are also written here so every web worker (and a restarted
+    # server) can serve them; the memory store is a per-process cache ("" = off)
+    RESULT_SHARED_DIR = os.getenv("RESULT_SHARED_DIR", os.path.join(BASE_DIR, "etax_data", "results"))
+
+    # --- Exports ---
+    # CSV rows encoded per streamed chunk; XLSX workbooks are written to a
+    # per-request temp file under EXPORT_TMP_DIR and removed after sending
+    EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+    EXPORT_TMP_DIR = os.getenv("EXPORT_TMP_DIR", os.path.join(BASE_DIR, "etax_data", "exports"))
+
+    # --- Tracing ---
+    # Off unless enabled; the span file rotates at TRACE_MAX_MB, keeping
+    # TRACE_BACKUPS older files (traces.jsonl.1 is the newest of them)
+    TRACE_ENABLED = os.getenv("TRACE_ENABLED", "0").lower() in ("1", "true", "yes")
+    TRACE_PATH = os.getenv("TRACE_PATH", os.path.join(BASE_DIR, "etax_data", "traces.jsonl"))
+    TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_MB", "50")) * 1024 * 1024
+    TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", "5"))
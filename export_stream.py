@@ -0,0 +1,90 @@
+"""
+export_stream.py - Streaming CSV / XLSX exports of processed results.
+CSV is encoded chunk by chunk straight into the response. XLSX (a zip that
+cannot be produced incrementally over the wire) is written by openpyxl's
+write-only workbook to a private temp file per request, so concurrent
+exports never share a path and memory stays flat regardless of row count.
+"""
+import logging
+import os
+import tempfile
+
+import pandas as pd
+
+from config import Config
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Excel's hard limit per worksheet, header row included
+EXCEL_MAX_ROWS = 1048576
+
+
+def iter_csv(df, chunk_rows: int = None):
+    """
+    Yield a DataFrame as UTF-8 CSV bytes (with BOM, like utf-8-sig) in
+    chunks of chunk_rows rows (default Config.EXPORT_CHUNK_ROWS).
+    """
+    chunk_rows = chunk_rows or Config.EXPORT_CHUNK_ROWS
+    yield "\ufeff".encode("utf-8") + df.iloc[0:0].to_csv(index=False).encode("utf-8")
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=False).encode("utf-8")
+
+
+def _cell(value):
+    # openpyxl rejects NaN / NaT; blank cells match the old to_excel output
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return value
+
+
+@timed("export_xlsx", items=lambda result: result[1])
+def write_xlsx(df, path: str = None, max_rows: int = EXCEL_MAX_ROWS) -> tuple:
+    """
+    Write a DataFrame to an XLSX file with a write-only workbook.
+
+    Args:
+        path: Destination; a new temp file under Config.EXPORT_TMP_DIR when omitted.
+        max_rows: Rows per sheet including the header; further rows continue
+            on Sheet2, Sheet3, ... each with its own header.
+
+    Returns:
+        (path, rows written)
+    """
+    from openpyxl import Workbook
+
+    if path is None:
+        os.makedirs(Config.EXPORT_TMP_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix="etax_export_", suffix=".xlsx", dir=Config.EXPORT_TMP_DIR)
+        os.close(fd)
+
+    header = [str(c) for c in df.columns]
+    per_sheet = max_rows - 1
+    wb = Workbook(write_only=True)
+    sheet = None
+    count = 0
+    for row in df.itertuples(index=False, name=None):
+        if count % per_sheet == 0:
+            sheet = wb.create_sheet(f"Sheet{count // per_sheet + 1}")
+            sheet.append(header)
+        sheet.append([_cell(v) for v in row])
+        count += 1
+    if sheet is None:
+        wb.create_sheet("Sheet1").append(header)
+
+    try:
+        wb.save(path)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    logger.info(f"Excel export written to {path} ({count} rows, {len(wb.worksheets)} sheet(s))")
+    return path, count
+
+
+def remove_file(path: str):
+    """Background task: delete a per-request export file once it was sent."""
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning(f"Could not remove export file {path}: {e}")
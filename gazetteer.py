@@ -0,0 +1,284 @@
+"""
+gazetteer.py - Thai administrative-area lookup for ETDA address codes.
+Resolves a free-form Thai address to province / district / subdistrict codes
+(CountrySubDivisionID / CityName / CitySubDivisionName) in one pass over the
+string using a character trie built from the bundled gazetteer file.
+
+Gazetteer CSV columns (one row per subdistrict):
+    province_code, province_name, district_code, district_name,
+    subdistrict_code, subdistrict_name, postcode
+The bundled file lists all 7,436 DOPA subdistricts. Codes follow the
+geothai code list (MIT), names and postcodes come from the thaiaddress
+dataset (Apache-2.0); another export in the same layout can be dropped in
+via GAZETTEER_PATH.
+
+A name only counts when it follows its marker (จ./อ./ต./เขต/แขวง ...) or
+when the address's postcode covers that area, so words such as "เลย" in
+"หมู่บ้านเลยดี" are not taken for a province.
+"""
+import csv
+import logging
+import os
+import re
+import threading
+from functools import lru_cache
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+PROVINCE = "province"
+DISTRICT = "district"
+SUBDISTRICT = "subdistrict"
+
+# Marker words that precede a name of the given level
+_MARKERS = {
+    "จ.": PROVINCE, "จังหวัด": PROVINCE,
+    "อ.": DISTRICT, "อำเภอ": DISTRICT, "เขต": DISTRICT,
+    "ต.": SUBDISTRICT, "ตำบล": SUBDISTRICT, "แขวง": SUBDISTRICT,
+}
+
+# Common abbreviations not present in the official names
+_PROVINCE_ALIASES = {
+    "กรุงเทพ": "10", "กรุงเทพฯ": "10", "กทม": "10", "กทม.": "10",
+    "อยุธยา": "14",
+}
+
+_MARKER = "marker"
+_LEVEL_INDEX = {PROVINCE: 0, DISTRICT: 1, SUBDISTRICT: 2}
+_MUEANG_RE = re.compile(r"(?:อ\.|อำเภอ)\s*เมือง")
+
+
+class ThaiGazetteer:
+    """In-memory gazetteer with a trie matcher and per-address cache."""
+
+    def __init__(self, path: str = None, cache_size: int = None):
+        self.path = path or Config.GAZETTEER_PATH
+        self.province_names = {}        # code -> name
+        self.postcodes = {}             # "10400" -> [(province, district, subdistrict), ...]
+        self._trie = {}
+        self._known = set()             # (level, code) pairs
+        self._first_child = {}          # province / district code -> lowest code below it
+        self._load()
+        self.resolve = lru_cache(maxsize=cache_size or Config.PARTY_CACHE_SIZE)(self._resolve)
+
+    # =========================================================================
+    # LOADING
+    # =========================================================================
+    def _load(self):
+        if not os.path.exists(self.path):
+            logger.warning(f"Gazetteer file not found: {self.path}")
+            return
+
+        seen = self._known
+        with open(self.path, "r", encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f):
+                p_code = (row.get("province_code") or "").strip()
+                d_code = (row.get("district_code") or "").strip()
+                s_code = (row.get("subdistrict_code") or "").strip()
+                postcode = (row.get("postcode") or "").strip()
+                if not p_code:
+                    continue
+
+                for level, code, name in (
+                    (PROVINCE, p_code, row.get("province_name")),
+                    (DISTRICT, d_code, row.get("district_name")),
+                    (SUBDISTRICT, s_code, row.get("subdistrict_name")),
+                ):
+                    name = (name or "").strip()
+                    if code and name and (level, code) not in seen:
+                        seen.add((level, code))
+                        self._insert(name, (level, code))
+                        if level == PROVINCE:
+                            self.province_names[code] = name
+
+                for parent, child in ((p_code, d_code), (d_code, s_code)):
+                    if parent and child and child < self._first_child.get(parent, "~"):
+                        self._first_child[parent] = child
+
+                if len(postcode) == 5:
+                    self.postcodes.setdefault(postcode, []).append((p_code, d_code or None, s_code or None))
+
+        for alias, code in _PROVINCE_ALIASES.items():
+            self._insert(alias, (PROVINCE, code))
+        for marker, level in _MARKERS.items():
+            self._insert(marker, (_MARKER, level))
+
+        logger.info(f"Loaded gazetteer with {len(self.province_names)} provinces from {self.path}")
+
+    def _insert(self, word: str, value: tuple):
+        node = self._trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node.setdefault(None, []).append(value)
+
+    # =========================================================================
+    # MATCHING
+    # =========================================================================
+    def _scan(self, text: str) -> tuple:
+        """
+        Single left-to-right pass collecting gazetteer hits.
+        At each position the longest trie match is taken and the scan resumes
+        after it. Returns (hits, postcode) where hits are (level, code, marked).
+        """
+        hits = []
+        postcode = ""
+        pending_marker = None
+        i, n = 0, len(text)
+        while i < n:
+            ch = text[i]
+            if ch.isspace():
+                i += 1
+                continue
+            if ch.isdigit():
+                j = i
+                while j < n and text[j].isdigit():
+                    j += 1
+                if j - i == 5:
+                    postcode = text[i:j]
+                pending_marker = None
+                i = j
+                continue
+
+            node = self._trie
+            best_end, best_values = -1, None
+            j = i
+            while j < n and text[j] in node:
+                node = node[text[j]]
+                j += 1
+                if None in node:
+                    best_end, best_values = j, node[None]
+
+            if best_values is None:
+                pending_marker = None
+                i += 1
+                continue
+
+            if best_values[0][0] == _MARKER:
+                pending_marker = best_values[0][1]
+            else:
+                for level, code in best_values:
+                    hits.append((level, code, pending_marker == level))
+                pending_marker = None
+            i = best_end
+        return hits, postcode
+
+    def _resolve(self, address: str) -> dict:
+        """
+        Resolve an address string to administrative codes.
+
+        Returns:
+            Dict with province_code, district_code, subdistrict_code and
+            postcode; unresolved levels are None.
+        """
+        result = {"province_code": None, "district_code": None,
+                  "subdistrict_code": None, "postcode": ""}
+        if not address:
+            return result
+
+        hits, postcode = self._scan(str(address))
+        result["postcode"] = postcode
+        areas = self.postcodes.get(postcode, ())
+
+        # Unmarked names must be backed by the postcode
+        hits = [(level, code, marked) for level, code, marked in hits
+                if marked or any(area[_LEVEL_INDEX[level]] == code for area in areas)]
+
+        def pick(level, parent=None):
+            # Prefer names introduced by a marker; addresses end with the
+            # broadest level, so the last candidate wins among equals.
+            candidates = [(marked, code) for lvl, code, marked in hits
+                          if lvl == level and (parent is None or code.startswith(parent))]
+            if not candidates:
+                return None
+            marked = [code for m, code in candidates if m]
+            return (marked or [code for _, code in candidates])[-1]
+
+        def shared_province(level):
+            # Province implied by lower-level names when they all agree
+            codes = {code[:2] for lvl, code, _ in hits if lvl == level}
+            return codes.pop() if len(codes) == 1 else None
+
+        province = (pick(PROVINCE)
+                    or self._postcode_only(areas, PROVINCE, "")
+                    or shared_province(DISTRICT)
+                    or shared_province(SUBDISTRICT))
+        if province is None:
+            return result
+
+        district = pick(DISTRICT, province)
+        if district is None:
+            # "ต.<name> จ.<province>" without the district, if the name is unique there
+            districts = {code[:4] for lvl, code, _ in hits
+                         if lvl == SUBDISTRICT and code.startswith(province)}
+            district = districts.pop() if len(districts) == 1 else None
+        if district is None and _MUEANG_RE.search(address):
+            # "อ.เมือง" without the province name appended
+            mueang = f"{province}01"
+            if (DISTRICT, mueang) in self._known and province != "10":
+                district = mueang
+        if district is None:
+            district = self._postcode_only(areas, DISTRICT, province)
+
+        subdistrict = None
+        if district:
+            subdistrict = pick(SUBDISTRICT, district) or self._postcode_only(areas, SUBDISTRICT, district)
+
+        result["province_code"] = province
+        result["district_code"] = district
+        result["subdistrict_code"] = subdistrict
+        return result
+
+    @staticmethod
+    def _postcode_only(areas, level: str, parent: str):
+        """Code at level when the postcode covers exactly one area under parent."""
+        codes = {area[_LEVEL_INDEX[level]] for area in areas
+                 if area[_LEVEL_INDEX[level]] and area[_LEVEL_INDEX[level]].startswith(parent)}
+        return codes.pop() if len(codes) == 1 else None
+
+    def _fallback(self, areas, level: str, parent: str):
+        """
+        Deterministic stand-in for an unresolved level: the lowest code under
+        parent covered by the postcode, else the lowest code under parent.
+        """
+        index = _LEVEL_INDEX[level]
+        codes = [area[index] for area in areas if area[index] and area[index].startswith(parent)]
+        if codes:
+            return min(codes)
+        return self._first_child.get(parent) if parent else None
+
+    def area_codes(self, address: str, default=("10", "1026", "102601")) -> tuple:
+        """
+        ETDA area codes for an address as
+        (CountrySubDivisionID, CityName, CitySubDivisionName).
+
+        All three are required for TH addresses, so levels resolve() leaves
+        open are filled with a fallback inside the resolved parent (see
+        _fallback()): e.g. "อ.เมือง จ.ขอนแก่น" gives the district's lowest
+        subdistrict. Without even a province the legacy Bangkok codes
+        (default) are returned. Use resolve() to tell the two apart.
+        """
+        codes = self.resolve(address)
+        areas = self.postcodes.get(codes["postcode"], ())
+        province = codes["province_code"] or self._fallback(areas, PROVINCE, "")
+        district = codes["district_code"] or (self._fallback(areas, DISTRICT, province) if province else None)
+        subdistrict = codes["subdistrict_code"] or (self._fallback(areas, SUBDISTRICT, district) if district else None)
+        if None in (province, district, subdistrict):
+            return default
+        if (codes["province_code"], codes["district_code"], codes["subdistrict_code"]) != (province, district, subdistrict):
+            logger.debug(f"Area codes of '{address}' partly filled in: {codes} -> {province}/{district}/{subdistrict}")
+        return province, district, subdistrict
+
+
+_default_gazetteer = None
+_default_lock = threading.Lock()
+
+
+def get_gazetteer() -> ThaiGazetteer:
+    """Process-wide gazetteer loaded on first use."""
+    global _default_gazetteer
+    if _default_gazetteer is None:
+        with _default_lock:
+            if _default_gazetteer is None:
+                _default_gazetteer = ThaiGazetteer()
+    return _default_gazetteer
@@ -0,0 +1,322 @@
+"""
+job_store.py - SQLite persistence for background jobs.
+Jobs, their per-item results and their worker leases live in one local
+database, so queued and interrupted work survives a server restart: a job
+whose lease runs out (its worker died) is put back in the queue and run
+again by the next free worker.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER,
+    error TEXT,
+    summary TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    resource TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_results (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    item_key TEXT,
+    result TEXT NOT NULL,
+    success INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE TABLE IF NOT EXISTS job_in_flight (
+    job_id TEXT NOT NULL,
+    item_key TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    PRIMARY KEY (job_id, item_key)
+);
+"""
+
+_JSON_FIELDS = ("params", "summary")
+
+# Result counts of a job, so progress can be reported without decoding results
+_COUNTS = """(SELECT COUNT(*) FROM job_results r WHERE r.job_id = jobs.id) AS done,
+             (SELECT COALESCE(SUM(r.success), 0) FROM job_results r WHERE r.job_id = jobs.id) AS success"""
+
+
+class JobStore:
+    """Thread-safe access to the job database (one connection per store)."""
+
+    def __init__(self, path: str = None):
+        self.path = path or Config.JOB_DB_PATH
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            self._migrate()
+
+    def _migrate(self):
+        """Bring databases created before the success / resource columns up to date."""
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(job_results)")}
+        if "success" not in columns:
+            self._conn.execute("ALTER TABLE job_results ADD COLUMN success INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute("UPDATE job_results SET success = (json_extract(result, '$.status') = 'success')")
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "resource" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN resource TEXT")
+        # At most one queued or running job per resource, across all processes
+        self._conn.execute(
+            """CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_resource ON jobs (resource)
+               WHERE resource IS NOT NULL AND status IN ('queued', 'running')"""
+        )
+
+    def _execute(self, sql: str, args: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    @staticmethod
+    def _row(row) -> dict:
+        job = dict(row)
+        for field in _JSON_FIELDS:
+            if job.get(field) is not None:
+                job[field] = json.loads(job[field])
+        return job
+
+    def insert(self, job, resource: str = None):
+        """
+        Add a queued job. With a resource (e.g. the directory a job writes
+        to), the insert fails while another queued or running job holds it.
+
+        Returns:
+            None, or the ID of the active job holding resource (nothing inserted)
+        """
+        try:
+            self._execute(
+                "INSERT INTO jobs (id, kind, params, status, created_at, resource) VALUES (?, ?, ?, ?, ?, ?)",
+                (job.id, job.kind, json.dumps(job.params, ensure_ascii=False), job.status, job.created_at, resource)
+            )
+        except sqlite3.IntegrityError:
+            rows = self._execute(
+                "SELECT id FROM jobs WHERE resource = ? AND status IN ('queued', 'running')", (resource,)
+            )
+            if not rows:
+                raise
+            return rows[0]["id"]
+        return None
+
+    def update(self, job_id: str, **fields):
+        """Set columns of one job (params / summary are JSON-encoded)."""
+        for field in _JSON_FIELDS:
+            if fields.get(field) is not None:
+                fields[field] = json.dumps(fields[field], ensure_ascii=False)
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def save_result(self, job_id: str, seq: int, key: str, result: dict):
+        """Store one item result (clearing the item's in-flight marker)."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_results (job_id, seq, item_key, result, success) VALUES (?, ?, ?, ?, ?)",
+                (job_id, seq, key, json.dumps(result, ensure_ascii=False, default=str), result.get("status") == "success")
+            )
+            if key is not None:
+                self._conn.execute("DELETE FROM job_in_flight WHERE job_id = ? AND item_key = ?", (job_id, key))
+
+    def mark_in_flight(self, job_id: str, key: str):
+        """Record that an item's side effect (e.g. an upstream POST) is about to happen."""
+        self._execute(
+            "INSERT OR REPLACE INTO job_in_flight (job_id, item_key, started_at) VALUES (?, ?, ?)",
+            (job_id, key, time.time())
+        )
+
+    def load(self, job_id: str, results: bool = True) -> dict:
+        """
+        Job row plus "results": [(item key, result)] in recording order and
+        "in_flight": [item keys started but without a result], or None.
+        With results=False only the "done" / "success" counts are read.
+        """
+        if not results:
+            rows = self._execute(f"SELECT *, {_COUNTS} FROM jobs WHERE id = ?", (job_id,))
+            return self._row(rows[0]) if rows else None
+
+        # One read transaction: row and results from the same snapshot, even
+        # while another process is recording results
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                rows = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchall()
+                results = self._conn.execute(
+                    "SELECT item_key, result FROM job_results WHERE job_id = ? ORDER BY seq", (job_id,)
+                ).fetchall()
+                in_flight = self._conn.execute(
+                    "SELECT item_key FROM job_in_flight WHERE job_id = ?", (job_id,)
+                ).fetchall()
+            finally:
+                self._conn.execute("COMMIT")
+        if not rows:
+            return None
+        job = self._row(rows[0])
+        job["results"] = [(r["item_key"], json.loads(r["result"])) for r in results]
+        job["in_flight"] = [r["item_key"] for r in in_flight]
+        return job
+
+    def results_after(self, job_id: str, seq: int, limit: int) -> list:
+        """[(seq, result)] recorded after position seq, in recording order."""
+        rows = self._execute(
+            "SELECT seq, result FROM job_results WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (job_id, seq, limit)
+        )
+        return [(r["seq"], json.loads(r["result"])) for r in rows]
+
+    def page(self, job_id: str, offset: int, limit: int, status: str = None) -> dict:
+        """
+        A page of a job's results in recording order, optionally only those
+        with the given result status (as Job.page()), or None for an unknown job.
+        Only the rows of the page are decoded.
+        """
+        where, args = "job_id = ?", [job_id]
+        if status == "success":
+            where += " AND success = 1"
+        elif status is not None:
+            where += " AND success = 0 AND json_extract(result, '$.status') IS ?"
+            args.append(status)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                if not self._conn.execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchall():
+                    return None
+                total = self._conn.execute(f"SELECT COUNT(*) FROM job_results WHERE {where}", args).fetchone()[0]
+                rows = self._conn.execute(
+                    f"SELECT result FROM job_results WHERE {where} ORDER BY seq LIMIT ? OFFSET ?",
+                    (*args, limit, offset)
+                ).fetchall()
+            finally:
+                self._conn.execute("COMMIT")
+        return {
+            "job_id": job_id,
+            "offset": offset,
+            "limit": limit,
+            "total": total,
+            "results": [json.loads(r["result"]) for r in rows]
+        }
+
+    def recent(self, limit: int) -> list:
+        """Rows (with result counts, without results) of the newest jobs, newest first."""
+        rows = self._execute(f"SELECT *, {_COUNTS} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+        return [self._row(r) for r in rows]
+
+    # -------------------------------------------------------------------------
+    # Leases
+    # -------------------------------------------------------------------------
+    def claim(self, owner: str, lease_seconds: float, kinds: list):
+        """
+        Atomically take the oldest queued job of one of kinds.
+
+        Returns:
+            The job ID, or None when nothing is queued.
+        """
+        if not kinds:
+            return None
+        now = time.time()
+        placeholders = ", ".join("?" for _ in kinds)
+        rows = self._execute(
+            f"""UPDATE jobs
+                SET status = 'running', lease_owner = ?, lease_expires = ?,
+                    attempts = attempts + 1, started_at = COALESCE(started_at, ?)
+                WHERE id = (SELECT id FROM jobs WHERE status = 'queued' AND kind IN ({placeholders})
+                            ORDER BY created_at LIMIT 1)
+                RETURNING id""",
+            (owner, now + lease_seconds, now, *kinds)
+        )
+        return rows[0]["id"] if rows else None
+
+    def renew(self, owner: str, job_ids: list, lease_seconds: float):
+        """Extend the leases owner still holds on job_ids."""
+        if not job_ids:
+            return
+        placeholders = ", ".join("?" for _ in job_ids)
+        self._execute(
+            f"UPDATE jobs SET lease_expires = ? WHERE lease_owner = ? AND status = 'running' AND id IN ({placeholders})",
+            (time.time() + lease_seconds, owner, *job_ids)
+        )
+
+    def finish(self, job_id: str, owner: str, status: str, error: str = None) -> bool:
+        """
+        Record the outcome of a job run. Returns False when owner no longer
+        holds the lease (the job was requeued meanwhile; its new run decides).
+        """
+        rows = self._execute(
+            """UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_owner = NULL, lease_expires = NULL
+               WHERE id = ? AND lease_owner = ? RETURNING id""",
+            (status, error, time.time(), job_id, owner)
+        )
+        return bool(rows)
+
+    def requeue_expired(self, max_attempts: int, dead_owners: set = frozenset()) -> dict:
+        """
+        Put running jobs back in the queue when their lease expired or their
+        owner is known to be gone; jobs out of attempts are failed instead.
+
+        Returns:
+            {"requeued": [job ids], "failed": [job ids]}
+        """
+        now = time.time()
+        rows = self._execute("SELECT id, attempts, lease_owner, lease_expires FROM jobs WHERE status = 'running'")
+        orphaned = [r for r in rows if (r["lease_expires"] or 0) < now or r["lease_owner"] in dead_owners]
+        outcome = {"requeued": [], "failed": []}
+        for row in orphaned:
+            if row["attempts"] >= max_attempts:
+                self._execute(
+                    """UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, lease_owner = NULL,
+                       lease_expires = NULL WHERE id = ? AND lease_owner IS ?""",
+                    (f"Worker lost {row['attempts']} time(s), giving up", now, row["id"], row["lease_owner"])
+                )
+                outcome["failed"].append(row["id"])
+            else:
+                self._execute(
+                    """UPDATE jobs SET status = 'queued', lease_owner = NULL, lease_expires = NULL
+                       WHERE id = ? AND lease_owner IS ?""",
+                    (row["id"], row["lease_owner"])
+                )
+                outcome["requeued"].append(row["id"])
+        if orphaned:
+            logger.warning(f"Orphaned jobs: requeued {outcome['requeued']}, failed {outcome['failed']}")
+        return outcome
+
+    def running_owners(self) -> set:
+        rows = self._execute("SELECT DISTINCT lease_owner FROM jobs WHERE status = 'running'")
+        return {r["lease_owner"] for r in rows if r["lease_owner"]}
+
+    def prune(self, keep: int):
+        """Delete finished jobs (and their results) beyond the newest keep jobs."""
+        rows = self._execute(
+            """SELECT id FROM jobs WHERE status IN ('completed', 'failed')
+               AND id NOT IN (SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?)""",
+            (keep,)
+        )
+        for row in rows:
+            self._execute("DELETE FROM job_results WHERE job_id = ?", (row["id"],))
+            self._execute("DELETE FROM job_in_flight WHERE job_id = ?", (row["id"],))
+            self._execute("DELETE FROM jobs WHERE id = ?", (row["id"],))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
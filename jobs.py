@@ -0,0 +1,450 @@
+"""
+jobs.py - Background job execution for long-running batch work.
+A job runs on a worker pool, reports per-item results as they finish and
+exposes progress (counts, throughput, ETA) and paginated results.
+Jobs are persisted in a JobStore and executed under a renewable lease, so
+work interrupted by a restart is requeued and resumed (at least once). Every
+server process sharing the store runs queued jobs and can report on jobs
+running in the others.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+from config import Config
+from job_store import JobStore
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# Minimum age before a job running in another process is re-read from the store
+REFRESH_SECONDS = 1.0
+
+
+class JobConflict(Exception):
+    """Raised when a queued or running job already holds the resource of a new job."""
+
+    def __init__(self, resource: str, job_id: str):
+        super().__init__(f"Job {job_id} is already queued or running for {resource}")
+        self.resource = resource
+        self.job_id = job_id
+
+
+class Job:
+    """State of one background job. Mutated only through its methods."""
+
+    def __init__(self, kind: str, params: dict = None, job_id: str = None, store=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.status = QUEUED
+        self.total = None
+        self.done = 0
+        self.success = 0
+        self.errors = 0
+        self.error = None
+        self.summary = None
+        self.attempts = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.results = []
+        self._keys = {}  # item key -> index in results
+        self._in_flight = set()  # item keys started without a recorded result
+        self._store = store
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_record(cls, record: dict, store=None) -> "Job":
+        """
+        Rebuild a job from JobStore.load(). Records read without results
+        (load(results=False), recent()) give a job that only reports progress.
+        """
+        job = cls(record["kind"], record["params"], job_id=record["id"], store=store)
+        job.status = record["status"]
+        job.total = record["total"]
+        job.error = record["error"]
+        job.summary = record["summary"]
+        job.attempts = record["attempts"]
+        job.created_at = record["created_at"]
+        job.started_at = record["started_at"]
+        job.finished_at = record["finished_at"]
+        if "results" not in record:
+            job.done = record["done"]
+            job.success = record["success"]
+            job.errors = job.done - job.success
+            return job
+        for key, result in record["results"]:
+            job._record(result, key)
+        job._in_flight.update(record.get("in_flight", ()))
+        return job
+
+    def set_total(self, total: int):
+        with self._lock:
+            self.total = total
+        if self._store:
+            self._store.update(self.id, total=total)
+
+    def _count(self, result: dict, sign: int = 1):
+        if result.get("status") == "success":
+            self.success += sign
+        else:
+            self.errors += sign
+
+    def _record(self, result: dict, key: str = None) -> int:
+        with self._lock:
+            index = self._keys.get(key) if key is not None else None
+            if index is not None:
+                self._count(self.results[index], -1)
+                self.results[index] = result
+            else:
+                index = len(self.results)
+                self.results.append(result)
+                self.done += 1
+                if key is not None:
+                    self._keys[key] = index
+            self._count(result)
+        return index
+
+    def add_result(self, result: dict, key: str = None):
+        """
+        Record one finished item. With a key, a retry of the same item (e.g.
+        after the job was requeued) replaces its earlier result.
+        """
+        index = self._record(result, key)
+        with self._lock:
+            self._in_flight.discard(key)
+        if self._store:
+            self._store.save_result(self.id, index, key, result)
+
+    def mark_in_flight(self, key: str):
+        """
+        Persist that an item is about to have a side effect that must not be
+        repeated blindly (e.g. a submission), before it happens. If the run
+        dies before add_result(), the retry sees was_attempted(key).
+        """
+        with self._lock:
+            self._in_flight.add(key)
+        if self._store:
+            self._store.mark_in_flight(self.id, key)
+
+    def was_attempted(self, key: str) -> bool:
+        """True when an earlier run started the item (result recorded or still in flight)."""
+        with self._lock:
+            return key in self._keys or key in self._in_flight
+
+    def result_for(self, key: str) -> dict:
+        """Recorded result for an item key, or None."""
+        with self._lock:
+            index = self._keys.get(key)
+            return self.results[index] if index is not None else None
+
+    def completed(self, key: str) -> bool:
+        """True when the item succeeded in an earlier run; handlers skip it on retry."""
+        result = self.result_for(key)
+        return result is not None and result.get("status") == "success"
+
+    def set_summary(self, summary: dict):
+        """Final job-level outcome (e.g. a batch's combined statistics)."""
+        with self._lock:
+            self.summary = summary
+        if self._store:
+            self._store.update(self.id, summary=summary)
+
+    def progress(self) -> dict:
+        """Counts, throughput (items/s) and ETA (s) for the job."""
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            throughput = self.done / elapsed if elapsed > 0 else 0.0
+            remaining = (self.total - self.done) if self.total is not None else None
+            eta = None
+            if self.status == RUNNING and remaining is not None and throughput > 0:
+                eta = round(remaining / throughput, 1)
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "total": self.total,
+                "done": self.done,
+                "success": self.success,
+                "errors": self.errors,
+                "attempts": self.attempts,
+                "elapsed": round(elapsed, 1),
+                "throughput": round(throughput, 2),
+                "eta": eta,
+                "error": self.error,
+                "summary": self.summary,
+                "created_at": self.created_at
+            }
+
+    def results_since(self, cursor: int, limit: int = 500) -> list:
+        """Results recorded after position cursor (in completion order)."""
+        with self._lock:
+            return self.results[cursor:cursor + limit]
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (COMPLETED, FAILED)
+
+    def page(self, offset: int = 0, limit: int = 100, status: str = None) -> dict:
+        """A page of per-item results, optionally filtered by result status."""
+        with self._lock:
+            items = self.results if status is None else [r for r in self.results if r.get("status") == status]
+            return {
+                "job_id": self.id,
+                "offset": offset,
+                "limit": limit,
+                "total": len(items),
+                "results": items[offset:offset + limit]
+            }
+
+
+def _owner_dead(owner: str) -> bool:
+    """True for a lease owner on this host whose process no longer exists."""
+    host, _, rest = owner.partition(":")
+    pid = rest.partition(":")[0]
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        return False
+    return False
+
+
+class JobManager:
+    """
+    Runs persisted jobs on a bounded pool of worker threads.
+
+    Handlers are registered per job kind (register()) so jobs recovered from
+    the store after a restart can be executed again; start() (at app
+    startup) opens the store and starts the workers. Each running job holds
+    a lease renewed by a heartbeat thread; jobs whose lease expires (or whose
+    owning process on this host is gone) are requeued up to max_attempts.
+    Handlers should skip items already recorded as successful
+    (Job.completed) so a resumed job does not redo finished work.
+
+    Jobs run by other processes are read from the store and re-read (at most
+    every REFRESH_SECONDS) while unfinished, so any process can serve them.
+    """
+
+    def __init__(self, max_workers: int = None, history: int = None, store=None,
+                 lease_seconds: float = None, max_attempts: int = None, poll_interval: float = 1.0):
+        self.max_workers = max_workers or Config.JOB_WORKERS
+        self.history = history or Config.JOB_HISTORY
+        self.lease_seconds = lease_seconds or Config.JOB_LEASE_SECONDS
+        self.max_attempts = max_attempts or Config.JOB_MAX_ATTEMPTS
+        self.poll_interval = poll_interval
+        self._store = store
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._handlers = {}
+        self._jobs = OrderedDict()
+        self._loaded_at = {}  # job_id -> time read from the store (jobs not run here)
+        self._running = set()
+        self._lock = threading.Lock()
+        self._store_lock = threading.Lock()
+        self._wake = threading.Condition()
+        self._threads = []
+        self._stopped = threading.Event()
+
+    @property
+    def store(self) -> JobStore:
+        # Opened on first use so importing the app does not touch the disk
+        if self._store is None:
+            with self._store_lock:
+                if self._store is None:
+                    self._store = JobStore()
+        return self._store
+
+    def register(self, kind: str, fn):
+        """Set the handler fn(job, **params) for a job kind (claimed once started)."""
+        self._handlers[kind] = fn
+        self._notify()
+
+    def submit(self, kind: str, params: dict = None, resource: str = None) -> Job:
+        """
+        Persist and queue a job of a registered kind.
+        The handler reports progress through job.set_total() and job.add_result().
+
+        Args:
+            resource: Optional name of what the job works on exclusively (e.g.
+                a batch directory); raises JobConflict while another queued or
+                running job, in any process, holds the same resource.
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind: {kind}")
+        job = Job(kind, params, store=self.store)
+        active = self.store.insert(job, resource)
+        if active is not None:
+            raise JobConflict(resource, active)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+        self._notify()
+        logger.info(f"Queued {kind} job {job.id}")
+        return job
+
+    def get(self, job_id: str) -> Job:
+        """
+        The job, current as of this call when it runs in this process (or has
+        finished), otherwise as of at most REFRESH_SECONDS ago. Callers that
+        follow a job should call get() again rather than keep the object.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and (job.finished or job_id in self._running or
+                                    time.time() - self._loaded_at.get(job_id, 0) < REFRESH_SECONDS):
+                return job
+        record = self.store.load(job_id)
+        if record is None:
+            return job
+        job = Job.from_record(record, store=self.store)
+        with self._lock:
+            if job_id in self._running:
+                return self._jobs[job_id]
+            self._jobs[job_id] = job
+            self._loaded_at[job_id] = time.time()
+            self._evict()
+        return job
+
+    def _local(self, job_id: str) -> Job:
+        """The in-memory job when it is current (running here or finished), else None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and (job.finished or job_id in self._running):
+                return job
+        return None
+
+    def progress(self, job_id: str) -> dict:
+        """Job.progress() of a job, read without its results; None when unknown."""
+        job = self._local(job_id)
+        if job is not None:
+            return job.progress()
+        record = self.store.load(job_id, results=False)
+        return Job.from_record(record).progress() if record else None
+
+    def results_after(self, job_id: str, seq: int, limit: int = 500) -> list:
+        """[(seq, result)] of a job recorded after position seq (-1 for all)."""
+        job = self._local(job_id)
+        if job is not None:
+            start = seq + 1
+            return list(enumerate(job.results_since(start, limit), start))
+        return self.store.results_after(job_id, seq, limit)
+
+    def page(self, job_id: str, offset: int = 0, limit: int = 100, status: str = None) -> dict:
+        """Job.page() of a job, reading only that page for jobs not current here; None when unknown."""
+        job = self._local(job_id)
+        if job is not None:
+            return job.page(offset, limit, status)
+        return self.store.page(job_id, offset, limit, status)
+
+    def list(self) -> list:
+        """Progress of the most recent jobs of all processes, newest first."""
+        progress = []
+        for record in self.store.recent(self.history):
+            job = self._local(record["id"]) or Job.from_record(record)
+            progress.append(job.progress())
+        return progress
+
+    def shutdown(self):
+        """Stop the workers after their current job (tests / shutdown)."""
+        self._stopped.set()
+        self._notify()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def start(self):
+        """Start the workers and the lease heartbeat (idempotent; app startup)."""
+        if self._threads:
+            return
+        self._stopped.clear()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"job-{i}", daemon=True) for i in range(self.max_workers)
+        ]
+        self._threads.append(threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def _notify(self):
+        with self._wake:
+            self._wake.notify_all()
+
+    def _worker(self):
+        while not self._stopped.is_set():
+            job_id = self.store.claim(self.owner, self.lease_seconds, list(self._handlers))
+            if job_id is None:
+                with self._wake:
+                    self._wake.wait(timeout=self.poll_interval)
+                continue
+            self._run(self._attach(job_id))
+
+    def _attach(self, job_id: str) -> Job:
+        """
+        Job for a claimed job, read from the store with the results of earlier
+        runs (possibly recorded by another process), so a resumed run skips them.
+        """
+        record = self.store.load(job_id)
+        job = Job.from_record(record, store=self.store)
+        with self._lock:
+            self._jobs[job_id] = job
+            self._loaded_at.pop(job_id, None)
+            self._running.add(job_id)
+        return job
+
+    def _heartbeat(self):
+        # First pass right away: picks up jobs orphaned by a previous server process
+        while not self._stopped.is_set():
+            try:
+                with self._lock:
+                    running = list(self._running)
+                self.store.renew(self.owner, running, self.lease_seconds)
+                dead = {o for o in self.store.running_owners() if o != self.owner and _owner_dead(o)}
+                if self.store.requeue_expired(self.max_attempts, dead)["requeued"]:
+                    self._notify()
+            except Exception as e:
+                logger.error(f"Job heartbeat failed: {e}")
+            self._stopped.wait(self.lease_seconds / 3)
+
+    def _run(self, job: Job):
+        job.status = RUNNING
+        job.error = None
+        job.finished_at = None
+        logger.info(f"Started {job.kind} job {job.id} (attempt {job.attempts})")
+        try:
+            self._handlers[job.kind](job, **job.params)
+            job.status = COMPLETED
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            logger.error(f"{job.kind} job {job.id} failed: {e}")
+            logger.error(traceback.format_exc())
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._running.discard(job.id)
+            if not self.store.finish(job.id, self.owner, job.status, job.error):
+                logger.warning(f"Lost the lease on {job.kind} job {job.id}; it was requeued")
+            logger.info(f"Finished {job.kind} job {job.id}: {job.progress()}")
+
+    def _evict(self):
+        """Drop the oldest finished jobs beyond the history limit."""
+        finished = [jid for jid, j in self._jobs.items() if j.finished]
+        excess = len(self._jobs) - self.history
+        for jid in finished[:max(0, excess)]:
+            del self._jobs[jid]
+            self._loaded_at.pop(jid, None)
+        if excess > 0:
+            self.store.prune(self.history)
@@ -1,14 +1,26 @@
 from fastapi import FastAPI, UploadFile, File, Form, Request
+from typing import List
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse, FileResponse
+from fastapi.responses import JSONResponse, HTMLResponse, FileResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
-import pandas as pd
 import io
 import os
 import json
 import logging
 import traceback
-from processor import process_etax, save_to_individual_json
+import metrics
+import tracing
+import uuid
+import zipfile
+from upload_pool import UploadPool, UploadPoolFull, UploadCancelled
+from upload_spool import spool_upload, archive_by_hash, extract_zip, is_report_extension, upload_extension, UploadTooLarge
+from master_data import master_version
+from config import Config
+# pandas is only imported (by result_store / upload_batch / export_stream
+# functions) when an upload or export first needs it, to keep startup fast
+from result_store import ResultStore, summarize_frame
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO)
@@ -48,52 +60,196 @@ async def test_endpoint():
     logger.info("Test endpoint reached")
     return {"status": "ok"}
 
+@app.get("/metrics")
+async def get_metrics():
+    """Stage timings, counters and in-flight gauges in Prometheus text format."""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+upload_pool = UploadPool()
+# Memory cache per worker process, shared with the other workers through RESULT_SHARED_DIR
+result_store = ResultStore(shared_dir=Config.RESULT_SHARED_DIR)
+
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(request: Request, file: UploadFile = File(...)):
     try:
         logger.info(f"--- Processing New Upload: {file.filename} ---")
-        content = await file.read()
-        
-        # Determine extension
-        filename = file.filename.lower()
-        ext = os.path.splitext(filename)[1]
+
+        # Cheap early reject before copying anything
+        declared = int(request.headers.get("content-length") or 0)
+        if Config.UPLOAD_MAX_BYTES and declared > Config.UPLOAD_MAX_BYTES:
+            raise UploadTooLarge(Config.UPLOAD_MAX_BYTES)
+
+        # Determine extension (".csv.gz" etc. for compressed reports, archived as uploaded)
+        ext = upload_extension(file.filename)
         if not ext:
             ext = '.csv' # Default fallback
             
         from datetime import datetime
+        upload_id = uuid.uuid4().hex
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"upload_{timestamp}{ext}"
+        filename = f"upload_{timestamp}_{upload_id[:8]}{ext}"
         archive_path = os.path.join(UPLOAD_DIR, filename)
         
-        # Save to archive
-        with open(archive_path, "wb") as f:
-            f.write(content)
+        # Save to archive (streamed in chunks, hashed and size-checked on the way)
+        spooled = await spool_upload(file, archive_path)
         logger.info(f"Archived uploaded file to {archive_path}")
-            
-        processed_df = process_etax(archive_path, MASTER_DIR)
-        
-        # New: Automatically generate individual JSONs for API submission
-        saved_jsons = save_to_individual_json(processed_df, OUTPUT_JSON_DIR)
-        logger.info(f"Generated {len(saved_jsons)} individual JSON files in {OUTPUT_JSON_DIR}")
-            
+
+        # Same file against the same master data: reuse the stored result
+        # instead of re-running process_etax and rewriting the JSON files
+        master_ver = await run_in_threadpool(master_version, MASTER_DIR)
+        dedup_key = f"{spooled['sha256']}:{master_ver}"
+        cached_id = result_store.find(dedup_key)
+        cached_df = await run_in_threadpool(result_store.get, cached_id) if cached_id else None
+        if cached_df is not None:
+            archive_by_hash(archive_path, spooled["sha256"], UPLOAD_DIR)
+            metrics.UPLOAD_RESULTS.inc(source="cache")
+            logger.info(f"Upload matches result {cached_id} (master {master_ver}), skipping processing")
+            return {
+                "status": "success",
+                "upload_id": upload_id,
+                "result_id": cached_id,
+                "sha256": spooled["sha256"],
+                "cached": True,
+                "json_count": result_store.meta(cached_id).get("json_count"),
+                "summary": summarize_frame(cached_df)
+            }
+
+        with tracing.start_trace("upload", trace_id=upload_id, filename=file.filename,
+                                 size_bytes=spooled["size"], sha256=spooled["sha256"]) as upload_span:
+            # process_etax + JSON generation run in a worker process (CPU-bound)
+            result = await upload_pool.run(
+                archive_path, MASTER_DIR, OUTPUT_JSON_DIR,
+                is_disconnected=request.is_disconnected,
+                trace_parent=(upload_span.trace_id, upload_span.span_id)
+            )
+            metrics.REGISTRY.merge(result["metrics"])
+            upload_span.set_attribute("rows", result["rows"])
+            upload_span.set_attribute("documents", result["json_count"])
+        logger.info(f"Generated {result['json_count']} individual JSON files in {OUTPUT_JSON_DIR}")
+
+        processed_df = result["df"]
+        # Off the event loop: also writes the result to the shared directory
+        await run_in_threadpool(result_store.put, upload_id, processed_df, {
+            "filename": file.filename,
+            "sha256": spooled["sha256"],
+            "master_version": master_ver,
+            "json_count": result["json_count"]
+        }, key=dedup_key)
+        archive_by_hash(archive_path, spooled["sha256"], UPLOAD_DIR)
+        metrics.UPLOAD_RESULTS.inc(source="processed")
         first_match = processed_df['สถานะการจับคู่'].iloc[0] if len(processed_df) > 0 else 'EMPTY'
         logger.info(f"Processed {len(processed_df)} rows. Status sample: {first_match}")
-        
-        data = processed_df.to_dict(orient='records')
+
+        # Rows are served page by page from /api/results/{result_id}
         return {
             "status": "success", 
-            "data": data,
-            "json_count": len(saved_jsons)
+            "upload_id": upload_id,
+            "result_id": upload_id,
+            "sha256": spooled["sha256"],
+            "cached": False,
+            "json_count": result["json_count"],
+            "summary": summarize_frame(processed_df)
         }
+    except UploadTooLarge as e:
+        logger.warning(f"Rejecting upload: {e}")
+        return JSONResponse(status_code=413, content={"status": "error", "message": str(e)})
+    except UploadPoolFull as e:
+        logger.warning(f"Rejecting upload: {e}")
+        return JSONResponse(status_code=503, headers={"Retry-After": "10"},
+                            content={"status": "error", "message": str(e)})
+    except UploadCancelled as e:
+        logger.info(f"Upload abandoned: {e}")
+        # 499 Client Closed Request; nobody reads it, but keeps logs honest
+        return JSONResponse(status_code=499, content={"status": "error", "message": str(e)})
     except Exception as e:
         logger.error(f"Error processing upload: {str(e)}")
         logger.error(traceback.format_exc())
         return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
 
+class ResultNotFound(Exception):
+    """Export referenced a result_id that expired or never existed."""
+
+def run_upload_batch(job, files, master_dir, output_json_dir):
+    """Job body for /upload-batch: process the spooled files in parallel and combine them."""
+    from upload_batch import process_batch
+    process_batch(job, files, master_dir, output_json_dir, upload_pool, result_store)
+
+@app.post("/upload-batch")
+async def upload_batch(files: List[UploadFile] = File(...)):
+    """
+    Queue many reports (CSV / Excel files and/or zips of them) as one
+    background job; follow it via /api/jobs/{job_id} (and /events). The
+    finished job's summary holds the combined result_id, its statistics and
+    invoice numbers that appear in more than one file.
+    """
+    entries = []
+    try:
+        from datetime import datetime
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        for upload in files:
+            ext = upload_extension(upload.filename) or '.csv'
+            if not is_report_extension(ext):
+                return JSONResponse(status_code=400, content={"status": "error", "message": f"Unsupported file type: {upload.filename}"})
+
+            archive_path = os.path.join(UPLOAD_DIR, f"upload_{timestamp}_{uuid.uuid4().hex[:8]}{ext}")
+            spooled = await spool_upload(upload, archive_path)
+            if ext == '.zip':
+                try:
+                    members = await run_in_threadpool(extract_zip, archive_path, UPLOAD_DIR)
+                finally:
+                    os.remove(archive_path)
+                for member in members:
+                    entries.append({**member, "filename": f"{upload.filename}/{member['name']}"})
+            else:
+                entries.append({**spooled, "filename": upload.filename})
+
+        if not entries:
+            return JSONResponse(status_code=400, content={"status": "error", "message": "No CSV or Excel reports found in the upload"})
+
+        job = job_manager.submit("upload-batch", {
+            "files": entries, "master_dir": MASTER_DIR, "output_json_dir": OUTPUT_JSON_DIR
+        })
+        logger.info(f"Queued upload batch {job.id} with {len(entries)} file(s)")
+        return {"status": "queued", "job_id": job.id, "files": len(entries), "progress": job.progress()}
+    except (UploadTooLarge, zipfile.BadZipFile) as e:
+        for entry in entries:
+            if os.path.exists(entry["path"]):
+                os.remove(entry["path"])
+        status = 413 if isinstance(e, UploadTooLarge) else 400
+        logger.warning(f"Rejecting upload batch: {e}")
+        return JSONResponse(status_code=status, content={"status": "error", "message": str(e)})
+    except Exception as e:
+        logger.error(f"Error queueing upload batch: {str(e)}")
+        logger.error(traceback.format_exc())
+        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+
+def resolve_export_rows(body):
+    """
+    DataFrame for an export request: either {"result_id": ...} referencing a
+    stored upload result, or the row array itself (bare or under "data").
+    Returns None for an empty / invalid body. Blocking (the result may be
+    read from the shared directory): run it in the threadpool.
+    """
+    import pandas as pd
+    if isinstance(body, dict) and body.get("result_id"):
+        df = result_store.get(body["result_id"])
+        if df is None:
+            raise ResultNotFound(f"Result {body['result_id']} not found or expired, please upload again")
+        return df
+    data = body['data'] if isinstance(body, dict) and 'data' in body else body
+    if not data or not isinstance(data, list):
+        return None
+    return pd.DataFrame(data)
+
+def result_not_found(e):
+    return JSONResponse(status_code=404, content={"status": "error", "message": str(e)})
+
 @app.post("/export")
 async def export_json(request: Request):
     try:
-        data = await request.json()
+        body = await request.json()
+        df = await run_in_threadpool(resolve_export_rows, body)
+        data = df.to_dict(orient='records') if df is not None else []
         # Dynamic Seller Info based on first row if available
         seller_name = "บริษัท แอ๊ดว้านซ์ทรานสปอร์ต จำกัด"
         seller_tax = "0105519004951"
@@ -115,6 +271,8 @@ async def export_json(request: Request):
             json.dump(formatted_data, f, ensure_ascii=False, indent=4)
             
         return FileResponse(file_path, filename="etax_export.json", media_type="application/json")
+    except ResultNotFound as e:
+        return result_not_found(e)
     except Exception as e:
         logger.error(f"Error exporting JSON: {str(e)}")
         return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
@@ -123,25 +281,22 @@ async def export_json(request: Request):
 async def export_csv(request: Request):
     try:
         body = await request.json()
+        df = await run_in_threadpool(resolve_export_rows, body)
+
+        logger.info(f"Export CSV requested. Body type: {type(body)}. Rows: {len(df) if df is not None else 'N/A'}")
         
-        # Robustly handle different data structures
-        if isinstance(body, dict) and 'data' in body:
-            data = body['data']
-        elif isinstance(body, list):
-            data = body
-        else:
-            data = body
-
-        logger.info(f"Export CSV requested. Body type: {type(body)}. Rows: {len(data) if isinstance(data, list) else 'N/A'}")
-        
-        if not data or not isinstance(data, list):
+        if df is None:
             return JSONResponse(status_code=400, content={"status": "error", "message": "Invalid or empty data format"})
         
-        df = pd.DataFrame(data)
-        file_path = os.path.join(DATA_DIR, "etax_export.csv")
-        df.to_csv(file_path, index=False, encoding='utf-8-sig')
-        
-        return FileResponse(file_path, filename="etax_export.csv", media_type="text/csv")
+        # Encoded chunk by chunk while the client downloads; nothing on disk
+        from export_stream import iter_csv
+        return StreamingResponse(
+            iter_csv(df),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="etax_export.csv"'}
+        )
+    except ResultNotFound as e:
+        return result_not_found(e)
     except Exception as e:
         error_msg = f"Error exporting CSV: {str(e)}"
         logger.error(error_msg)
@@ -151,34 +306,53 @@ async def export_csv(request: Request):
 async def export_excel(request: Request):
     try:
         body = await request.json()
-        if isinstance(body, dict) and 'data' in body:
-            data = body['data']
-        else:
-            data = body
+        df = await run_in_threadpool(resolve_export_rows, body)
 
-        logger.info(f"Export Excel requested for {len(data) if isinstance(data, list) else 'N/A'} rows")
+        logger.info(f"Export Excel requested for {len(df) if df is not None else 'N/A'} rows")
         
-        if not data or not isinstance(data, list):
+        if df is None:
             return JSONResponse(status_code=400, content={"status": "error", "message": "Invalid or empty data format"})
         
-        df = pd.DataFrame(data)
-        file_path = os.path.join(DATA_DIR, "etax_export.xlsx")
-        
-        # Save as Excel using openpyxl engine
-        df.to_excel(file_path, index=False, engine='openpyxl')
-        logger.info(f"Excel saved to {file_path}")
-        
+        # Write-only workbook in a per-request temp file, deleted after sending
+        from export_stream import write_xlsx, remove_file
+        file_path, _ = await run_in_threadpool(write_xlsx, df)
+
         return FileResponse(
-            file_path, 
-            filename="etax_export.xlsx", 
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            file_path,
+            filename="etax_export.xlsx",
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            background=BackgroundTask(remove_file, file_path)
         )
+    except ResultNotFound as e:
+        return result_not_found(e)
     except Exception as e:
         error_msg = f"Error exporting Excel: {str(e)}"
         logger.error(error_msg)
         logger.error(traceback.format_exc())
         return JSONResponse(status_code=500, content={"status": "error", "message": error_msg})
 
+MAX_PAGE_SIZE = 1000
+
+@app.get("/api/results/{result_id}")
+async def get_result_page(result_id: str, offset: int = 0, limit: int = 100, sort: str = None,
+                          order: str = "asc", status: str = None, q: str = None):
+    """Paginated, filterable, sortable rows of a processed upload."""
+    try:
+        page = await run_in_threadpool(result_store.page, result_id, offset, max(1, min(limit, MAX_PAGE_SIZE)),
+                                       sort=sort, descending=order.lower() == "desc", status=status, q=q)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+    if page is None:
+        return result_not_found(f"Result {result_id} not found or expired, please upload again")
+    return {"status": "success", "result_id": result_id, **page}
+
+@app.get("/api/results/{result_id}/summary")
+async def get_result_summary(result_id: str):
+    df = await run_in_threadpool(result_store.get, result_id)
+    if df is None:
+        return result_not_found(f"Result {result_id} not found or expired, please upload again")
+    return {"status": "success", "result_id": result_id, "summary": summarize_frame(df)}
+
 @app.get("/master-status")
 async def get_master_status():
     files = ["Mapping Vendor Code.csv", "Customer_Tax ID.csv", "AT Address.csv"]
@@ -189,124 +363,18 @@ async def get_master_status():
     return status
 
 # =============================================================================
-# AXONS E-TAX API Endpoints
+# AXONS E-TAX API Endpoints (submit_api.py, also served alone by submit_main.py)
 # =============================================================================
-from API_AXONS import AxonsETaxService
-
-etax_service = AxonsETaxService()
-
-@app.post("/api/generate-pdf")
-async def api_generate_pdf(request: Request):
-    """Generate PDF from ET_INVOICE JSON."""
-    try:
-        data = await request.json()
-        # Support both direct ET_INVOICE and array-wrapped format
-        if isinstance(data, list) and len(data) > 0:
-            et_invoice = data[0]
-        else:
-            et_invoice = data
+from submit_api import router as submit_router, job_manager
 
-        base64_pdf = etax_service.generate_pdf(et_invoice)
-        doc_number = et_invoice.get("ET_INVOICE_HDR", [{}])[0].get("DOC_NUMBER", "unknown")
-
-        return {
-            "status": "success",
-            "doc_number": doc_number,
-            "pdf_base64": base64_pdf,
-            "pdf_length": len(base64_pdf)
-        }
-    except Exception as e:
-        logger.error(f"Generate PDF error: {e}")
-        logger.error(traceback.format_exc())
-        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
-
-@app.post("/api/submit")
-async def api_submit(request: Request):
-    """Full pipeline: Generate PDF → Transform to ETDA v2.0 → Submit."""
-    try:
-        data = await request.json()
-        if isinstance(data, list) and len(data) > 0:
-            et_invoice = data[0]
-        else:
-            et_invoice = data
-
-        result = etax_service.process_and_submit(et_invoice)
-        status_code = 200 if result["status"] == "success" else 500
-        return JSONResponse(status_code=status_code, content=result)
-    except Exception as e:
-        logger.error(f"Submit error: {e}")
-        logger.error(traceback.format_exc())
-        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
-
-@app.post("/api/check-status")
-async def api_check_status(request: Request):
-    """Check document submission status."""
-    try:
-        data = await request.json()
-        result = etax_service.check_status(
-            doc_number=data.get("docNumber", ""),
-            doc_date=data.get("docDate", ""),
-            com_tax_id=data.get("comTaxId", ""),
-            branch=data.get("branch", "00000"),
-            internal_doc_no=data.get("internalDocNo", ""),
-            doc_type=data.get("docType", "388")
-        )
-        return result
-    except Exception as e:
-        logger.error(f"Check status error: {e}")
-        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
-
-@app.post("/api/submit-batch")
-async def api_submit_batch(request: Request):
-    """Batch submit all JSON files from output_json directory."""
-    try:
-        body = await request.json()
-        json_dir = body.get("json_dir", None)
-        
-        # Run blocking batch submission in a separate thread to keep server responsive
-        import anyio
-        results = await anyio.to_thread.run_sync(etax_service.process_and_submit_batch, json_dir)
-
-        success_count = sum(1 for r in results if r.get("status") == "success")
-        error_count = sum(1 for r in results if r.get("status") == "error")
-
-        return {
-            "status": "completed",
-            "total": len(results),
-            "success": success_count,
-            "errors": error_count,
-            "results": results
-        }
-    except Exception as e:
-        logger.error(f"Batch submit error: {e}")
-        logger.error(traceback.format_exc())
-        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
-
-@app.post("/api/transform-preview")
-async def api_transform_preview(request: Request):
-    """Preview ETDA v2.0 transformation without submitting (for debugging)."""
-    try:
-        data = await request.json()
-        if isinstance(data, list) and len(data) > 0:
-            et_invoice = data[0]
-        else:
-            et_invoice = data
-
-        # Transform with a dummy PDF placeholder
-        etda_json, endpoint_key = etax_service.transform_to_etda(
-            et_invoice, "<<PLACEHOLDER_BASE64_PDF>>"
-        )
-
-        return {
-            "status": "success",
-            "endpoint_key": endpoint_key,
-            "etda_preview": etda_json
-        }
-    except Exception as e:
-        logger.error(f"Transform preview error: {e}")
-        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+app.include_router(submit_router)
+job_manager.register("upload-batch", run_upload_batch)
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Several workers need the import string; they share state through etax_data
+    if Config.WEB_WORKERS > 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=Config.WEB_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,103 @@
+"""
+master_data.py - Master CSV files used to enrich uploaded transactions.
+Provides a version fingerprint of the Master directory so results computed
+from an upload can be reused only while the master data is unchanged, and
+snapshots of the parsed master data shared by all worker processes.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import uuid
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Files read by processor.process_etax
+MASTER_FILES = ('Mapping Vendor Code.csv', 'Customer_Tax ID.csv', 'AT Address.csv')
+
+_version_cache = {}  # master_dir -> (stat signature, version)
+_version_lock = threading.Lock()
+
+
+def _signature(master_dir: str) -> tuple:
+    signature = []
+    for name in MASTER_FILES:
+        path = os.path.join(master_dir, name)
+        try:
+            st = os.stat(path)
+            signature.append((name, st.st_size, st.st_mtime_ns))
+        except FileNotFoundError:
+            signature.append((name, None, None))
+    return tuple(signature)
+
+
+def master_version(master_dir: str) -> str:
+    """
+    Content hash of the master files (missing files count as empty).
+    Re-hashed only when a file's size or mtime changes.
+    """
+    signature = _signature(master_dir)
+    with _version_lock:
+        cached = _version_cache.get(master_dir)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+    digest = hashlib.sha256()
+    for name in MASTER_FILES:
+        digest.update(name.encode("utf-8") + b"\0")
+        path = os.path.join(master_dir, name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        digest.update(b"\0")
+    version = digest.hexdigest()[:16]
+
+    with _version_lock:
+        _version_cache[master_dir] = (signature, version)
+    logger.info(f"Master data version for {master_dir}: {version}")
+    return version
+
+
+def _snapshot_path(version: str, snapshot_dir: str = None) -> str:
+    return os.path.join(snapshot_dir or Config.MASTER_SNAPSHOT_DIR, f"{version}.pkl")
+
+
+def load_snapshot(version: str, snapshot_dir: str = None):
+    """Parsed master data saved by save_snapshot() for a version, or None."""
+    if not (snapshot_dir or Config.MASTER_SNAPSHOT_DIR):
+        return None
+    try:
+        with open(_snapshot_path(version, snapshot_dir), "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable master snapshot {version}: {e}")
+        return None
+
+
+def save_snapshot(version: str, frames, snapshot_dir: str = None):
+    """
+    Save parsed master data for a version so other processes load it instead
+    of parsing the CSVs. Written to a temp file and renamed, so concurrent
+    writers and readers never see a partial snapshot.
+    """
+    snapshot_dir = snapshot_dir or Config.MASTER_SNAPSHOT_DIR
+    if not snapshot_dir:
+        return
+    path = _snapshot_path(version, snapshot_dir)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        os.makedirs(snapshot_dir, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            pickle.dump(frames, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved master snapshot {version} to {path}")
+    except OSError as e:
+        logger.warning(f"Could not save master snapshot {version}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,282 @@
+"""
+metrics.py - In-process metrics exposed in Prometheus text format.
+Stage timings (histograms), call/item counters and in-flight gauges for the
+processing and submission pipeline, rendered by GET /metrics in main.py.
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers sub-millisecond transforms up to multi-minute uploads
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: dict = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _samples(self) -> list:
+        """(suffix, label values, extra labels, value) tuples."""
+        with self._lock:
+            return [("", key, None, value) for key, value in sorted(self._values.items())]
+
+    def drain(self):
+        """Return and clear the recorded values (picklable)."""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        """Add values drained from another process."""
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, key, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing value."""
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down (e.g. in-flight calls)."""
+    type_name = "gauge"
+
+    def merge(self, values):
+        # Point-in-time values from another process are not meaningful here
+        pass
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Cumulative bucketed observations with sum and count."""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def get(self, **labels) -> dict:
+        """{"count", "sum"} for one label set."""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return {"count": state[2], "sum": state[1]} if state else {"count": 0, "sum": 0.0}
+
+    def merge(self, values):
+        with self._lock:
+            for key, (counts, total, count) in values.items():
+                state = self._values.get(key)
+                if state is None:
+                    state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+                state[2] += count
+
+    def _samples(self) -> list:
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    samples.append(("_bucket", key, {"le": _format_value(bound)}, cumulative))
+                samples.append(("_sum", key, None, total))
+                samples.append(("_count", key, None, count))
+        return samples
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Duplicate metric: {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def drain(self) -> dict:
+        """
+        Collect and reset every metric, e.g. at the end of a worker-process
+        task; the parent process folds the result in with merge().
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: m.drain() for m in metrics}
+
+    def merge(self, snapshot: dict):
+        with self._lock:
+            metrics = dict(self._metrics)
+        for name, values in snapshot.items():
+            if name in metrics:
+                metrics[name].merge(values)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# =============================================================================
+# PIPELINE METRICS
+# =============================================================================
+STAGE_SECONDS = Histogram(
+    "etax_stage_duration_seconds", "Time spent per pipeline stage.", ("stage",)
+)
+STAGE_CALLS = Counter(
+    "etax_stage_calls_total", "Pipeline stage executions by outcome.", ("stage", "outcome")
+)
+STAGE_ITEMS = Counter(
+    "etax_stage_items_total", "Rows or documents handled per pipeline stage.", ("stage",)
+)
+STAGE_IN_FLIGHT = Gauge(
+    "etax_stage_in_flight", "Pipeline stage executions currently running.", ("stage",)
+)
+UPLOAD_RESULTS = Counter(
+    "etax_upload_results_total", "Successful uploads by where the result came from.", ("source",)
+)
+
+
+@contextmanager
+def track_stage(stage: str, items: int = 0):
+    """
+    Time a block as one execution of stage.
+
+    Yields:
+        A dict; set "items" (processed count) or "outcome" inside the block.
+    """
+    info = {"items": items, "outcome": "ok"}
+    STAGE_IN_FLIGHT.inc(stage=stage)
+    start = time.perf_counter()
+    try:
+        yield info
+    except BaseException:
+        info["outcome"] = "error"
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+        STAGE_CALLS.inc(stage=stage, outcome=info["outcome"])
+        if info["items"]:
+            STAGE_ITEMS.inc(info["items"], stage=stage)
+        STAGE_IN_FLIGHT.dec(stage=stage)
+
+
+def timed(stage: str, items=None, outcome=None):
+    """
+    Decorator form of track_stage.
+
+    Args:
+        stage: Stage label.
+        items: Optional callable(result) -> processed item count.
+        outcome: Optional callable(result) -> "ok" / "error" for functions
+            that report failure in their return value.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with track_stage(stage) as info:
+                result = fn(*args, **kwargs)
+                if items is not None:
+                    info["items"] = items(result)
+                if outcome is not None:
+                    info["outcome"] = outcome(result)
+                return result
+        return wrapper
+    return decorator
+
+
+class StageLaps:
+    """
+    Sub-stage timings inside one function: each lap() records the time since
+    the previous lap as stage "<parent>.<name>".
+    """
+
+    def __init__(self, parent: str):
+        self.parent = parent
+        self._last = time.perf_counter()
+
+    def lap(self, name: str):
+        now = time.perf_counter()
+        STAGE_SECONDS.observe(now - self._last, stage=f"{self.parent}.{name}")
+        self._last = now
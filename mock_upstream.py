@@ -0,0 +1,227 @@
+"""
+mock_upstream.py - Local stand-in for the Gen PDF and AXONS TSP gateways.
+Serves the token, PDF, submit and status endpoints with configurable latency
+distributions, error and 429 throttling rates, so batch throughput, retry
+behaviour and concurrency limits can be measured offline.
+
+Run:
+    python mock_upstream.py --port 9000 --latency lognormal:80:0.5 --error-rate 0.01
+and point the service at it:
+    MOCK_UPSTREAM_URL=http://127.0.0.1:9000 uvicorn main:app
+
+Latency specs (milliseconds):
+    fixed:50 | uniform:20:200 | normal:100:30 | lognormal:<median>:<sigma>
+"""
+import argparse
+import asyncio
+import base64
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="E-Tax mock upstream")
+
+
+class MockSettings:
+    """Runtime-tunable behaviour of the mock (also editable via /__mock/config)."""
+
+    def __init__(self):
+        self.latency = os.getenv("MOCK_LATENCY", "fixed:0")
+        self.pdf_latency = os.getenv("MOCK_PDF_LATENCY", "")
+        self.submit_latency = os.getenv("MOCK_SUBMIT_LATENCY", "")
+        self.status_latency = os.getenv("MOCK_STATUS_LATENCY", "")
+        self.error_rate = float(os.getenv("MOCK_ERROR_RATE", "0"))
+        self.throttle_rate = float(os.getenv("MOCK_THROTTLE_RATE", "0"))
+        self.retry_after = int(os.getenv("MOCK_RETRY_AFTER", "1"))
+        self.pdf_kb = int(os.getenv("MOCK_PDF_KB", "200"))
+        # Probability that a status poll reports the final state
+        self.status_final_rate = float(os.getenv("MOCK_STATUS_FINAL_RATE", "0.5"))
+        self.seed = os.getenv("MOCK_SEED")
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+settings = MockSettings()
+_rng = random.Random(settings.seed)
+_rng_lock = threading.Lock()
+_stats = Counter()
+_pdf_cache = {}
+
+
+def _random() -> float:
+    with _rng_lock:
+        return _rng.random()
+
+
+def sample_latency(spec: str) -> float:
+    """Draw one latency in seconds from a spec string."""
+    kind, *args = (spec or "fixed:0").split(":")
+    vals = [float(a) for a in args]
+    with _rng_lock:
+        if kind == "fixed":
+            ms = vals[0] if vals else 0.0
+        elif kind == "uniform":
+            ms = _rng.uniform(vals[0], vals[1])
+        elif kind == "normal":
+            ms = _rng.gauss(vals[0], vals[1])
+        elif kind == "lognormal":
+            ms = _rng.lognormvariate(math.log(max(vals[0], 0.001)), vals[1] if len(vals) > 1 else 0.5)
+        else:
+            raise ValueError(f"Unknown latency distribution: {spec}")
+    return max(0.0, ms) / 1000.0
+
+
+def _fake_pdf(size_kb: int) -> str:
+    """Base64 of a syntactically minimal PDF padded to roughly size_kb."""
+    if size_kb not in _pdf_cache:
+        header = b"%PDF-1.4\n%mock\n"
+        trailer = b"\n%%EOF\n"
+        padding = b"0" * max(0, size_kb * 1024 - len(header) - len(trailer))
+        _pdf_cache[size_kb] = base64.b64encode(header + padding + trailer).decode("ascii")
+    return _pdf_cache[size_kb]
+
+
+async def _simulate(endpoint: str, spec: str):
+    """
+    Apply latency and fault injection.
+    Returns a JSONResponse for injected faults, otherwise None.
+    """
+    _stats[f"{endpoint}.requests"] += 1
+    await asyncio.sleep(sample_latency(spec or settings.latency))
+
+    roll = _random()
+    if roll < settings.throttle_rate:
+        _stats[f"{endpoint}.429"] += 1
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": str(settings.retry_after)},
+            content={"status": "error", "message": "Too Many Requests"}
+        )
+    if roll < settings.throttle_rate + settings.error_rate:
+        _stats[f"{endpoint}.500"] += 1
+        return JSONResponse(status_code=500, content={"status": "error", "message": "Injected upstream error"})
+    _stats[f"{endpoint}.200"] += 1
+    return None
+
+
+@app.post("/oauth2/token")
+async def token():
+    fault = await _simulate("token", settings.latency)
+    if fault:
+        return fault
+    return {"access_token": uuid.uuid4().hex, "token_type": "Bearer", "expires_in": 3600}
+
+
+@app.post("/api/v1/pdf/generate")
+async def generate_pdf(request: Request):
+    body = await request.body()
+    fault = await _simulate("pdf", settings.pdf_latency)
+    if fault:
+        return fault
+    return {"pdf": _fake_pdf(settings.pdf_kb), "received_bytes": len(body)}
+
+
+@app.post("/api/v1/document/submit")
+async def submit(request: Request):
+    body = await request.body()
+    fault = await _simulate("submit", settings.submit_latency)
+    if fault:
+        return fault
+    _stats["submit.bytes"] += len(body)
+    return {
+        "status": "success",
+        "message": "Received",
+        "transactionId": uuid.uuid4().hex,
+        "received_bytes": len(body)
+    }
+
+
+@app.post("/api/v1/document/status")
+async def status(request: Request):
+    payload = await request.json()
+    fault = await _simulate("status", settings.status_latency)
+    if fault:
+        return fault
+    final = _random() < settings.status_final_rate
+    return {
+        "status": "success",
+        "data": {
+            "docNumber": payload.get("docNumber"),
+            "documentStatus": "SUCCESS" if final else "PROCESSING"
+        }
+    }
+
+
+@app.get("/__mock/stats")
+async def stats():
+    return {"stats": dict(_stats), "settings": settings.as_dict()}
+
+
+@app.post("/__mock/config")
+async def update_config(request: Request):
+    """Change settings at runtime, e.g. {"error_rate": 0.05, "latency": "uniform:10:50"}."""
+    changes = await request.json()
+    for key, value in changes.items():
+        if not hasattr(settings, key):
+            return JSONResponse(status_code=400, content={"status": "error", "message": f"Unknown setting: {key}"})
+        current = getattr(settings, key)
+        setattr(settings, key, type(current)(value) if current is not None else value)
+    return {"status": "success", "settings": settings.as_dict()}
+
+
+@app.post("/__mock/reset")
+async def reset():
+    _stats.clear()
+    return {"status": "success"}
+
+
+def run_in_thread(host: str = "127.0.0.1", port: int = 9000):
+    """
+    Start the mock in a background thread (for benchmarks and tests).
+
+    Returns:
+        The uvicorn.Server; set server.should_exit = True to stop it.
+    """
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="mock-upstream", daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started and time.time() < deadline:
+        time.sleep(0.05)
+    return server
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local mock of the Gen PDF and TSP gateways")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", help="Default latency spec, e.g. lognormal:80:0.5")
+    parser.add_argument("--pdf-latency")
+    parser.add_argument("--submit-latency")
+    parser.add_argument("--status-latency")
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--throttle-rate", type=float)
+    parser.add_argument("--retry-after", type=int)
+    parser.add_argument("--pdf-kb", type=int)
+    parser.add_argument("--status-final-rate", type=float)
+    parser.add_argument("--seed")
+    args = parser.parse_args()
+
+    for key, value in vars(args).items():
+        if key not in ("host", "port") and value is not None:
+            setattr(settings, key, value)
+    if args.seed is not None:
+        _rng.seed(args.seed)
+
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -2,7 +2,20 @@ import pandas as pd
 import os
 import re
 import json
+import gzip
+import io
 import logging
+import zipfile
+from contextlib import contextmanager
+from metrics import timed, StageLaps
+from tracing import traced
+from master_data import MASTER_FILES, master_version, load_snapshot, save_snapshot
+from upload_spool import COMPRESSED_EXTENSIONS, UPLOAD_EXTENSIONS, upload_extension
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, only needed for .zst uploads
+    zstandard = None
 
 # Setup logger
 logger = logging.getLogger(__name__)
@@ -55,7 +68,54 @@ def get_template_name(doc_no):
     return doc_str
 
 
+@contextmanager
+def open_report(path):
+    """
+    Decompressing binary stream over a compressed report.
+
+    Yields:
+        (stream, report extension), e.g. (GzipFile, '.csv') for report.csv.gz.
+        A .zip must hold exactly one report.
+    """
+    ext = upload_extension(path)
+    if ext.endswith('.gz'):
+        with gzip.open(path, 'rb') as stream:
+            yield stream, ext[:-3] or '.csv'
+    elif ext.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read .zst uploads")
+        with open(path, 'rb') as raw, zstandard.ZstdDecompressor().stream_reader(raw) as stream:
+            yield stream, ext[:-4] or '.csv'
+    else:
+        with zipfile.ZipFile(path) as zf:
+            members = [i for i in zf.infolist()
+                       if not i.is_dir() and not os.path.basename(i.filename).startswith('.')
+                       and upload_extension(i.filename) in UPLOAD_EXTENSIONS]
+            if len(members) != 1:
+                raise ValueError(f"Zip upload must contain exactly one CSV or Excel report, found {len(members)} "
+                                 f"(use the batch upload for several)")
+            with zf.open(members[0]) as stream:
+                yield stream, upload_extension(members[0].filename)
+
+def load_compressed(path):
+    """Read a compressed report as a stream; the decompressed file never touches disk."""
+    with open_report(path) as (stream, ext):
+        if ext in ('.xls', '.xlsx'):
+            # openpyxl needs random access; Excel is small compared to CSV exports
+            return pd.read_excel(io.BytesIO(stream.read()), dtype=str)
+        try:
+            return pd.read_csv(stream, encoding='utf-8-sig', dtype=str)
+        except UnicodeDecodeError:
+            pass
+    # Streams cannot rewind: decompress again for the Thai legacy encoding
+    with open_report(path) as (stream, ext):
+        return pd.read_csv(stream, encoding='tis-620', dtype=str)
+
 def load_csv(path):
+    # Compressed reports (.gz / .zst / single-report .zip)
+    if path.lower().endswith(COMPRESSED_EXTENSIONS):
+        return load_compressed(path)
+
     # Support for Excel files
     if path.lower().endswith(('.xls', '.xlsx')):
         try:
@@ -156,14 +216,38 @@ def format_float(val, decimals=2):
     except:
         return str(val)
 
+_master_cache = {}  # master_dir -> (version, (mapping_vendor, customer_tax, at_address))
+
+def load_masters(master_dir):
+    """
+    Master DataFrames for master_dir, kept per process and reused while
+    master_version() is unchanged (e.g. across the files of a batch upload
+    handled by the same worker). A process that has not seen the version yet
+    loads the snapshot another process saved; only the first one parses the
+    CSVs. Returns copies, since process_etax modifies them.
+    """
+    version = master_version(master_dir)
+    cached = _master_cache.get(master_dir)
+    if cached is None or cached[0] != version:
+        frames = load_snapshot(version)
+        if frames is None:
+            frames = tuple(load_csv(os.path.join(master_dir, name)) for name in MASTER_FILES)
+            save_snapshot(version, frames)
+            logger.info(f"Loaded master data {version} from {master_dir}")
+        _master_cache[master_dir] = cached = (version, frames)
+    return tuple(frame.copy() for frame in cached[1])
+
+@timed("process_etax", items=len)
+@traced("process_etax")
 def process_etax(transaction_path, master_dir, output_path=None):
-    # Load Master Data
-    mapping_vendor = load_csv(os.path.join(master_dir, 'Mapping Vendor Code.csv'))
-    customer_tax = load_csv(os.path.join(master_dir, 'Customer_Tax ID.csv'))
-    at_address = load_csv(os.path.join(master_dir, 'AT Address.csv'))
+    laps = StageLaps("process_etax")
+
+    # Load Master Data (cached per process)
+    mapping_vendor, customer_tax, at_address = load_masters(master_dir)
 
     # Load Transaction Data
     df = load_csv(transaction_path)
+    laps.lap("load")
 
     # Clean headers (strip spaces)
     df.columns = df.columns.str.strip()
@@ -222,6 +306,8 @@ def process_etax(transaction_path, master_dir, output_path=None):
     
     df = df.merge(at_address, left_on=col_company_id, right_on='รหัสบริษัท', how='left', suffixes=('', '_at'))
 
+    laps.lap("merge")
+
     # Calculations
     # User Request: "ยอดขายแล้วถอด Vat7% ออกให้"
     # This means the Input Amount (col_amount) is the Gross Amount (Included VAT)
@@ -294,6 +380,7 @@ def process_etax(transaction_path, master_dir, output_path=None):
     df['total_amount_calc'] = (df['Net Amount_calc'] - df['VAT_calc']).round(2)
     
     # --- END ADJUSTMENT LOGIC ---
+    laps.lap("vat_adjust")
 
     # Page Numbering Logic (Running Page per Invoice)
     # Use col_invoice2 as it's the more "unique" one usually in the template
@@ -375,6 +462,7 @@ def process_etax(transaction_path, master_dir, output_path=None):
     output_df['VAT'] = df['VAT_calc'].apply(format_float)
     output_df['จำนวนเงินสุทธิ'] = df['Net Amount_calc'].apply(format_float)
     output_df['สถานะการจับคู่'] = df['match_status']
+    laps.lap("output_mapping")
 
 
 
@@ -383,6 +471,8 @@ def process_etax(transaction_path, master_dir, output_path=None):
     
     return output_df
 
+@timed("save_to_individual_json", items=len)
+@traced("save_to_individual_json")
 def save_to_individual_json(df_result, output_dir):
     """
     Saves a processed DataFrame into individual JSON files (1 per invoice)
@@ -425,6 +515,8 @@ def save_to_individual_json(df_result, output_dir):
         "TOTAL_NET_PRODUCT": "จำนวนเงินสุทธิ" 
     }
 
+    laps = StageLaps("save_to_individual_json")
+
     # Use DOC_NUMBER as grouping key
     invoice_key = "เลขที่ใบแจ้งหนี้2"
     invoice_buckets = {}
@@ -523,6 +615,8 @@ def save_to_individual_json(df_result, output_dir):
             
         invoice_buckets[doc_no]["ET_INVOICE_DTL"].append(detail_data)
 
+    laps.lap("group")
+
     # Save to JSON
     saved_files = []
     for doc_no, data in invoice_buckets.items():
@@ -531,7 +625,8 @@ def save_to_individual_json(df_result, output_dir):
         with open(save_path, 'w', encoding='utf-8') as f:
             json.dump([data], f, ensure_ascii=False, indent=2)
         saved_files.append(file_name)
-    
+    laps.lap("write")
+
     return saved_files
 
 
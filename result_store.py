@@ -0,0 +1,393 @@
+"""
+result_store.py - Server-side retention of processed upload results.
+Keeps each upload's processed DataFrame under its result ID so exports (and
+later views) reference the ID instead of posting the whole dataset back.
+Entries expire after a sliding TTL and the store is bounded by memory, with
+least-recently-used eviction. With a shared directory every result is also
+written to disk, so any server process (or a restarted one) can serve it;
+memory then acts as a per-process cache in front of the directory.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Result IDs become file names in the shared directory
+_RESULT_ID_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+SWEEP_INTERVAL_SECONDS = 60
+# Filtered / sorted views kept per result (see ResultStore.page)
+VIEWS_PER_RESULT = 8
+
+
+def _write_text(path: str, text: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def frame_bytes(df) -> int:
+    """Approximate in-memory size of a DataFrame (object columns included)."""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class ResultStore:
+    """Thread-safe LRU of processed results with TTL and a memory budget."""
+
+    def __init__(self, ttl_seconds: float = None, max_bytes: int = None, shared_dir: str = None):
+        """
+        Args:
+            shared_dir: Directory shared by all server processes; results are
+                written there and read back by processes that miss in memory.
+                None keeps results in this process only.
+        """
+        self.ttl = Config.RESULT_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.max_bytes = Config.RESULT_STORE_MAX_BYTES if max_bytes is None else max_bytes
+        self.shared_dir = shared_dir or None
+        self._entries = OrderedDict()  # result_id -> {"df", "meta", "size", "expires_at", "key", "views"}
+        self._keys = {}  # dedup key -> result_id
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def put(self, result_id: str, df, meta: dict = None, key: str = None):
+        """
+        Store a result, evicting expired and least-recently-used entries to
+        stay within the memory budget. The newest entry is always kept, even
+        when it alone exceeds the budget.
+
+        Args:
+            key: Optional dedup key (e.g. upload hash + master version) that
+                find() resolves back to this result while it is retained.
+        """
+        meta = dict(meta or {}, created_at=time.time(), rows=len(df), size_bytes=frame_bytes(df))
+        self._cache(result_id, df, meta, key)
+        if self.shared_dir:
+            self._save(result_id, df, meta, key)
+        logger.info(f"Stored result {result_id} ({len(df)} rows, {meta['size_bytes'] / 1024 / 1024:.1f} MB)")
+
+    def get(self, result_id: str):
+        """The stored DataFrame, or None when unknown or expired. Refreshes the TTL."""
+        with self._lock:
+            entry = self._entries.get(result_id)
+            if entry is not None and entry["expires_at"] < time.time():
+                self._remove(result_id)
+                entry = None
+            if entry is not None:
+                entry["expires_at"] = time.time() + self.ttl
+                self._entries.move_to_end(result_id)
+        if entry is None:
+            return self._load(result_id) if self.shared_dir else None
+        self._touch(result_id)
+        return entry["df"]
+
+    def page(self, result_id: str, offset: int = 0, limit: int = 100, sort: str = None,
+             descending: bool = False, status: str = None, q: str = None):
+        """
+        page_frame() of a stored result, or None when unknown or expired.
+
+        The filtered / sorted row order is cached with the result per
+        (status, q, sort, descending), so paging through a view filters and
+        sorts the frame once. Cached views go with the entry: a replaced,
+        deleted, evicted or expired result never serves a stale order.
+        """
+        df = self.get(result_id)
+        if df is None:
+            return None
+        view_key = (status or None, q or None, sort or None, bool(sort and descending))
+        with self._lock:
+            entry = self._entries.get(result_id)
+            views = entry["views"] if entry is not None and entry["df"] is df else None
+            positions = views.get(view_key) if views is not None else None
+            if positions is not None:
+                views.move_to_end(view_key)
+        if positions is None:
+            positions = frame_view(df, sort, descending, status, q)
+            if views is not None:
+                with self._lock:
+                    views[view_key] = positions
+                    while len(views) > VIEWS_PER_RESULT:
+                        views.popitem(last=False)
+        return page_rows(df, positions, offset, limit)
+
+    def find(self, key: str):
+        """result_id stored under a dedup key, or None when unknown or expired."""
+        with self._lock:
+            result_id = self._keys.get(key)
+            entry = self._entries.get(result_id) if result_id else None
+            if entry is not None and entry["expires_at"] < time.time():
+                self._remove(result_id)
+                entry = None
+        if entry is not None:
+            return result_id
+        if self.shared_dir:
+            try:
+                with open(self._key_path(key), encoding="utf-8") as f:
+                    result_id = f.read().strip()
+            except FileNotFoundError:
+                return None
+            if self._disk_fresh(result_id):
+                return result_id
+        return None
+
+    def meta(self, result_id: str) -> dict:
+        with self._lock:
+            entry = self._entries.get(result_id)
+            if entry and entry["expires_at"] >= time.time():
+                return dict(entry["meta"])
+        if self.shared_dir and self._disk_fresh(result_id):
+            return self._read_meta(result_id)
+        return None
+
+    def delete(self, result_id: str) -> bool:
+        with self._lock:
+            removed = self._remove(result_id)
+        if self.shared_dir and self._path(result_id, ".pkl"):
+            removed = self._remove_files(result_id) or removed
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def _cache(self, result_id: str, df, meta: dict, key: str = None):
+        with self._lock:
+            self._remove(result_id)
+            self._entries[result_id] = {
+                "df": df,
+                "meta": meta,
+                "size": meta["size_bytes"],
+                "expires_at": time.time() + self.ttl,
+                "key": key,
+                "views": OrderedDict()  # (status, q, sort, descending) -> frame_view() positions
+            }
+            if key is not None:
+                previous = self._keys.get(key)
+                if previous is not None and previous != result_id:
+                    self._remove(previous)
+                self._keys[key] = result_id
+            self._bytes += meta["size_bytes"]
+            self._evict()
+
+    def _remove(self, result_id: str) -> bool:
+        entry = self._entries.pop(result_id, None)
+        if entry is None:
+            return False
+        self._bytes -= entry["size"]
+        if entry["key"] is not None and self._keys.get(entry["key"]) == result_id:
+            del self._keys[entry["key"]]
+        return True
+
+    def _evict(self):
+        now = time.time()
+        for rid in [rid for rid, e in self._entries.items() if e["expires_at"] < now]:
+            self._remove(rid)
+        while self.max_bytes and self._bytes > self.max_bytes and len(self._entries) > 1:
+            rid = next(iter(self._entries))
+            self._remove(rid)
+            logger.info(f"Evicted result {rid} (store over {self.max_bytes} bytes)")
+
+    # -------------------------------------------------------------------------
+    # Shared directory: <id>.json (meta), <id>.pkl (frame, written last) and
+    # keys/<hash of dedup key> (result_id). The .pkl mtime is the sliding TTL.
+    # -------------------------------------------------------------------------
+    def _path(self, result_id: str, ext: str):
+        if not result_id or not _RESULT_ID_RE.match(result_id):
+            return None
+        return os.path.join(self.shared_dir, f"{result_id}{ext}")
+
+    def _key_path(self, key: str) -> str:
+        return os.path.join(self.shared_dir, "keys", hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    @staticmethod
+    def _replace(path: str, write):
+        """write(temp path), then rename over path: readers never see a partial file."""
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _save(self, result_id: str, df, meta: dict, key: str = None):
+        if not self._path(result_id, ".pkl"):
+            raise ValueError(f"Invalid result ID: {result_id}")
+        try:
+            os.makedirs(os.path.join(self.shared_dir, "keys"), exist_ok=True)
+            meta_json = json.dumps(dict(meta, key=key), ensure_ascii=False, default=str)
+            self._replace(self._path(result_id, ".json"), lambda tmp: _write_text(tmp, meta_json))
+            self._replace(self._path(result_id, ".pkl"), df.to_pickle)
+            if key is not None:
+                self._replace(self._key_path(key), lambda tmp: _write_text(tmp, result_id))
+        except OSError as e:
+            # Still served from memory by this process
+            logger.warning(f"Could not write result {result_id} to {self.shared_dir}: {e}")
+        self._sweep()
+
+    def _disk_fresh(self, result_id: str) -> bool:
+        path = self._path(result_id, ".pkl")
+        try:
+            if path and os.path.getmtime(path) + self.ttl >= time.time():
+                return True
+        except OSError:
+            return False
+        self._remove_files(result_id)
+        return False
+
+    def _read_meta(self, result_id: str) -> dict:
+        try:
+            with open(self._path(result_id, ".json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _load(self, result_id: str):
+        """Read a result another process stored and cache it here."""
+        if not self._disk_fresh(result_id):
+            return None
+        import pandas as pd
+        try:
+            df = pd.read_pickle(self._path(result_id, ".pkl"))
+        except Exception as e:
+            logger.warning(f"Could not read result {result_id}: {e}")
+            return None
+        meta = self._read_meta(result_id)
+        key = meta.pop("key", None)
+        meta.setdefault("size_bytes", frame_bytes(df))
+        self._cache(result_id, df, meta, key)
+        self._touch(result_id)
+        return df
+
+    def _touch(self, result_id: str):
+        path = self._path(result_id, ".pkl") if self.shared_dir else None
+        if path:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    def _remove_files(self, result_id: str) -> bool:
+        removed = False
+        for ext in (".pkl", ".json"):
+            try:
+                os.remove(self._path(result_id, ext))
+                removed = True
+            except (OSError, TypeError):
+                pass
+        return removed
+
+    def _sweep(self):
+        """Delete expired results (and dangling keys) from the shared directory."""
+        now = time.time()
+        if now - self._last_sweep < SWEEP_INTERVAL_SECONDS:
+            return
+        self._last_sweep = now
+        try:
+            for name in os.listdir(self.shared_dir):
+                if name.endswith(".pkl"):
+                    self._disk_fresh(name[:-4])
+            keys_dir = os.path.join(self.shared_dir, "keys")
+            for name in os.listdir(keys_dir):
+                path = os.path.join(keys_dir, name)
+                with open(path, encoding="utf-8") as f:
+                    result_id = f.read().strip()
+                if not os.path.exists(self._path(result_id, ".pkl") or ""):
+                    os.remove(path)
+        except OSError as e:
+            logger.warning(f"Sweeping {self.shared_dir} failed: {e}")
+
+
+# =============================================================================
+# QUERY HELPERS
+# =============================================================================
+STATUS_COLUMN = 'สถานะการจับคู่'
+INVOICE_COLUMN = 'เลขที่ใบแจ้งหนี้2'
+AMOUNT_COLUMNS = ('จำนวนเงิน', 'VAT', 'จำนวนเงินสุทธิ')
+SELLER_COLUMNS = ('ชื่อบริษัท', 'ที่อยู่บริษัท', 'เลขประจำตัวผู้เสียภาษีของบริษัท', 'ชื่อสาขา_บริษัท')
+SEARCH_COLUMNS = ('เลขที่ใบแจ้งหนี้2', 'รหัสลูกค้า', 'ชื่อลูกค้า', 'เลขที่ใบแจ้งหนี้_ชื่อสินค้า_ทะเบียนรถ')
+
+
+def summarize_frame(df) -> dict:
+    """Summary statistics of a processed upload (what /upload returns instead of the rows)."""
+    # Imported here so importing the store (main.py startup) does not load pandas
+    import pandas as pd
+    totals = {}
+    for col in AMOUNT_COLUMNS:
+        if col in df.columns:
+            totals[col] = round(float(pd.to_numeric(df[col], errors='coerce').fillna(0).sum()), 2)
+    first = df.iloc[0] if len(df) > 0 else {}
+    return {
+        "rows": len(df),
+        "invoices": int(df[INVOICE_COLUMN].nunique()) if INVOICE_COLUMN in df.columns else None,
+        "match_counts": df[STATUS_COLUMN].value_counts().to_dict() if STATUS_COLUMN in df.columns else {},
+        "totals": totals,
+        "columns": list(df.columns),
+        "seller": {col: str(first.get(col, '') or '') for col in SELLER_COLUMNS}
+    }
+
+
+def frame_view(df, sort: str = None, descending: bool = False, status: str = None, q: str = None):
+    """
+    Row positions of a processed result after filtering and sorting.
+
+    Args:
+        sort: Column name; numeric-looking columns sort numerically.
+        status: Exact match on the สถานะการจับคู่ column (e.g. "Customer Missing").
+        q: Case-insensitive substring search over invoice / customer / product columns.
+
+    Returns:
+        numpy array of df.iloc positions, in display order
+    """
+    import numpy as np
+    mask = np.ones(len(df), dtype=bool)
+    if status:
+        mask &= (df[STATUS_COLUMN] == status).to_numpy()
+    if q:
+        hits = np.zeros(len(df), dtype=bool)
+        for col in SEARCH_COLUMNS:
+            if col in df.columns:
+                hits |= df[col].astype(str).str.contains(q, case=False, regex=False, na=False).to_numpy()
+        mask &= hits
+    positions = np.flatnonzero(mask)
+    if sort:
+        import pandas as pd
+        if sort not in df.columns:
+            raise ValueError(f"Unknown sort column: {sort}")
+        column = df[sort].iloc[positions]
+        numeric = pd.to_numeric(column, errors='coerce')
+        key = (numeric if numeric.notna().any() else column.astype(str)).reset_index(drop=True)
+        order = key.sort_values(ascending=not descending, kind='stable', na_position='last').index
+        positions = positions[order.to_numpy()]
+    return positions
+
+
+def page_rows(df, positions, offset: int = 0, limit: int = 100) -> dict:
+    """One page of a frame_view() of df: {"offset", "limit", "total" (after filtering), "rows"}."""
+    offset = max(0, offset)
+    page = df.iloc[positions[offset:offset + limit]]
+    return {
+        "offset": offset,
+        "limit": limit,
+        "total": len(positions),
+        "rows": page.fillna('').to_dict(orient='records')
+    }
+
+
+def page_frame(df, offset: int = 0, limit: int = 100, sort: str = None, descending: bool = False,
+               status: str = None, q: str = None) -> dict:
+    """
+    One page of a processed result after filtering and sorting (see
+    frame_view() for the arguments; ResultStore.page() caches the view).
+
+    Returns:
+        {"offset", "limit", "total" (after filtering), "rows"}
+    """
+    return page_rows(df, frame_view(df, sort, descending, status, q), offset, limit)
@@ -0,0 +1,351 @@
+"""
+status_poller.py - Bulk document status polling for submitted e-Tax documents.
+Polls many documents concurrently under a global rate limit. Each document
+follows its own backoff schedule and the polling state lives in SQLite, so
+finished documents drop out and pending ones resume after a restart.
+"""
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+EXPIRED = "expired"
+
+_QUERY_KEYS = ("docNumber", "docDate", "comTaxId", "branch", "internalDocNo", "docType")
+
+# Documents taken by a polling round are hidden from other pollers (other
+# server processes) this long; if the round never finishes they come back due
+CLAIM_SECONDS = 300
+
+
+def response_ok(result: dict) -> bool:
+    """True for a check_status result with a 2xx HTTP status."""
+    http_status = result.get("http_status") if isinstance(result, dict) else None
+    return isinstance(http_status, int) and 200 <= http_status < 300
+
+
+def document_status(result: dict) -> str:
+    """data.documentStatus (or data.docStatus) of a check_status result, or None."""
+    body = result.get("response")
+    data = body.get("data") if isinstance(body, dict) else None
+    if not isinstance(data, dict):
+        return None
+    for key in ("documentStatus", "docStatus"):
+        if data.get(key) not in (None, ""):
+            return str(data[key])
+    return None
+
+
+class RateLimiter:
+    """Thread-safe token bucket limiting calls per second."""
+
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = max(rate, 0.001)
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class StatusPoller:
+    """Persistent, rate-limited status poller driving AxonsETaxService.check_status."""
+
+    def __init__(self, service, db_path: str = None, max_workers: int = None,
+                 rate_per_sec: float = None, schedule: list = None, max_attempts: int = None):
+        self.service = service
+        self.db_path = db_path or Config.STATUS_DB_PATH
+        self.max_workers = max_workers or Config.STATUS_POLL_WORKERS
+        self.schedule = schedule or Config.STATUS_POLL_SCHEDULE
+        self.max_attempts = max_attempts or Config.STATUS_POLL_MAX_ATTEMPTS
+        self.limiter = RateLimiter(rate_per_sec or Config.STATUS_POLL_RATE)
+
+        self._db_lock = threading.Lock()
+        self._db = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    # =========================================================================
+    # STORAGE
+    # =========================================================================
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # Opened on first use so importing the app does not touch the disk
+        if self._db is None:
+            self._db = self._connect()
+        return self._db
+
+    def _connect(self) -> sqlite3.Connection:
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS status_docs (
+                doc_key TEXT PRIMARY KEY,
+                query TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_poll_at REAL NOT NULL,
+                last_status TEXT,
+                last_response TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_status_due ON status_docs (state, next_poll_at)")
+        conn.commit()
+        return conn
+
+    def _execute(self, sql: str, params=()):
+        with self._db_lock:
+            cur = self._conn.execute(sql, params)
+            rows = cur.fetchall()
+            self._conn.commit()
+            return rows
+
+    @staticmethod
+    def _doc_key(query: dict) -> str:
+        return "|".join(str(query.get(k, "")) for k in ("docType", "comTaxId", "branch", "docNumber"))
+
+    # =========================================================================
+    # PUBLIC API
+    # =========================================================================
+    def track(self, documents: list) -> int:
+        """
+        Add submitted documents to the polling set.
+
+        Args:
+            documents: Dicts with the /api/check-status keys
+                (docNumber, docDate, comTaxId, branch, internalDocNo, docType);
+                internalDocNo defaults to Config.INTERNAL_DOC_NO.
+
+        Returns:
+            Number of documents newly tracked (already-known ones are kept as-is).
+        """
+        now = time.time()
+        rows = []
+        for doc in documents:
+            query = {k: str(doc.get(k, "") or "") for k in _QUERY_KEYS}
+            if not query["docNumber"]:
+                continue
+            query["branch"] = query["branch"] or "00000"
+            query["internalDocNo"] = query["internalDocNo"] or Config.INTERNAL_DOC_NO
+            rows.append((self._doc_key(query), json.dumps(query, ensure_ascii=False),
+                         PENDING, now + self.schedule[0], now, now))
+        if not rows:
+            return 0
+
+        with self._db_lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO status_docs "
+                "(doc_key, query, state, next_poll_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            added = self._conn.total_changes - before
+
+        logger.info(f"Tracking {added} new documents for status polling ({len(rows)} requested)")
+        self._wake.set()
+        return added
+
+    def summary(self) -> dict:
+        """Document counts by polling state plus the next due time."""
+        rows = self._execute("SELECT state, COUNT(*) FROM status_docs GROUP BY state")
+        counts = {PENDING: 0, DONE: 0, FAILED: 0, EXPIRED: 0}
+        counts.update({state: n for state, n in rows})
+        next_due = self._execute(
+            "SELECT MIN(next_poll_at) FROM status_docs WHERE state = ?", (PENDING,)
+        )[0][0]
+        return {
+            "total": sum(counts.values()),
+            **counts,
+            "next_poll_in": round(max(0.0, next_due - time.time()), 1) if next_due else None,
+            "running": self._thread is not None and self._thread.is_alive()
+        }
+
+    def list_documents(self, state: str = None, offset: int = 0, limit: int = 100) -> list:
+        """Tracked documents, optionally filtered by state."""
+        sql = "SELECT query, state, attempts, next_poll_at, last_status, last_response FROM status_docs"
+        params = []
+        if state:
+            sql += " WHERE state = ?"
+            params.append(state)
+        sql += " ORDER BY created_at, doc_key LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        return [
+            {
+                **json.loads(query),
+                "state": st,
+                "attempts": attempts,
+                "next_poll_at": next_poll_at,
+                "last_status": last_status,
+                "last_response": json.loads(last_response) if last_response else None
+            }
+            for query, st, attempts, next_poll_at, last_status, last_response in self._execute(sql, params)
+        ]
+
+    def poll_due(self, limit: int = None) -> int:
+        """
+        Poll every pending document whose next_poll_at has passed. The
+        documents are claimed first, so concurrent pollers split them.
+
+        Returns:
+            Number of documents polled.
+        """
+        limit = limit or self.max_workers * 50
+        now = time.time()
+        due = self._execute(
+            "UPDATE status_docs SET next_poll_at = ? WHERE doc_key IN ("
+            "SELECT doc_key FROM status_docs WHERE state = ? AND next_poll_at <= ? "
+            "ORDER BY next_poll_at LIMIT ?) RETURNING doc_key, query, attempts",
+            (now + CLAIM_SECONDS, PENDING, now, limit)
+        )
+        if not due:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="status-poll") as pool:
+            list(pool.map(lambda row: self._poll_one(*row), due))
+        return len(due)
+
+    def check_now(self, query: dict) -> tuple:
+        """
+        Query one document right away (under the poller's rate limit).
+
+        Returns:
+            (state, status_text) as for polled documents; status_text is None
+            when a 2xx response reports no status for the document.
+
+        Raises:
+            Exception: The status could not be read (request failed or the
+                upstream answered with a non-2xx status).
+        """
+        self.limiter.acquire()
+        result = self.service.check_status(
+            doc_number=query["docNumber"],
+            doc_date=query["docDate"],
+            com_tax_id=query["comTaxId"],
+            branch=query["branch"],
+            internal_doc_no=query["internalDocNo"],
+            doc_type=query["docType"]
+        )
+        if not response_ok(result):
+            raise Exception(f"Status check returned HTTP {result.get('http_status')}: {result.get('response')}")
+        return self._classify(result)
+
+    def start(self):
+        """Run the polling loop in a background thread (idempotent)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="status-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # =========================================================================
+    # INTERNALS
+    # =========================================================================
+    def _run(self):
+        logger.info("Status poller started")
+        while not self._stop.is_set():
+            try:
+                polled = self.poll_due()
+            except Exception as e:
+                logger.error(f"Status polling round failed: {e}")
+                polled = 0
+            if polled:
+                continue
+
+            next_due = self._execute(
+                "SELECT MIN(next_poll_at) FROM status_docs WHERE state = ?", (PENDING,)
+            )[0][0]
+            wait = 30.0 if next_due is None else min(30.0, max(1.0, next_due - time.time()))
+            self._wake.wait(wait)
+            self._wake.clear()
+        logger.info("Status poller stopped")
+
+    def _poll_one(self, doc_key: str, query_json: str, attempts: int):
+        query = json.loads(query_json)
+        self.limiter.acquire()
+        attempts += 1
+        try:
+            result = self.service.check_status(
+                doc_number=query["docNumber"],
+                doc_date=query["docDate"],
+                com_tax_id=query["comTaxId"],
+                branch=query["branch"],
+                internal_doc_no=query["internalDocNo"],
+                doc_type=query["docType"]
+            )
+            state, status = self._classify(result)
+            response = json.dumps(result, ensure_ascii=False)
+        except Exception as e:
+            logger.warning(f"[{query['docNumber']}] Status poll attempt {attempts} failed: {e}")
+            state, status, response = PENDING, None, json.dumps({"error": str(e)}, ensure_ascii=False)
+
+        now = time.time()
+        if state == PENDING and attempts >= self.max_attempts:
+            state = EXPIRED
+        next_poll_at = now + self._next_delay(attempts) if state == PENDING else now
+
+        self._execute(
+            "UPDATE status_docs SET state = ?, attempts = ?, next_poll_at = ?, last_status = ?, "
+            "last_response = ?, updated_at = ? WHERE doc_key = ?",
+            (state, attempts, next_poll_at, status, response, now, doc_key)
+        )
+        if state != PENDING:
+            logger.info(f"[{query['docNumber']}] Status polling finished: {state} ({status})")
+
+    def _next_delay(self, attempts: int) -> float:
+        """Backoff delay after the given number of attempts, with +/-10% jitter."""
+        base = self.schedule[min(attempts, len(self.schedule) - 1)]
+        return base * random.uniform(0.9, 1.1)
+
+    @staticmethod
+    def _classify(result: dict) -> tuple:
+        """
+        Map a check_status result to (state, status_text).
+        Only a 2xx response says anything about the document, and only through
+        data.documentStatus / data.docStatus: the top-level "status" is the
+        outcome of the API call itself. Anything else (throttling, errors, no
+        document status yet) leaves the document pending, polled again later.
+        """
+        status = document_status(result) if response_ok(result) else None
+        if status is None:
+            return PENDING, None
+        normalized = status.strip().upper()
+        if normalized in Config.STATUS_DONE_VALUES:
+            return DONE, status
+        if normalized in Config.STATUS_FAILED_VALUES:
+            return FAILED, status
+        return PENDING, status
@@ -0,0 +1,266 @@
+"""
+submission_archive.py - Background archive of submitted ETDA payloads.
+Keeps archive I/O off the submit path: metadata is stored compressed and the
+PDF is stored once as binary, referenced from the metadata record.
+"""
+import atexit
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from config import Config
+import tracing
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+
+class SubmissionArchive:
+    """Queue-backed writer for the submitted_json archive."""
+
+    PDF_SUBDIR = "pdf"
+
+    # Unreferenced PDFs younger than this are kept: with several server
+    # processes sharing the directory, another process may have stored (or
+    # reused) the PDF while its metadata record is still in its write queue
+    MIN_PDF_GRACE_SECONDS = 3600
+
+    def __init__(self, archive_dir: str = None, compression: str = None,
+                 retention_days: int = None, queue_size: int = None, pdf_grace_seconds: float = None):
+        self.archive_dir = archive_dir or Config.SUBMITTED_JSON_DIR
+        self.pdf_dir = os.path.join(self.archive_dir, self.PDF_SUBDIR)
+        self.retention_days = Config.ARCHIVE_RETENTION_DAYS if retention_days is None else retention_days
+        self.compression = (compression or Config.ARCHIVE_COMPRESSION).lower()
+        if self.compression == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed, falling back to gzip archive compression")
+            self.compression = "gzip"
+        if pdf_grace_seconds is None:
+            pdf_grace_seconds = max(Config.ARCHIVE_COMPACT_INTERVAL_HOURS * 3600, self.MIN_PDF_GRACE_SECONDS)
+        self.pdf_grace_seconds = pdf_grace_seconds
+
+        self._queue = queue.Queue(maxsize=queue_size or Config.ARCHIVE_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+        # First compaction one interval after start, not on the first write of every process
+        self._last_compaction = time.time()
+
+    # =========================================================================
+    # PUBLIC API
+    # =========================================================================
+    def enqueue(self, doc_id: str, head_bytes: bytes, base64_pdf) -> None:
+        """
+        Hand a submission to the background writer.
+        Blocks only when the queue is full, which throttles producers instead
+        of dropping archive records.
+        """
+        self._ensure_started()
+        # The write is traced as a child of the submitting span
+        self._queue.put((doc_id, head_bytes, base64_pdf, tracing.current_span()))
+
+    def flush(self, timeout: float = None) -> None:
+        """Wait until every queued record has been written."""
+        if self._thread is None:
+            return
+        if timeout is None:
+            self._queue.join()
+            return
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+
+    def write(self, doc_id: str, head_bytes: bytes, base64_pdf) -> str:
+        """
+        Write one record synchronously.
+
+        Returns:
+            Path of the metadata file.
+        """
+        os.makedirs(self.pdf_dir, exist_ok=True)
+
+        pdf_ref = None
+        if isinstance(base64_pdf, str) and base64_pdf:
+            pdf_ref = self._store_pdf(base64_pdf)
+
+        # Splice the reference in place of the Document field
+        sep = b"" if head_bytes == b"{}" else b","
+        record = b"".join((head_bytes[:-1], sep, b'"DocumentRef":', json.dumps(pdf_ref).encode("ascii"), b"}"))
+
+        meta_path = os.path.join(self.archive_dir, f"{doc_id}_submitted.json{self._suffix()}")
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self._compress(record))
+        os.replace(tmp_path, meta_path)
+        return meta_path
+
+    def read(self, doc_id: str) -> tuple:
+        """
+        Load an archived record.
+
+        Returns:
+            (metadata_json_bytes, pdf_bytes or None)
+        """
+        for suffix in (".gz", ".zst", ""):
+            path = os.path.join(self.archive_dir, f"{doc_id}_submitted.json{suffix}")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    record = self._decompress(f.read(), suffix)
+                pdf_ref = json.loads(record).get("DocumentRef")
+                pdf = None
+                if pdf_ref:
+                    with open(os.path.join(self.archive_dir, pdf_ref), "rb") as f:
+                        pdf = f.read()
+                return record, pdf
+        raise FileNotFoundError(f"No archived submission for {doc_id}")
+
+    def compact(self, now: float = None) -> dict:
+        """
+        Apply the retention policy.
+        Deletes metadata records older than retention_days and PDFs that are
+        no longer referenced by any remaining record and were not stored or
+        reused within pdf_grace_seconds. When a record cannot be read its
+        references are unknown, so no PDFs are deleted that run.
+        """
+        now = now or time.time()
+        removed_records = 0
+        removed_pdfs = 0
+        if not os.path.isdir(self.archive_dir):
+            return {"removed_records": 0, "removed_pdfs": 0}
+
+        cutoff = now - self.retention_days * 86400 if self.retention_days > 0 else None
+        referenced = set()
+        unreadable = 0
+        for name in os.listdir(self.archive_dir):
+            path = os.path.join(self.archive_dir, name)
+            if "_submitted.json" not in name or not os.path.isfile(path) or name.endswith(".tmp"):
+                continue
+            if cutoff is not None and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed_records += 1
+                continue
+            try:
+                with open(path, "rb") as f:
+                    record = json.loads(self._decompress(f.read(), os.path.splitext(name)[1]))
+                if record.get("DocumentRef"):
+                    referenced.add(os.path.basename(record["DocumentRef"]))
+            except Exception as e:
+                logger.warning(f"Skipping unreadable archive record {name}: {e}")
+                unreadable += 1
+
+        if unreadable:
+            logger.warning(f"Keeping all archived PDFs: {unreadable} record(s) could not be read")
+        elif os.path.isdir(self.pdf_dir):
+            for name in os.listdir(self.pdf_dir):
+                path = os.path.join(self.pdf_dir, name)
+                if not name.endswith(".pdf") or name in referenced:
+                    continue
+                try:
+                    if os.path.getmtime(path) > now - self.pdf_grace_seconds:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                removed_pdfs += 1
+
+        self._last_compaction = now
+        logger.info(f"Archive compaction removed {removed_records} records and {removed_pdfs} PDFs")
+        return {"removed_records": removed_records, "removed_pdfs": removed_pdfs}
+
+    # =========================================================================
+    # WRITER THREAD
+    # =========================================================================
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="submission-archive", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        interval = Config.ARCHIVE_COMPACT_INTERVAL_HOURS * 3600
+        while True:
+            try:
+                doc_id, head_bytes, base64_pdf, parent_span = self._queue.get(timeout=60)
+            except queue.Empty:
+                doc_id = None
+            if doc_id is not None:
+                try:
+                    with tracing.span("archive.write", parent=parent_span, doc_id=doc_id):
+                        path = self.write(doc_id, head_bytes, base64_pdf)
+                    logger.debug(f"Archived submission payload to {path}")
+                except Exception as e:
+                    logger.warning(f"Failed to archive submission payload for {doc_id}: {e}")
+                finally:
+                    self._queue.task_done()
+
+            if interval > 0 and time.time() - self._last_compaction > interval:
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.warning(f"Archive compaction failed: {e}")
+
+    # =========================================================================
+    # HELPERS
+    # =========================================================================
+    def _store_pdf(self, base64_pdf: str) -> str:
+        """Decode and store a PDF under its content hash; returns the relative ref."""
+        pdf_bytes = base64.b64decode(base64_pdf)
+        digest = hashlib.sha256(pdf_bytes).hexdigest()
+        pdf_path = os.path.join(self.pdf_dir, f"{digest}.pdf")
+        try:
+            # A reused PDF counts as freshly stored for compaction's grace period
+            os.utime(pdf_path)
+        except FileNotFoundError:
+            tmp_path = f"{pdf_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(pdf_bytes)
+            os.replace(tmp_path, pdf_path)
+        return f"{self.PDF_SUBDIR}/{digest}.pdf"
+
+    def _suffix(self) -> str:
+        return {"gzip": ".gz", "zstd": ".zst"}.get(self.compression, "")
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == "gzip":
+            return gzip.compress(data, compresslevel=6)
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor(level=3).compress(data)
+        return data
+
+    @staticmethod
+    def _decompress(data: bytes, suffix: str) -> bytes:
+        if suffix == ".gz":
+            return gzip.decompress(data)
+        if suffix == ".zst":
+            if zstandard is None:
+                raise RuntimeError("zstandard is required to read .zst archive records")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return data
+
+
+_default_archive = None
+_default_lock = threading.Lock()
+
+
+def get_default_archive() -> SubmissionArchive:
+    """Process-wide archive writer shared by every AxonsETaxService instance."""
+    global _default_archive
+    if _default_archive is None:
+        with _default_lock:
+            if _default_archive is None:
+                _default_archive = SubmissionArchive()
+                # Give queued records a chance to land on interpreter shutdown
+                atexit.register(_default_archive.flush, 10)
+    return _default_archive
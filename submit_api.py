@@ -0,0 +1,303 @@
+"""
+submit_api.py - AXONS E-TAX submission endpoints (PDF, submit, status, batch
+submission and background jobs) as a router shared by the full server
+(main.py) and the submission-only service (submit_main.py).
+Deliberately free of pandas and the upload processing stack, so a process
+serving only these routes starts quickly.
+"""
+import asyncio
+import json
+import logging
+import os
+import traceback
+from contextlib import asynccontextmanager
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+import tracing
+from API_AXONS import AxonsETaxService
+from config import Config
+from status_poller import StatusPoller, FAILED as STATUS_FAILED
+from jobs import COMPLETED, FAILED, JobConflict, JobManager
+
+logger = logging.getLogger(__name__)
+
+etax_service = AxonsETaxService()
+status_poller = StatusPoller(etax_service)
+job_manager = JobManager()
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Background work of every app serving these routes (main.py and
+    submit_main.py): documents left pending by an earlier server process
+    are polled again without waiting for a new /api/check-status-bulk call,
+    and the job workers resume queued or interrupted jobs.
+    """
+    status_poller.start()
+    job_manager.start()
+    yield
+    job_manager.shutdown()
+    status_poller.stop()
+
+router = APIRouter(lifespan=lifespan)
+
+@router.post("/api/generate-pdf")
+async def api_generate_pdf(request: Request):
+    """Generate PDF from ET_INVOICE JSON."""
+    try:
+        data = await request.json()
+        # Support both direct ET_INVOICE and array-wrapped format
+        if isinstance(data, list) and len(data) > 0:
+            et_invoice = data[0]
+        else:
+            et_invoice = data
+
+        base64_pdf = etax_service.generate_pdf(et_invoice)
+        doc_number = et_invoice.get("ET_INVOICE_HDR", [{}])[0].get("DOC_NUMBER", "unknown")
+
+        return {
+            "status": "success",
+            "doc_number": doc_number,
+            "pdf_base64": base64_pdf,
+            "pdf_length": len(base64_pdf)
+        }
+    except Exception as e:
+        logger.error(f"Generate PDF error: {e}")
+        logger.error(traceback.format_exc())
+        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+
+@router.post("/api/submit")
+async def api_submit(request: Request):
+    """Full pipeline: Generate PDF → Transform to ETDA v2.0 → Submit."""
+    try:
+        data = await request.json()
+        if isinstance(data, list) and len(data) > 0:
+            et_invoice = data[0]
+        else:
+            et_invoice = data
+
+        result = etax_service.process_and_submit(et_invoice)
+        status_code = 200 if result["status"] == "success" else 500
+        return JSONResponse(status_code=status_code, content=result)
+    except Exception as e:
+        logger.error(f"Submit error: {e}")
+        logger.error(traceback.format_exc())
+        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+
+@router.post("/api/check-status")
+async def api_check_status(request: Request):
+    """Check document submission status."""
+    try:
+        data = await request.json()
+        result = etax_service.check_status(
+            doc_number=data.get("docNumber", ""),
+            doc_date=data.get("docDate", ""),
+            com_tax_id=data.get("comTaxId", ""),
+            branch=data.get("branch", "00000"),
+            internal_doc_no=data.get("internalDocNo", ""),
+            doc_type=data.get("docType", "388")
+        )
+        return result
+    except Exception as e:
+        logger.error(f"Check status error: {e}")
+        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+
+@router.post("/api/check-status-bulk")
+async def api_check_status_bulk(request: Request):
+    """Add submitted documents to the background status poller."""
+    try:
+        data = await request.json()
+        documents = data.get("documents", []) if isinstance(data, dict) else data
+        added = status_poller.track(documents)
+        status_poller.start()
+        return {"status": "success", "tracked": added, "summary": status_poller.summary()}
+    except Exception as e:
+        logger.error(f"Bulk status error: {e}")
+        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+
+@router.get("/api/check-status-bulk")
+async def api_check_status_bulk_summary(state: str = None, offset: int = 0, limit: int = 100):
+    """Polling progress plus a page of tracked documents."""
+    try:
+        return {
+            "status": "success",
+            "summary": status_poller.summary(),
+            "documents": status_poller.list_documents(state, offset, limit)
+        }
+    except Exception as e:
+        logger.error(f"Bulk status summary error: {e}")
+        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+
+def _upstream_result(path):
+    """
+    Result for a batch document an earlier run may have posted before dying
+    or timing out, or None when it should be submitted: only a 2xx status
+    response without a document status says the upstream does not have it.
+    A document the upstream reports on is not posted again (a rejected one
+    is recorded as an error), and neither is one whose status cannot be
+    read; the next retry checks it again.
+    """
+    name = os.path.basename(path)
+    try:
+        query = etax_service.status_query_for_file(path)
+        state, status = status_poller.check_now(query)
+    except Exception as e:
+        logger.warning(f"Upstream status of {name} unknown, not resubmitting: {e}")
+        return {"status": "error", "doc_number": name, "error": f"Upstream status unknown, not resubmitted: {e}"}
+    if status is None:
+        return None
+    if state == STATUS_FAILED:
+        return {"status": "error", "doc_number": query["docNumber"], "upstream_status": status,
+                "error": f"Rejected upstream ({status}), not resubmitted"}
+    return {"status": "success", "doc_number": query["docNumber"], "already_submitted": True,
+            "upstream_status": status, "status_query": query}
+
+def run_submit_batch(job, json_dir=None):
+    """
+    Job body for /api/submit-batch: submit every JSON file and record results.
+    Results are keyed by file, so a run resumed after a restart skips the
+    documents that were already submitted successfully. Each document is
+    marked in flight before it is posted; on a retry, documents an earlier
+    run attempted are looked up upstream first so they are not submitted
+    twice.
+    """
+    files = etax_service.list_batch_files(json_dir)
+    job.set_total(len(files))
+
+    with tracing.start_trace("submit_batch", trace_id=job.id, documents=len(files)):
+        for path in files:
+            key = os.path.basename(path)
+            if job.completed(key):
+                continue
+            if job.attempts > 1 and job.was_attempted(key):
+                known = _upstream_result(path)
+                if known is not None:
+                    job.add_result(known, key=key)
+                    continue
+            job.mark_in_flight(key)
+            job.add_result(etax_service.process_and_submit_file(path), key=key)
+
+    # Follow accepted submissions (including earlier runs of this job) through to their final status
+    status_queries = [r["status_query"] for r in list(job.results) if r.get("status_query")]
+    if status_queries:
+        status_poller.track(status_queries)
+        status_poller.start()
+
+# Registered on import so jobs recovered from the job store can run again once
+# the lifespan starts the workers (main.py adds the upload-batch handler;
+# submission-only workers never claim those jobs)
+job_manager.register("submit-batch", run_submit_batch)
+
+@router.post("/api/submit-batch")
+async def api_submit_batch(request: Request):
+    """Start a background batch submission of the JSON files in output_json."""
+    try:
+        body = await request.json()
+        json_dir = body.get("json_dir", None)
+
+        # One active batch per directory: two jobs submitting the same files
+        # would post every document twice
+        resource = os.path.normcase(os.path.realpath(json_dir or Config.OUTPUT_JSON_DIR))
+        job = job_manager.submit("submit-batch", {"json_dir": json_dir}, resource=f"submit-batch:{resource}")
+        return {"status": "queued", "job_id": job.id, "progress": job.progress()}
+    except JobConflict as e:
+        return JSONResponse(status_code=409, content={"status": "error", "message": str(e), "job_id": e.job_id})
+    except Exception as e:
+        logger.error(f"Batch submit error: {e}")
+        logger.error(traceback.format_exc())
+        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+
+@router.get("/api/jobs")
+async def api_list_jobs():
+    """Progress of recent background jobs (newest first)."""
+    return {"status": "success", "jobs": await run_in_threadpool(job_manager.list)}
+
+@router.get("/api/jobs/{job_id}")
+async def api_job_progress(job_id: str):
+    """Counts, throughput and ETA for one job."""
+    progress = await run_in_threadpool(job_manager.progress, job_id)
+    if progress is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"Job not found: {job_id}"})
+    return progress
+
+@router.get("/api/jobs/{job_id}/results")
+async def api_job_results(job_id: str, offset: int = 0, limit: int = 100, status: str = None):
+    """Paginated per-document results of a job."""
+    page = await run_in_threadpool(job_manager.page, job_id, max(0, offset), max(1, min(limit, 1000)), status)
+    if page is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"Job not found: {job_id}"})
+    return page
+
+@router.get("/api/jobs/{job_id}/events")
+async def api_job_events(job_id: str, request: Request, cursor: int = 0):
+    """
+    Server-sent events stream of a job: one "result" event per finished
+    document, periodic "progress" events and a final "done" event.
+    Pass cursor (or Last-Event-ID) to resume after a reconnect.
+    """
+    progress = await run_in_threadpool(job_manager.progress, job_id)
+    if progress is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"Job not found: {job_id}"})
+
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        cursor = int(last_event_id)
+
+    async def event_stream():
+        # Event IDs are result positions + 1, i.e. the cursor to resume from
+        last_seq = max(0, cursor) - 1
+        last_progress = 0.0
+        while True:
+            if await request.is_disconnected():
+                break
+            # Only the job row and the results not sent yet are read each
+            # round; the job may be running in another worker process
+            progress = await run_in_threadpool(job_manager.progress, job_id)
+            batch = await run_in_threadpool(job_manager.results_after, job_id, last_seq)
+            for seq, result in batch:
+                last_seq = seq
+                yield f"id: {seq + 1}\nevent: result\ndata: {json.dumps(result, ensure_ascii=False)}\n\n"
+
+            now = asyncio.get_running_loop().time()
+            if batch or now - last_progress >= 1.0:
+                last_progress = now
+                yield f"event: progress\ndata: {json.dumps(progress)}\n\n"
+
+            if progress["status"] in (COMPLETED, FAILED) and not batch:
+                yield f"event: done\ndata: {json.dumps(progress)}\n\n"
+                break
+            if not batch:
+                await asyncio.sleep(0.25)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/api/transform-preview")
+async def api_transform_preview(request: Request):
+    """Preview ETDA v2.0 transformation without submitting (for debugging)."""
+    try:
+        data = await request.json()
+        if isinstance(data, list) and len(data) > 0:
+            et_invoice = data[0]
+        else:
+            et_invoice = data
+
+        # Transform with a dummy PDF placeholder
+        etda_json, endpoint_key = etax_service.transform_to_etda(
+            et_invoice, "<<PLACEHOLDER_BASE64_PDF>>"
+        )
+
+        return {
+            "status": "success",
+            "endpoint_key": endpoint_key,
+            "etda_preview": etda_json
+        }
+    except Exception as e:
+        logger.error(f"Transform preview error: {e}")
+        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
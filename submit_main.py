@@ -0,0 +1,50 @@
+"""
+submit_main.py - Submission-only service.
+Serves the AXONS E-TAX endpoints (/api/submit, /api/check-status, batch
+submission and job progress) without uploads, exports or the pandas
+processing stack, so workers start in well under a second. Batch jobs go
+through the same job store as the full server (main.py); these workers only
+claim submit-batch jobs.
+
+Run: python submit_main.py (or uvicorn submit_main:app --workers N)
+"""
+import logging
+
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
+
+import metrics
+from config import Config
+from submit_api import router as submit_router
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = FastAPI()
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+app.include_router(submit_router)
+
+@app.get("/test")
+async def test_endpoint():
+    return {"status": "ok", "mode": "submit"}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Stage timings, counters and in-flight gauges in Prometheus text format."""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    if Config.WEB_WORKERS > 1:
+        uvicorn.run("submit_main:app", host="0.0.0.0", port=Config.SUBMIT_SERVICE_PORT, workers=Config.WEB_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=Config.SUBMIT_SERVICE_PORT)
@@ -0,0 +1,255 @@
+"""
+synth_data.py - Synthetic fuel-report transactions and Master files.
+Produces files shaped like รายงานใบเติมน้ำมัน.csv plus Mapping Vendor Code /
+Customer_Tax ID / AT Address masters, with no real customer data, for
+benchmarks, stress runs and test fixtures.
+
+Usage:
+    python synth_data.py --out synth --rows 100000 --invoices-per-file 5000 \\
+        --lines-per-invoice 5 --miss-rate 0.02 --encoding tis-620 \\
+        --sci-notation 0.3 --seed 42
+"""
+import argparse
+import csv
+import os
+import random
+from datetime import date, timedelta
+
+from config import Config
+
+TRANSACTION_BASENAME = "รายงานใบเติมน้ำมัน"
+
+TRANSACTION_HEADER = [
+    "เลขที่ใบแจ้งหนี้", "เลขที่ใบแจ้งหนี้2", "วันที่ใบแจ้งหนี้", "รหัสลูกค้า", "รหัสบริษัท",
+    "ชื่อสินค้า", "ทะเบียนรถ", "ปริมาณ", "ราคาต่อหน่วย", "จำนวนเงิน"
+]
+MAPPING_HEADER = ["Vendor", "AT : Customer Code"]
+CUSTOMER_HEADER = [
+    "Customer Code", "Name", "Address", "Address 1", "Address 2", "ที่อยู่",
+    "เลขประจำตัวผู้เสียภาษี", "สาขาที่", "ชื่อสาขา"
+]
+AT_HEADER = ["รหัสบริษัท", "ชื่อบริษัท", "ที่อยู่", "ที่อยู่AT", "เลขประจำตัวผู้เสียภาษี", "สาขาที่"]
+
+# (product name, unit price range in THB)
+PRODUCTS = [
+    ("น้ำมันดีเซล B7", (29.50, 33.50)),
+    ("น้ำมันดีเซล B20", (28.50, 32.00)),
+    ("แก๊สโซฮอล์ 91", (34.00, 38.50)),
+    ("แก๊สโซฮอล์ 95", (34.50, 39.00)),
+    ("แก๊สโซฮอล์ E20", (32.00, 36.50)),
+    ("น้ำมันหล่อลื่น", (120.00, 350.00)),
+]
+COMPANY_PREFIXES = ["บริษัท", "ห้างหุ้นส่วนจำกัด"]
+COMPANY_WORDS = ["ขนส่ง", "โลจิสติกส์", "ทรานสปอร์ต", "เดินรถ", "ค้าวัสดุ", "ก่อสร้าง", "เกษตรภัณฑ์", "พัฒนา"]
+COMPANY_NAMES = ["สยาม", "รุ่งเรือง", "ศรีสุข", "เจริญชัย", "ทองคำ", "มั่นคง", "สุวรรณ", "พัฒนากิจ", "ไทยรุ่ง"]
+PLATE_LETTERS = "กขคงจฉชซฌญฎฏฐฑฒณดตถทธนบปผฝพฟภมยรลวศษสหฬอฮ"
+
+
+def thai_tax_id(rng: random.Random) -> str:
+    """Random 13-digit juristic tax ID with a valid check digit."""
+    digits = [0, 1, 0, 5] + [rng.randint(0, 9) for _ in range(8)]
+    total = sum(d * (13 - i) for i, d in enumerate(digits))
+    return "".join(map(str, digits)) + str((11 - total % 11) % 10)
+
+
+def to_scientific(value: str) -> str:
+    """Render a numeric ID the way Excel exports it, e.g. 6.80361000123E+11 (lossless)."""
+    digits = value.lstrip("0") or "0"
+    mantissa = digits[0] + ("." + digits[1:].rstrip("0") if digits[1:].rstrip("0") else "")
+    return f"{mantissa}E+{len(digits) - 1}"
+
+
+def load_areas(path: str = None) -> list:
+    """(subdistrict, district, province, postcode) tuples from the gazetteer CSV."""
+    path = path or Config.GAZETTEER_PATH
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return [(row["subdistrict_name"], row["district_name"], row["province_name"], row["postcode"])
+                for row in csv.DictReader(f) if row["subdistrict_code"]]
+
+
+class SyntheticDataset:
+    """Deterministic generator for one dataset (same seed, same files)."""
+
+    def __init__(self, rows: int = 1000, invoices_per_file: int = 0, lines_per_invoice: int = 5,
+                 miss_rate: float = 0.0, seller_miss_rate: float = 0.0, encoding: str = "utf-8",
+                 sci_notation: float = 0.0, buddhist_era: bool = True, customers: int = None,
+                 sellers: int = 3, start_date: date = date(2025, 12, 1), days: int = 28, seed: int = 0):
+        """
+        Args:
+            rows: Total transaction rows across all files.
+            invoices_per_file: Split transactions into files of this many invoices (0 = one file).
+            lines_per_invoice: Mean lines per invoice (actual count varies 1..2x-1).
+            miss_rate: Fraction of customers absent from the Customer_Tax ID master.
+            seller_miss_rate: Fraction of invoices whose company code is absent from AT Address.
+            encoding: "utf-8" (written with BOM) or "tis-620".
+            sci_notation: Fraction of rows whose IDs are written as 6.80361000123E+11.
+            buddhist_era: Write invoice dates in B.E. (2568) instead of C.E.
+        """
+        self.rows = rows
+        self.invoices_per_file = invoices_per_file
+        self.lines_per_invoice = max(1, lines_per_invoice)
+        self.miss_rate = miss_rate
+        self.seller_miss_rate = seller_miss_rate
+        self.encoding = "utf-8-sig" if encoding.lower().replace("_", "-") in ("utf-8", "utf8", "utf-8-sig") else encoding
+        self.sci_notation = sci_notation
+        self.buddhist_era = buddhist_era
+        self.customers = customers or max(50, rows // 200)
+        self.sellers = max(1, sellers)
+        self.start_date = start_date
+        self.days = max(1, days)
+        self.rng = random.Random(seed)
+        self.areas = load_areas()
+
+    # =========================================================================
+    # MASTERS
+    # =========================================================================
+    def _address(self) -> str:
+        subdistrict, district, province, postcode = self.rng.choice(self.areas)
+        if len(postcode) == 2:
+            postcode += self.rng.choice(["000", "110", "120", "130", "150", "170"])
+        house = f"{self.rng.randint(1, 999)}/{self.rng.randint(1, 99)}"
+        if province == "กรุงเทพมหานคร":
+            return f"{house} แขวง{subdistrict} เขต{district} {province} {postcode}"
+        return f"{house} ม.{self.rng.randint(1, 12)} ต.{subdistrict} อ.{district} จ.{province} {postcode}"
+
+    def _company_name(self) -> str:
+        return (f"{self.rng.choice(COMPANY_PREFIXES)} {self.rng.choice(COMPANY_NAMES)}"
+                f"{self.rng.choice(COMPANY_WORDS)} จำกัด")
+
+    def write_masters(self, master_dir: str) -> dict:
+        os.makedirs(master_dir, exist_ok=True)
+        # Half the customers trade under a vendor code mapped to their AT customer code
+        self.vendor_codes = []
+        mapping, customers = [], []
+        for c in range(self.customers):
+            customer_code = f"14{c:05d}"
+            if c % 2 == 0:
+                vendor = f"{800000 + c}"
+                mapping.append([vendor, customer_code])
+                self.vendor_codes.append(vendor)
+            else:
+                self.vendor_codes.append(customer_code)
+            if self.rng.random() < self.miss_rate:
+                continue
+            branch = 0 if self.rng.random() < 0.7 else self.rng.randint(1, 30)
+            address = self._address()
+            customers.append([
+                customer_code, self._company_name(), address, "", "", address,
+                thai_tax_id(self.rng), f"{branch:05d}", "สำนักงานใหญ่" if branch == 0 else f"สาขาที่ {branch:05d}"
+            ])
+
+        self.seller_codes = [f"{100400 + s}" for s in range(self.sellers)]
+        sellers = [
+            [code, f"บริษัท แอ๊ดว้านซ์ทรานสปอร์ต {s + 1} จำกัด", self._address(), "AT",
+             thai_tax_id(self.rng), f"สาขาที่ {s + 1:05d}"]
+            for s, code in enumerate(self.seller_codes)
+        ]
+
+        paths = {
+            "mapping": os.path.join(master_dir, "Mapping Vendor Code.csv"),
+            "customer_tax": os.path.join(master_dir, "Customer_Tax ID.csv"),
+            "at_address": os.path.join(master_dir, "AT Address.csv"),
+        }
+        self._write_csv(paths["mapping"], MAPPING_HEADER, mapping)
+        self._write_csv(paths["customer_tax"], CUSTOMER_HEADER, customers)
+        self._write_csv(paths["at_address"], AT_HEADER, sellers)
+        return paths
+
+    # =========================================================================
+    # TRANSACTIONS
+    # =========================================================================
+    def _invoices(self):
+        """Yield lists of transaction rows, one list per invoice, until self.rows is reached."""
+        produced, inv = 0, 0
+        yy = (self.start_date.year + 543) % 100
+        while produced < self.rows:
+            lines = min(self.rng.randint(1, 2 * self.lines_per_invoice - 1), self.rows - produced)
+            doc_no = f"{yy:02d}{self.start_date.month:02d}61{inv:06d}"
+            day = self.start_date + timedelta(days=self.rng.randrange(self.days))
+            year = day.year + 543 if self.buddhist_era else day.year
+            doc_date = f"{year}-{day.month:02d}-{day.day:02d}"
+            customer = self.rng.choice(self.vendor_codes)
+            seller = (f"{900000 + inv % 1000}" if self.rng.random() < self.seller_miss_rate
+                      else self.rng.choice(self.seller_codes))
+            plate = f"{self.rng.randint(1, 99)}-{self.rng.randint(1000, 9999)}"
+
+            rows = []
+            for _ in range(lines):
+                product, (low, high) = self.rng.choice(PRODUCTS)
+                qty = round(self.rng.uniform(10, 400), 2)
+                price = round(self.rng.uniform(low, high), 3)
+                ids = [doc_no, doc_no, customer, seller]
+                if self.sci_notation and self.rng.random() < self.sci_notation:
+                    ids = [to_scientific(v) for v in ids]
+                rows.append([ids[0], ids[1], doc_date, ids[2], ids[3], product, plate,
+                             f"{qty:.2f}", f"{price:.3f}", f"{qty * price:.2f}"])
+            yield rows
+            produced += lines
+            inv += 1
+
+    def write_transactions(self, out_dir: str) -> list:
+        """Write transaction files; returns their paths."""
+        os.makedirs(out_dir, exist_ok=True)
+        paths, writer, handle, in_file = [], None, None, 0
+        try:
+            for invoice_rows in self._invoices():
+                if writer is None or (self.invoices_per_file and in_file >= self.invoices_per_file):
+                    if handle:
+                        handle.close()
+                    suffix = f"_{len(paths) + 1:03d}" if self.invoices_per_file else ""
+                    path = os.path.join(out_dir, f"{TRANSACTION_BASENAME}{suffix}.csv")
+                    handle = open(path, "w", encoding=self.encoding, newline="")
+                    writer = csv.writer(handle)
+                    writer.writerow(TRANSACTION_HEADER)
+                    paths.append(path)
+                    in_file = 0
+                writer.writerows(invoice_rows)
+                in_file += 1
+        finally:
+            if handle:
+                handle.close()
+        return paths
+
+    def write(self, out_dir: str) -> dict:
+        """
+        Write masters (out_dir/Master) and transactions (out_dir).
+
+        Returns:
+            {"master_dir", "masters": {...}, "transactions": [paths]}
+        """
+        master_dir = os.path.join(out_dir, "Master")
+        masters = self.write_masters(master_dir)
+        return {"master_dir": master_dir, "masters": masters, "transactions": self.write_transactions(out_dir)}
+
+    def _write_csv(self, path: str, header: list, rows: list):
+        with open(path, "w", encoding=self.encoding, newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+
+def generate(out_dir: str, **options) -> dict:
+    """Convenience wrapper: SyntheticDataset(**options).write(out_dir)."""
+    return SyntheticDataset(**options).write(out_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic fuel-report transactions and Master files")
+    parser.add_argument("--out", required=True, help="Output directory (Master/ is created inside)")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--invoices-per-file", type=int, default=0, help="0 = single transaction file")
+    parser.add_argument("--lines-per-invoice", type=int, default=5)
+    parser.add_argument("--customers", type=int)
+    parser.add_argument("--sellers", type=int, default=3)
+    parser.add_argument("--miss-rate", type=float, default=0.0, help="Customers missing from Customer_Tax ID")
+    parser.add_argument("--seller-miss-rate", type=float, default=0.0, help="Invoices with unknown company code")
+    parser.add_argument("--encoding", default="utf-8", choices=["utf-8", "tis-620"])
+    parser.add_argument("--sci-notation", type=float, default=0.0, help="Fraction of rows with E+ notation IDs")
+    parser.add_argument("--gregorian", dest="buddhist_era", action="store_false", help="Write C.E. dates")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    options = vars(args)
+    result = generate(options.pop("out"), **options)
+    print(f"Masters: {result['master_dir']}")
+    print(f"Transactions: {len(result['transactions'])} file(s), {args.rows} rows")
@@ -2,6 +2,7 @@ import unittest
 import json
 import os
 from API_AXONS import AxonsETaxService
+from gazetteer import ThaiGazetteer
 
 class TestAxonsETaxService(unittest.TestCase):
     def setUp(self):
@@ -116,5 +117,120 @@ class TestAxonsETaxService(unittest.TestCase):
         self.assertEqual(self.service._format_date_to_iso("16/12/2025"), "2025-12-16T00:00:00.000Z")
         self.assertEqual(self.service._format_date_to_iso(""), "")
 
+    def test_submit_body_splices_pdf(self):
+        etda, _ = self.service.transform_to_etda(self.sample_et_invoice, "JVBERi0xLjQK+/==")
+        body = self.service._build_submit_body(etda)
+        self.assertEqual(json.loads(body.decode("utf-8")), etda)
+        self.assertTrue(body.endswith(b'"Document":"JVBERi0xLjQK+/=="}'))
+
+        # Non-base64 values still produce valid JSON
+        for document in ('needs "escaping"', "JVBERi0x" * 20 + 'tail"quote', "JVBERi0x" * 20 + "\nwrapped"):
+            etda["Document"] = document
+            self.assertEqual(json.loads(self.service._build_submit_body(etda)), etda)
+
+        # NaN amounts fail loudly instead of producing invalid JSON
+        etda["ExchangedDocument"]["ID"] = float("nan")
+        with self.assertRaises(ValueError):
+            self.service._build_submit_body(etda)
+
+    def test_party_blocks_are_not_shared_between_documents(self):
+        import copy
+        other = copy.deepcopy(self.sample_et_invoice)
+        other["ET_INVOICE_HDR"][0]["DOC_NUMBER"] = "680361000997"
+        etda_a, _ = self.service.transform_to_etda(self.sample_et_invoice, "DUMMY_PDF")
+        agreement_a = etda_a["SupplyChainTradeTransaction"]["ApplicableHeaderTradeAgreement"]
+        expected = copy.deepcopy(agreement_a)
+
+        # Mutating one document's blocks must not leak into the next document
+        agreement_a["SellerTradeParty"]["postalTradeAddress"]["PostcodeCode"] = "99999"
+        agreement_a["BuyerTradeParty"]["DefinedTradeContact"][0]["PersonName"] = "changed"
+        etda_a["SupplyChainTradeTransaction"]["IncludedSupplyChainTradeLineItem"][0][
+            "SpecifiedTradeProduct"]["InformationNote"].append({})
+        etda_b, _ = self.service.transform_to_etda(other, "DUMMY_PDF")
+
+        agreement_b = etda_b["SupplyChainTradeTransaction"]["ApplicableHeaderTradeAgreement"]
+        self.assertEqual(agreement_b["SellerTradeParty"], expected["SellerTradeParty"])
+        self.assertEqual(agreement_b["BuyerTradeParty"], expected["BuyerTradeParty"])
+        line_b = etda_b["SupplyChainTradeTransaction"]["IncludedSupplyChainTradeLineItem"][0]
+        self.assertEqual(len(line_b["SpecifiedTradeProduct"]["InformationNote"]), 2)
+        with self.assertRaises(TypeError):
+            self.service._parse_address(self.sample_et_invoice["ET_INVOICE_HDR"][0]["COM_ADDRESS1"])["postcode"] = "x"
+
+    def test_address_area_codes(self):
+        etda, _ = self.service.transform_to_etda(self.sample_et_invoice, "DUMMY_PDF")
+        seller_addr = etda["SupplyChainTradeTransaction"]["ApplicableHeaderTradeAgreement"]["SellerTradeParty"]["postalTradeAddress"]
+        self.assertEqual(seller_addr["CountrySubDivisionID"], "19")
+        self.assertEqual(seller_addr["CityName"], "1909")
+        self.assertEqual(seller_addr["CitySubDivisionName"], "190903")
+
+        codes = self.service._parse_address("123 แขวงดินแดง เขตดินแดง กรุงเทพฯ 10400")["area_codes"]
+        self.assertEqual(codes, ("10", "1026", "102601"))
+        # Unknown addresses keep the previous Bangkok defaults
+        self.assertEqual(self.service._parse_address("")["area_codes"], ("10", "1026", "102601"))
+
+    def test_address_area_codes_need_marker_or_postcode(self):
+        gazetteer = ThaiGazetteer()
+        resolved = lambda address: tuple(gazetteer.resolve(address)[f"{level}_code"]
+                                          for level in ("province", "district", "subdistrict"))
+        # "เลย" inside a village name is not the province; 10540 is Samut Prakan
+        self.assertEqual(resolved("88 หมู่บ้านเลยดี 10540"), ("11", None, None))
+        # 10xxx postcodes outside Bangkok
+        self.assertEqual(resolved("99 ถนนสุขุมวิท 10270"), ("11", "1101", None))
+        self.assertEqual(gazetteer.area_codes("ต.สำโรงเหนือ อ.เมืองสมุทรปราการ 10270"), ("11", "1101", "110102"))
+        # Unresolved levels are not guessed as XX01 codes
+        self.assertEqual(resolved("5 ซอยเลย จ.เลย"), ("42", None, None))
+        self.assertEqual(gazetteer.area_codes("12 ต.ธารเกษม จ.สระบุรี"), ("19", "1909", "190903"))
+
+    def test_area_codes_fill_unresolved_levels_within_parent(self):
+        gazetteer = ThaiGazetteer()
+        # Lowest code under the resolved parent that the postcode covers ...
+        self.assertEqual(gazetteer.area_codes("88 หมู่บ้านเลยดี 10540"), ("11", "1103", "110301"))
+        self.assertEqual(gazetteer.area_codes("99 ถนนพระราม 9 กรุงเทพ 10310"), ("10", "1017", "101701"))
+        # ... else the lowest code under it
+        self.assertEqual(gazetteer.area_codes("1 หมู่ 3 อ.เมือง จ.ขอนแก่น"), ("40", "4001", "400101"))
+        self.assertEqual(gazetteer.area_codes("5 ซอยเลย จ.เลย"), ("42", "4201", "420101"))
+        self.assertEqual(gazetteer.area_codes(""), ("10", "1026", "102601"))
+
+    def test_transform_never_sends_null_area_codes(self):
+        import copy
+        for seller, buyer in [("99 ถนนพระราม 9 กรุงเทพ 10310", "1 หมู่ 3 อ.เมือง จ.ขอนแก่น"),
+                              ("5 ซอยเลย จ.เลย", ""), ("ไม่ทราบที่อยู่", "88 หมู่บ้านเลยดี 10540")]:
+            invoice = copy.deepcopy(self.sample_et_invoice)
+            invoice["ET_INVOICE_HDR"][0].update(COM_ADDRESS1=seller, BILL_ADDRESS1=buyer)
+            etda, _ = self.service.transform_to_etda(invoice, "DUMMY_PDF")
+            agreement = etda["SupplyChainTradeTransaction"]["ApplicableHeaderTradeAgreement"]
+            for address in (agreement["SellerTradeParty"]["postalTradeAddress"],
+                            agreement["BuyerTradeParty"]["PostalTradeAddress"]):
+                province, district, subdistrict = (address["CountrySubDivisionID"], address["CityName"],
+                                                   address["CitySubDivisionName"])
+                self.assertTrue(province and district and subdistrict, (seller, buyer, address))
+                self.assertTrue(district.startswith(province) and subdistrict.startswith(district))
+
+    def test_line_taxes_reconcile_with_header(self):
+        import copy
+        invoice = copy.deepcopy(self.sample_et_invoice)
+        invoice["ET_INVOICE_DTL"] = [
+            dict(invoice["ET_INVOICE_DTL"][0], EXT_NUMBER=i + 1, TOTAL_NET_PRODUCT=amount)
+            for i, amount in enumerate([1000.0, 1000.0, 705.7])
+        ]
+        etda, _ = self.service.transform_to_etda(invoice, "DUMMY_PDF")
+        lines = etda["SupplyChainTradeTransaction"]["IncludedSupplyChainTradeLineItem"]
+        taxes = [l["SpecifiedLineTradeSettlement"]["ApplicableTradeTax"][0]["CalculatedAmount"][0] for l in lines]
+        self.assertEqual(round(sum(float(t) for t in taxes), 2), 177.01)
+        self.assertEqual([l["AssociatedDocumentLineDocument"]["LineID"] for l in lines], ["1", "2", "3"])
+
+        self.assertEqual(self.service._allocate_line_taxes([1, 1, 1], 0.10), [4, 3, 3])
+        self.assertEqual(self.service._allocate_line_taxes([0, 0], 5.0), [0, 0])
+
+    def test_line_taxes_follow_signed_amounts(self):
+        # A return / discount line gets a negative share of the header tax
+        self.assertEqual(self.service._allocate_line_taxes([1000.0, -200.0], 56.0), [7000, -1400])
+        taxes = self.service._allocate_line_taxes([100.0, -33.33], 4.67)
+        self.assertEqual(sum(taxes), 467)
+        self.assertLess(taxes[1], 0)
+        self.assertEqual(taxes, [700, -233])
+        # Credit notes: negative total and negative lines
+        self.assertEqual(self.service._allocate_line_taxes([-100.0, -50.0], -0.10), [-7, -3])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from export_stream import iter_csv, write_xlsx
+
+class TestExportStream(unittest.TestCase):
+    def frame(self, rows):
+        return pd.DataFrame({
+            "เลขที่ใบแจ้งหนี้2": [f"6812610{i:05d}" for i in range(rows)],
+            "VAT": ["7.00"] * rows,
+            "note": [np.nan] * rows
+        })
+
+    def test_csv_chunks_match_to_csv(self):
+        df = self.frame(25)
+        chunks = list(iter_csv(df, chunk_rows=10))
+        self.assertEqual(len(chunks), 4)  # header + 3 row chunks
+        self.assertEqual(b"".join(chunks).decode("utf-8"), "\ufeff" + df.to_csv(index=False))
+
+    def test_xlsx_splits_sheets_past_row_limit(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path, rows = write_xlsx(self.frame(7), os.path.join(tmp, "out.xlsx"), max_rows=4)
+            self.assertEqual(rows, 7)
+            wb = load_workbook(path, read_only=True)
+            self.assertEqual(wb.sheetnames, ["Sheet1", "Sheet2", "Sheet3"])
+            sheet1 = list(wb["Sheet1"].values)
+            self.assertEqual(sheet1[0], ("เลขที่ใบแจ้งหนี้2", "VAT", "note"))
+            self.assertEqual(sheet1[1][:2], ("681261000000", "7.00"))  # blank NaN cell is trimmed
+            self.assertEqual(len(list(wb["Sheet3"].values)), 2)  # header + last row
+            wb.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from job_store import JobStore
+from jobs import Job, JobConflict, JobManager, QUEUED
+
+class TestPersistentJobs(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "jobs.sqlite3")
+        self.managers = []
+
+    def tearDown(self):
+        for manager in self.managers:
+            manager.shutdown()
+        self.tmp.cleanup()
+
+    def manager(self, **kwargs):
+        manager = JobManager(store=JobStore(self.db), max_workers=1, lease_seconds=0.3, poll_interval=0.05, **kwargs)
+        self.managers.append(manager)
+        manager.start()
+        return manager
+
+    def wait_finished(self, manager, job_id, timeout=5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = manager.get(job_id)
+            if job.finished:
+                return job
+            time.sleep(0.05)
+        self.fail(f"job {job_id} did not finish")
+
+    def orphan_job(self, items_done, attempts=1):
+        """A job left 'running' by a worker that died after recording items_done."""
+        store = JobStore(self.db)
+        job = Job("demo", {"items": ["a", "b", "c"]}, store=store)
+        store.insert(job)
+        for _ in range(attempts):
+            store.update(job.id, status=QUEUED)
+            store.claim("gone-host:1:dead", 0.01, ["demo"])
+        for item, status in items_done:
+            job.add_result({"status": status, "item": item}, key=item)
+        time.sleep(0.02)
+        return job.id
+
+    def test_orphaned_job_is_requeued_and_resumed(self):
+        job_id = self.orphan_job([("a", "success"), ("b", "error")])
+        calls = []
+
+        def handler(job, items):
+            job.set_total(len(items))
+            for item in items:
+                if job.completed(item):
+                    continue
+                calls.append(item)
+                job.add_result({"status": "success", "item": item}, key=item)
+
+        manager = self.manager()
+        manager.register("demo", handler)
+        job = self.wait_finished(manager, job_id)
+
+        self.assertEqual(calls, ["b", "c"])
+        self.assertEqual((job.status, job.done, job.success, job.errors, job.attempts), ("completed", 3, 3, 0, 2))
+        # A later process sees the persisted outcome
+        restored = self.manager().get(job_id)
+        self.assertEqual((restored.status, restored.success, len(restored.results)), ("completed", 3, 3))
+
+    def test_job_out_of_attempts_fails(self):
+        job_id = self.orphan_job([], attempts=2)
+        manager = self.manager(max_attempts=2)
+        manager.register("demo", lambda job, items: None)
+        job = self.wait_finished(manager, job_id)
+        self.assertEqual(job.status, "failed")
+        self.assertIn("giving up", job.error)
+
+    def test_job_running_in_another_process_is_visible(self):
+        release = threading.Event()
+
+        def handler(job, items):
+            job.set_total(len(items))
+            job.add_result({"status": "success", "item": items[0]}, key=items[0])
+            release.wait(5)
+
+        runner, other = self.manager(), self.manager()
+        runner.register("demo", handler)
+        job_id = runner.submit("demo", {"items": ["a", "b"]}).id
+        deadline = time.time() + 5
+        while other.get(job_id).done < 1 and time.time() < deadline:
+            time.sleep(0.05)
+
+        progress = other.get(job_id).progress()
+        self.assertEqual((progress["status"], progress["total"], progress["done"]), ("running", 2, 1))
+        self.assertEqual([p["job_id"] for p in other.list()], [job_id])
+        release.set()
+        self.assertEqual(self.wait_finished(other, job_id, timeout=5).status, "completed")
+
+    def test_progress_and_new_results_read_without_all_results(self):
+        job_id = self.orphan_job([("a", "success"), ("b", "error"), ("c", "success")])
+        store = JobStore(self.db)
+        record = store.load(job_id, results=False)
+        self.assertNotIn("results", record)
+        self.assertEqual((record["done"], record["success"]), (3, 2))
+        self.assertEqual([r["id"] for r in store.recent(10)], [job_id])
+
+        manager = self.manager()
+        progress = manager.progress(job_id)
+        self.assertEqual((progress["done"], progress["success"], progress["errors"]), (3, 2, 1))
+        self.assertEqual([(p["job_id"], p["done"]) for p in manager.list()], [(job_id, 3)])
+        self.assertEqual([seq for seq, _ in manager.results_after(job_id, 0)], [1, 2])
+        self.assertEqual(manager.results_after(job_id, 2), [])
+        self.assertIsNone(manager.progress("missing"))
+
+        # Pages of a job not current here come from the store, like Job.page()
+        full = Job.from_record(store.load(job_id))
+        for args in [(0, 100, None), (1, 1, None), (0, 100, "success"), (1, 5, "success"), (0, 100, "error")]:
+            self.assertEqual(manager.page(job_id, *args), full.page(*args))
+        self.assertEqual([r["item"] for r in manager.page(job_id, status="error")["results"]], ["b"])
+        self.assertIsNone(manager.page("missing"))
+
+    def test_runs_jobs_and_reports_failures(self):
+        def handler(job, items):
+            job.set_total(len(items))
+            for item in items:
+                if item == "boom":
+                    raise RuntimeError("item failed")
+                job.add_result({"status": "success" if item != "bad" else "error", "item": item}, key=item)
+
+        manager = self.manager()
+        manager.register("demo", handler)
+        with self.assertRaises(ValueError):
+            manager.submit("unknown")
+
+        ok = self.wait_finished(manager, manager.submit("demo", {"items": ["a", "bad", "c"]}).id)
+        self.assertEqual((ok.status, ok.total, ok.success, ok.errors), ("completed", 3, 2, 1))
+        self.assertEqual([r["item"] for r in ok.page(status="error")["results"]], ["bad"])
+        self.assertEqual(ok.page(offset=1, limit=1)["results"], [{"status": "error", "item": "bad"}])
+
+        failed = self.wait_finished(manager, manager.submit("demo", {"items": ["a", "boom"]}).id)
+        self.assertEqual((failed.status, failed.error, failed.done), ("failed", "item failed", 1))
+        self.assertEqual([p["status"] for p in manager.list()], ["failed", "completed"])
+
+    def test_one_active_job_per_resource(self):
+        release = threading.Event()
+        manager, other = self.manager(), self.manager()
+        manager.register("demo", lambda job, items: release.wait(5))
+        other.register("demo", lambda job, items: release.wait(5))
+
+        first = manager.submit("demo", {"items": []}, resource="dir:/batch")
+        # Rejected in any process sharing the store while queued or running
+        with self.assertRaises(JobConflict) as conflict:
+            other.submit("demo", {"items": []}, resource="dir:/batch")
+        self.assertEqual(conflict.exception.job_id, first.id)
+        elsewhere = other.submit("demo", {"items": []}, resource="dir:/other")
+        unrestricted = manager.submit("demo", {"items": []})
+
+        release.set()
+        for job in (first, elsewhere, unrestricted):
+            self.wait_finished(manager, job.id)
+        again = other.submit("demo", {"items": []}, resource="dir:/batch")
+        self.assertEqual(self.wait_finished(other, again.id).status, "completed")
+
+    def test_store_created_before_resource_column(self):
+        conn = sqlite3.connect(self.db)
+        conn.executescript("""
+            CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT NOT NULL,
+                               status TEXT NOT NULL, total INTEGER, error TEXT, summary TEXT,
+                               attempts INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL,
+                               started_at REAL, finished_at REAL, lease_owner TEXT, lease_expires REAL);
+            INSERT INTO jobs (id, kind, params, status, created_at) VALUES ('old', 'demo', '{}', 'completed', 1);
+        """)
+        conn.close()
+        store = JobStore(self.db)
+        self.assertIsNone(store.load("old")["resource"])
+        job = Job("demo", store=store)
+        self.assertIsNone(store.insert(job, resource="dir:/batch"))
+        self.assertEqual(store.insert(Job("demo"), resource="dir:/batch"), job.id)
+
+if __name__ == '__main__':
+    unittest.main()
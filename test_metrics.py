@@ -0,0 +1,42 @@
+import unittest
+import metrics
+from metrics import Registry, Counter, Histogram, Gauge, track_stage, STAGE_CALLS, STAGE_SECONDS, STAGE_IN_FLIGHT
+
+class TestMetrics(unittest.TestCase):
+    def test_render_prometheus_text(self):
+        registry = Registry()
+        calls = Counter("demo_calls_total", "Calls.", ("stage",), registry=registry)
+        latency = Histogram("demo_seconds", "Latency.", ("stage",), buckets=(0.1, 1), registry=registry)
+        gauge = Gauge("demo_in_flight", "In flight.", registry=registry)
+        calls.inc(stage="load")
+        calls.inc(2, stage="load")
+        latency.observe(0.05, stage="load")
+        latency.observe(0.5, stage="load")
+        gauge.set(3)
+
+        text = registry.render()
+        self.assertIn('# TYPE demo_calls_total counter', text)
+        self.assertIn('demo_calls_total{stage="load"} 3', text)
+        self.assertIn('demo_seconds_bucket{stage="load",le="0.1"} 1', text)
+        self.assertIn('demo_seconds_bucket{stage="load",le="1"} 2', text)
+        self.assertIn('demo_seconds_bucket{stage="load",le="+Inf"} 2', text)
+        self.assertIn('demo_seconds_count{stage="load"} 2', text)
+        self.assertIn('demo_in_flight 3', text)
+        with self.assertRaises(ValueError):
+            calls.inc(other="x")
+
+    def test_track_stage_records_outcome(self):
+        with track_stage("unit_test_stage", items=4):
+            self.assertEqual(STAGE_IN_FLIGHT.get(stage="unit_test_stage"), 1)
+        with self.assertRaises(RuntimeError):
+            with track_stage("unit_test_stage"):
+                raise RuntimeError("boom")
+
+        self.assertEqual(STAGE_IN_FLIGHT.get(stage="unit_test_stage"), 0)
+        self.assertEqual(STAGE_CALLS.get(stage="unit_test_stage", outcome="ok"), 1)
+        self.assertEqual(STAGE_CALLS.get(stage="unit_test_stage", outcome="error"), 1)
+        self.assertEqual(STAGE_SECONDS.get(stage="unit_test_stage")["count"], 2)
+        self.assertEqual(metrics.STAGE_ITEMS.get(stage="unit_test_stage"), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import gzip
+import os
+import shutil
+import tempfile
+import zipfile
+from synth_data import generate
+from processor import load_csv
+
+class TestCompressedReports(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.dataset = generate(cls.tmp.name, rows=60, encoding="tis-620", seed=3)
+        cls.source = cls.dataset["transactions"][0]
+        cls.expected = load_csv(cls.source)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_gzip_stream_with_encoding_fallback(self):
+        with open(self.source, "rb") as src, gzip.open(self.path("report.csv.gz"), "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        self.assertTrue(load_csv(self.path("report.csv.gz")).equals(self.expected))
+
+    def test_zip_with_single_report(self):
+        with zipfile.ZipFile(self.path("one.zip"), "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.write(self.source, "station/report.csv")
+            zf.writestr("readme.txt", "ignored")
+        self.assertTrue(load_csv(self.path("one.zip")).equals(self.expected))
+
+        with zipfile.ZipFile(self.path("two.zip"), "w") as zf:
+            zf.write(self.source, "a.csv")
+            zf.write(self.source, "b.csv")
+        with self.assertRaises(ValueError):
+            load_csv(self.path("two.zip"))
+
+if __name__ == '__main__':
+    unittest.main()
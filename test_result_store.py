@@ -0,0 +1,102 @@
+import unittest
+import tempfile
+import time
+from unittest import mock
+import pandas as pd
+import result_store
+from result_store import ResultStore, frame_bytes, page_frame, summarize_frame
+
+class TestResultStore(unittest.TestCase):
+    def frame(self, rows):
+        return pd.DataFrame({"doc": [f"6812610{i:05d}" for i in range(rows)], "amount": ["100.00"] * rows})
+
+    def test_lru_eviction_by_memory(self):
+        size = frame_bytes(self.frame(100))
+        store = ResultStore(ttl_seconds=60, max_bytes=int(size * 2.5))
+        store.put("a", self.frame(100))
+        store.put("b", self.frame(100))
+        self.assertIsNotNone(store.get("a"))  # "b" becomes least recently used
+        store.put("c", self.frame(100))
+
+        self.assertIsNone(store.get("b"))
+        self.assertEqual(len(store.get("a")), 100)
+        self.assertEqual(store.meta("c")["rows"], 100)
+        self.assertLessEqual(store.stats()["bytes"], store.max_bytes)
+
+    def test_ttl_expiry(self):
+        store = ResultStore(ttl_seconds=0.05, max_bytes=0)
+        store.put("a", self.frame(10), {"filename": "t.csv"})
+        self.assertEqual(store.meta("a")["filename"], "t.csv")
+        time.sleep(0.1)
+        self.assertIsNone(store.get("a"))
+        self.assertEqual(store.stats()["entries"], 0)
+
+    def test_find_by_dedup_key(self):
+        size = frame_bytes(self.frame(100))
+        store = ResultStore(ttl_seconds=60, max_bytes=int(size * 1.5))
+        store.put("a", self.frame(100), key="sha:v1")
+        self.assertEqual(store.find("sha:v1"), "a")
+        self.assertIsNone(store.find("sha:v2"))
+        store.put("b", self.frame(100))  # evicts "a" and its key
+        self.assertIsNone(store.find("sha:v1"))
+
+    def test_shared_dir_visible_to_other_processes(self):
+        with tempfile.TemporaryDirectory() as shared:
+            writer = ResultStore(ttl_seconds=0.3, max_bytes=0, shared_dir=shared)
+            reader = ResultStore(ttl_seconds=0.3, max_bytes=0, shared_dir=shared)
+            writer.put("a", self.frame(10), {"filename": "t.csv"}, key="sha:v1")
+
+            self.assertEqual(reader.find("sha:v1"), "a")
+            self.assertEqual(reader.meta("a")["filename"], "t.csv")
+            self.assertEqual(len(reader.get("a")), 10)
+            self.assertEqual(reader.stats()["entries"], 1)
+            self.assertIsNone(reader.get("../a"))
+
+            time.sleep(0.4)
+            self.assertIsNone(reader.get("a"))
+            self.assertIsNone(writer.find("sha:v1"))
+
+    def test_page_filter_and_sort(self):
+        df = pd.DataFrame({
+            'เลขที่ใบแจ้งหนี้2': ['A1', 'A1', 'A2', 'A3'],
+            'ชื่อลูกค้า': ['Alpha', 'Alpha', 'Missing Master Data', 'Beta'],
+            'จำนวนเงิน': ['100.00', '9.50', '20.00', '1000.00'],
+            'สถานะการจับคู่': ['Full Match', 'Full Match', 'Customer Missing', 'Full Match'],
+        })
+        page = page_frame(df, offset=0, limit=2, sort='จำนวนเงิน', descending=True)
+        self.assertEqual(page["total"], 4)
+        self.assertEqual([r['จำนวนเงิน'] for r in page["rows"]], ['1000.00', '100.00'])
+
+        missing = page_frame(df, status='Customer Missing')
+        self.assertEqual([r['เลขที่ใบแจ้งหนี้2'] for r in missing["rows"]], ['A2'])
+        self.assertEqual(page_frame(df, q='alp', offset=1)["rows"][0]['จำนวนเงิน'], '9.50')
+        with self.assertRaises(ValueError):
+            page_frame(df, sort='nope')
+
+        summary = summarize_frame(df)
+        self.assertEqual((summary["rows"], summary["invoices"]), (4, 3))
+        self.assertEqual(summary["match_counts"], {'Full Match': 3, 'Customer Missing': 1})
+        self.assertEqual(summary["totals"]['จำนวนเงิน'], 1129.5)
+
+    def test_page_caches_view_until_result_changes(self):
+        store = ResultStore(ttl_seconds=0.3, max_bytes=0)
+        store.put("a", pd.DataFrame({'จำนวนเงิน': ['3', '10', '2']}))
+        with mock.patch.object(result_store, "frame_view", wraps=result_store.frame_view) as view:
+            first = store.page("a", 0, 2, sort='จำนวนเงิน', descending=True)
+            second = store.page("a", 2, 2, sort='จำนวนเงิน', descending=True)
+            self.assertEqual(view.call_count, 1)
+            self.assertEqual([r['จำนวนเงิน'] for r in first["rows"] + second["rows"]], ['10', '3', '2'])
+            self.assertEqual(second["total"], 3)
+
+            # A new frame under the same ID is filtered and sorted again
+            store.put("a", pd.DataFrame({'จำนวนเงิน': ['1', '5']}))
+            replaced = store.page("a", 0, 2, sort='จำนวนเงิน', descending=True)
+            self.assertEqual([r['จำนวนเงิน'] for r in replaced["rows"]], ['5', '1'])
+            self.assertEqual(view.call_count, 2)
+
+        time.sleep(0.4)
+        self.assertIsNone(store.page("a", sort='จำนวนเงิน'))
+        self.assertIsNone(store.page("missing"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import os
+import tempfile
+import time
+from config import Config
+from status_poller import StatusPoller, PENDING, DONE, FAILED
+
+class FakeStatusService:
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.calls = []
+
+    def check_status(self, doc_number, doc_date, com_tax_id, branch, internal_doc_no, doc_type):
+        self.calls.append(doc_number)
+        status = self.statuses[doc_number].pop(0)
+        if isinstance(status, Exception):
+            raise status
+        if isinstance(status, tuple):  # (http status, body) as sent by the upstream
+            return {"http_status": status[0], "response": status[1]}
+        # mock_upstream.py's status response
+        return {"http_status": 200, "response": {"status": "success",
+                                                 "data": {"docNumber": doc_number, "documentStatus": status}}}
+
+class TestStatusPoller(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "status.sqlite3")
+        self.docs = [
+            {"docNumber": "A1", "docDate": "2025-12-16T00:00:00.000Z", "comTaxId": "0105519004951", "docType": "388"},
+            {"docNumber": "A2", "docDate": "2025-12-16T00:00:00.000Z", "comTaxId": "0105519004951", "docType": "388"},
+        ]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_poller(self, service):
+        return StatusPoller(service, db_path=self.db_path, max_workers=2,
+                            rate_per_sec=1000, schedule=[0, 0], max_attempts=5)
+
+    def test_documents_drop_out_when_final(self):
+        service = FakeStatusService({"A1": ["PROCESSING", "SUCCESS"], "A2": [RuntimeError("timeout"), "REJECTED"]})
+        poller = self.make_poller(service)
+        self.assertEqual(poller.track(self.docs), 2)
+        self.assertEqual(poller.track(self.docs), 0)
+
+        self.assertEqual(poller.poll_due(), 2)
+        self.assertEqual(poller.summary()[PENDING], 2)
+        self.assertEqual(poller.poll_due(), 2)
+
+        summary = poller.summary()
+        self.assertEqual((summary[DONE], summary[FAILED], summary[PENDING]), (1, 1, 0))
+        self.assertEqual(poller.poll_due(), 0)
+        self.assertEqual(len(service.calls), 4)
+
+    def test_only_document_status_of_2xx_responses_counts(self):
+        throttled = (429, {"status": "error", "message": "Too Many Requests"})
+        server_error = (500, {"status": "error", "message": "Injected upstream error"})
+        no_document = (200, {"status": "success", "data": {}})
+        not_found = (404, {"status": "success", "data": {}})
+        service = FakeStatusService({"A1": [throttled, no_document, not_found, "SUCCESS"],
+                                     "A2": [server_error, (401, {"status": "Unauthorized"}), "REJECTED"]})
+        poller = self.make_poller(service)
+        poller.track(self.docs)
+
+        # Throttling, errors and the API call's own "status" neither finish nor fail a document
+        for _ in range(2):
+            self.assertEqual(poller.poll_due(), 2)
+            self.assertEqual(poller.summary()[PENDING], 2)
+        self.assertEqual(poller.poll_due(), 2)  # A1 404, A2 REJECTED
+        self.assertEqual((poller.summary()[PENDING], poller.summary()[FAILED]), (1, 1))
+        self.assertEqual(poller.poll_due(), 1)
+
+        summary = poller.summary()
+        self.assertEqual((summary[DONE], summary[FAILED], summary[PENDING]), (1, 1, 0))
+        self.assertEqual({d["docNumber"]: d["last_status"] for d in poller.list_documents()},
+                         {"A1": "SUCCESS", "A2": "REJECTED"})
+
+    def test_state_survives_restart(self):
+        poller = self.make_poller(FakeStatusService({"A1": ["SUCCESS"], "A2": ["PROCESSING"]}))
+        poller.track(self.docs)
+        poller.poll_due()
+
+        restarted = self.make_poller(FakeStatusService({"A2": ["ACCEPTED"]}))
+        self.assertEqual(restarted.poll_due(), 1)
+        self.assertEqual(restarted.summary()[DONE], 2)
+        self.assertEqual(restarted.list_documents(DONE)[0]["docNumber"], "A1")
+
+    def test_started_poller_picks_up_seeded_documents(self):
+        # Documents left pending by an earlier process, polled once the app starts the poller
+        self.make_poller(FakeStatusService({})).track(self.docs)
+        service = FakeStatusService({"A1": ["SUCCESS"], "A2": ["ACCEPTED"]})
+        poller = self.make_poller(service)
+        poller.start()
+        try:
+            deadline = time.time() + 5
+            while poller.summary()[DONE] < 2 and time.time() < deadline:
+                time.sleep(0.05)
+        finally:
+            poller.stop()
+        self.assertEqual(poller.summary()[DONE], 2)
+        self.assertEqual(sorted(service.calls), ["A1", "A2"])
+        self.assertEqual(poller.list_documents()[0]["internalDocNo"], Config.INTERNAL_DOC_NO)
+
+if __name__ == '__main__':
+    unittest.main()
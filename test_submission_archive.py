@@ -0,0 +1,68 @@
+import unittest
+import base64
+import json
+import os
+import tempfile
+import time
+from submission_archive import SubmissionArchive
+
+class TestSubmissionArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archive = SubmissionArchive(self.tmp.name, compression="gzip", retention_days=30)
+        self.pdf = b"%PDF-1.4 sample"
+        self.pdf_b64 = base64.b64encode(self.pdf).decode("ascii")
+        self.head = json.dumps({"ExchangedDocument": {"ID": "DOC1"}}, separators=(",", ":")).encode("utf-8")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_background_write_stores_pdf_once(self):
+        self.archive.enqueue("DOC1", self.head, self.pdf_b64)
+        self.archive.enqueue("DOC2", self.head, self.pdf_b64)
+        self.archive.flush()
+
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, "DOC1_submitted.json.gz")))
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp.name, "pdf"))), 1)
+
+        record, pdf = self.archive.read("DOC1")
+        self.assertEqual(json.loads(record)["ExchangedDocument"]["ID"], "DOC1")
+        self.assertTrue(json.loads(record)["DocumentRef"].startswith("pdf/"))
+        self.assertEqual(pdf, self.pdf)
+
+    def test_compaction_removes_expired_records_and_orphan_pdfs(self):
+        path = self.archive.write("OLD", self.head, self.pdf_b64)
+        old = time.time() - 31 * 86400
+        os.utime(path, (old, old))
+        pdf_dir = os.path.join(self.tmp.name, "pdf")
+        os.utime(os.path.join(pdf_dir, os.listdir(pdf_dir)[0]), (old, old))
+
+        result = self.archive.compact()
+        self.assertEqual(result, {"removed_records": 1, "removed_pdfs": 1})
+        self.assertEqual(os.listdir(pdf_dir), [])
+
+    def test_compaction_keeps_pdfs_another_process_just_stored(self):
+        # Another process stored the PDF; its metadata record is still queued
+        other = SubmissionArchive(self.tmp.name, compression="gzip", retention_days=30)
+        os.makedirs(other.pdf_dir)
+        ref = other._store_pdf(self.pdf_b64)
+        self.assertEqual(self.archive.compact(), {"removed_records": 0, "removed_pdfs": 0})
+
+        # Reusing an old PDF for a new record restarts its grace period
+        old = time.time() - 2 * self.archive.pdf_grace_seconds
+        os.utime(os.path.join(self.tmp.name, ref), (old, old))
+        self.assertEqual(other._store_pdf(self.pdf_b64), ref)
+        self.assertEqual(self.archive.compact()["removed_pdfs"], 0)
+        other.write("DOC1", self.head, self.pdf_b64)
+        self.assertEqual(self.archive.read("DOC1")[1], self.pdf)
+
+    def test_compaction_keeps_pdfs_when_a_record_is_unreadable(self):
+        self.archive.write("DOC1", self.head, self.pdf_b64)
+        with open(os.path.join(self.tmp.name, "DOC1_submitted.json.gz"), "wb") as f:
+            f.write(b"not gzip")
+
+        self.assertEqual(self.archive.compact(), {"removed_records": 0, "removed_pdfs": 0})
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp.name, "pdf"))), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,274 @@
+import unittest
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+
+class TestSubmitService(unittest.TestCase):
+    def run_python(self, code):
+        # Apps started here must not pick up the checkout's queued jobs or
+        # pending documents (and send them upstream) or leave files behind
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ,
+                       JOB_DB_PATH=os.path.join(tmp, "jobs.sqlite3"),
+                       STATUS_DB_PATH=os.path.join(tmp, "status_poll.sqlite3"),
+                       TOKEN_DB_PATH=os.path.join(tmp, "tokens.sqlite3"),
+                       MASTER_SNAPSHOT_DIR=os.path.join(tmp, "master_snapshots"),
+                       RESULT_SHARED_DIR=os.path.join(tmp, "results"),
+                       EXPORT_TMP_DIR=os.path.join(tmp, "exports"),
+                       TRACE_ENABLED="0")
+            result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=60, env=env)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout.strip()
+
+    def test_submit_service_does_not_load_pandas(self):
+        out = self.run_python(
+            "import sys, submit_main\n"
+            "loaded = 'pandas' in sys.modules\n"
+            "from fastapi.testclient import TestClient\n"
+            "client = TestClient(submit_main.app)\n"
+            "print(loaded, client.get('/api/jobs').status_code, client.post('/upload').status_code)"
+        )
+        self.assertEqual(out, "False 200 404")
+
+    def test_full_server_loads_pandas_lazily(self):
+        out = self.run_python(
+            "import sys, main\n"
+            "print('pandas' in sys.modules, sorted(main.job_manager._handlers))"
+        )
+        self.assertEqual(out, "False ['submit-batch', 'upload-batch']")
+
+    def test_apps_start_the_status_poller(self):
+        out = self.run_python(
+            "import main, submit_main, submit_api\n"
+            "from fastapi.testclient import TestClient\n"
+            "for app in (submit_main.app, main.app):\n"
+            "    with TestClient(app):\n"
+            "        print(submit_api.status_poller.summary()['running'])\n"
+            "print(submit_api.status_poller.summary()['running'])"
+        )
+        self.assertEqual(out.split(), ["True", "True", "False"])
+
+class FakeBatchService:
+    """Stands in for AxonsETaxService in run_submit_batch."""
+
+    def __init__(self, files, upstream, store):
+        self.files = files
+        # docNumber -> documentStatus the upstream reports (None: unknown document)
+        # or the (HTTP status, body) it answers with
+        self.upstream = upstream
+        self.store = store
+        self.submitted = []
+        self.checked = []
+        self.in_flight_at_submit = []
+
+    def list_batch_files(self, json_dir):
+        return self.files
+
+    def status_query_for_file(self, path):
+        return {"docNumber": os.path.basename(path)[:-5], "docDate": "", "comTaxId": "",
+                "branch": "00000", "internalDocNo": "", "docType": "388"}
+
+    def check_status(self, doc_number, **kwargs):
+        self.checked.append(doc_number)
+        status = self.upstream.get(doc_number)
+        if isinstance(status, tuple):
+            return {"http_status": status[0], "response": status[1]}
+        # The envelope of mock_upstream.py; "status" is the API call's outcome
+        data = {"docNumber": doc_number, "documentStatus": status} if status else {}
+        return {"http_status": 200, "response": {"status": "success", "data": data}}
+
+    def process_and_submit_file(self, path):
+        key = os.path.basename(path)
+        self.submitted.append(key)
+        self.in_flight_at_submit.append(key in self.store.load(self.job_id)["in_flight"])
+        return {"status": "success", "doc_number": key[:-5]}
+
+class TestSubmitBatchRetry(unittest.TestCase):
+    def setUp(self):
+        import submit_api
+        from job_store import JobStore
+        from status_poller import StatusPoller
+        self.submit_api = submit_api
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = JobStore(os.path.join(self.tmp.name, "jobs.sqlite3"))
+        files = [os.path.join(self.tmp.name, f"{name}.json") for name in ("A", "B", "C", "D")]
+        self.service = FakeBatchService(files, {"A": "PROCESSING", "B": None, "C": "SUCCESS"}, self.store)
+        self.poller = StatusPoller(self.service, db_path=os.path.join(self.tmp.name, "status.sqlite3"),
+                                   rate_per_sec=1000)
+        self.patches = [mock.patch.object(submit_api, "etax_service", self.service),
+                        mock.patch.object(submit_api, "status_poller", self.poller)]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_retry_checks_attempted_documents_upstream(self):
+        from jobs import Job
+        job = Job("submit-batch", {"json_dir": self.tmp.name}, store=self.store)
+        self.store.insert(job)
+        self.service.job_id = job.id
+        # The first run posted A and B (B failed) and died while posting C
+        job.mark_in_flight("A.json")
+        job.mark_in_flight("B.json")
+        job.add_result({"status": "error", "doc_number": "B"}, key="B.json")
+        job.mark_in_flight("C.json")
+
+        retry = Job.from_record(self.store.load(job.id), store=self.store)
+        retry.attempts = 2
+        self.submit_api.run_submit_batch(retry, json_dir=self.tmp.name)
+
+        # A and C are known upstream: recorded without a second POST
+        self.assertEqual(sorted(self.service.checked), ["A", "B", "C"])
+        self.assertEqual(self.service.submitted, ["B.json", "D.json"])
+        self.assertEqual(self.service.in_flight_at_submit, [True, True])
+        self.assertTrue(retry.result_for("C.json")["already_submitted"])
+        self.assertEqual((retry.success, retry.errors), (4, 0))
+        self.assertEqual(self.store.load(job.id)["in_flight"], [])
+
+    def test_retry_resubmits_only_documents_unknown_upstream(self):
+        from jobs import Job
+        upstream = {
+            "Throttled": (429, {"status": "error", "message": "Too Many Requests"}),
+            "Failing": (500, {"status": "error", "message": "Injected upstream error"}),
+            "Unauthorized": (401, {"status": "Unauthorized"}),
+            "NotFound": (404, {"status": "success", "data": {}}),
+            "Rejected": "REJECTED",
+            "Unknown": None,
+        }
+        self.service.files = [os.path.join(self.tmp.name, f"{name}.json") for name in upstream]
+        self.service.upstream = upstream
+        job = Job("submit-batch", {"json_dir": self.tmp.name}, store=self.store)
+        self.store.insert(job)
+        self.service.job_id = job.id
+        for name in upstream:
+            job.mark_in_flight(f"{name}.json")
+
+        retry = Job.from_record(self.store.load(job.id), store=self.store)
+        retry.attempts = 2
+        self.submit_api.run_submit_batch(retry, json_dir=self.tmp.name)
+
+        # Only a 2xx answer without a document status means "never received"
+        self.assertEqual(self.service.submitted, ["Unknown.json"])
+        for name in ("Throttled", "Failing", "Unauthorized", "NotFound"):
+            self.assertIn("Upstream status unknown", retry.result_for(f"{name}.json")["error"])
+        self.assertEqual(retry.result_for("Rejected.json")["upstream_status"], "REJECTED")
+        self.assertEqual((retry.success, retry.errors), (1, 5))
+
+class TestJobRoutes(unittest.TestCase):
+    """Job routes of submit_api, served by a test app without the lifespan."""
+
+    def setUp(self):
+        import submit_api
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from job_store import JobStore
+        from jobs import JobManager
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manager = JobManager(store=JobStore(os.path.join(self.tmp.name, "jobs.sqlite3")),
+                                  max_workers=1, poll_interval=0.05)
+        self.release = threading.Event()
+        self.manager.register("demo", self.handler)
+        self.manager.register("submit-batch", lambda job, json_dir: self.release.wait(5))
+        self.manager.start()
+        self.patch = mock.patch.object(submit_api, "job_manager", self.manager)
+        self.patch.start()
+        app = FastAPI()
+        app.include_router(submit_api.router)
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        self.release.set()
+        self.patch.stop()
+        self.manager.shutdown()
+        self.tmp.cleanup()
+
+    def handler(self, job, items):
+        job.set_total(len(items))
+        for i, item in enumerate(items):
+            if i == 1:
+                self.release.wait(5)
+            job.add_result({"status": "success", "item": item}, key=item)
+
+    def events(self, job_id, **kwargs):
+        """[(event, id, data)] of one stream, read until the server closes it."""
+        events, event = [], {}
+        with self.client.stream("GET", f"/api/jobs/{job_id}/events", timeout=10, **kwargs) as response:
+            self.assertEqual(response.headers["content-type"].split(";")[0], "text/event-stream")
+            for line in response.iter_lines():
+                if not line:
+                    events.append((event.get("event"), event.get("id"), json.loads(event["data"])))
+                    event = {}
+                    continue
+                name, _, value = line.partition(": ")
+                event[name] = value
+        return events
+
+    def wait_finished(self, job_id):
+        deadline = time.time() + 5
+        while self.manager.progress(job_id)["status"] not in ("completed", "failed") and time.time() < deadline:
+            time.sleep(0.05)
+
+    def test_results_and_progress_then_done(self):
+        job_id = self.manager.submit("demo", {"items": ["a", "b", "c"]}).id
+        threading.Timer(0.5, self.release.set).start()
+        events = self.events(job_id)
+
+        names = [name for name, _, _ in events]
+        self.assertEqual(names.count("done"), 1)
+        self.assertEqual(names[-1], "done")
+        self.assertIn("progress", names[:-1])
+        results = [(event_id, data["item"]) for name, event_id, data in events if name == "result"]
+        self.assertEqual(results, [("1", "a"), ("2", "b"), ("3", "c")])
+        # The first result arrives while the job is still running
+        first = names.index("progress")
+        self.assertEqual(events[first][2]["status"], "running")
+        self.assertEqual((events[-1][2]["status"], events[-1][2]["done"]), ("completed", 3))
+
+    def test_finished_job_replays_and_resumes(self):
+        self.release.set()
+        job_id = self.manager.submit("demo", {"items": ["a", "b", "c"]}).id
+        self.wait_finished(job_id)
+
+        events = self.events(job_id)
+        self.assertEqual([(name, event_id) for name, event_id, _ in events],
+                         [("result", "1"), ("result", "2"), ("result", "3"), ("progress", None), ("done", None)])
+        page = self.client.get(f"/api/jobs/{job_id}/results", params={"offset": 1, "limit": 1}).json()
+        self.assertEqual((page["total"], [r["item"] for r in page["results"]]), (3, ["b"]))
+        self.assertEqual(self.client.get("/api/jobs/missing/results").status_code, 404)
+
+        resumed = self.events(job_id, headers={"Last-Event-ID": "2"})
+        self.assertEqual([(name, event_id) for name, event_id, _ in resumed],
+                         [("result", "3"), ("progress", None), ("done", None)])
+        caught_up = self.events(job_id, params={"cursor": 3})
+        self.assertEqual([name for name, _, _ in caught_up], ["progress", "done"])
+
+    def test_one_active_submit_batch_per_directory(self):
+        first = self.client.post("/api/submit-batch", json={"json_dir": self.tmp.name})
+        self.assertEqual(first.json()["status"], "queued")
+        # The same directory under another spelling
+        second = self.client.post("/api/submit-batch", json={"json_dir": os.path.join(self.tmp.name, ".", "")})
+        self.assertEqual(second.status_code, 409)
+        self.assertEqual(second.json()["job_id"], first.json()["job_id"])
+        other_dir = os.path.join(self.tmp.name, "other")
+        self.assertEqual(self.client.post("/api/submit-batch", json={"json_dir": other_dir}).status_code, 200)
+
+        self.release.set()
+        self.wait_finished(first.json()["job_id"])
+        self.assertEqual(self.client.post("/api/submit-batch", json={"json_dir": self.tmp.name}).status_code, 200)
+
+    def test_unknown_job_is_404(self):
+        response = self.client.get("/api/jobs/missing/events")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"status": "error", "message": "Job not found: missing"})
+
+if __name__ == '__main__':
+    unittest.main()
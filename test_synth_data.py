@@ -0,0 +1,42 @@
+import unittest
+import os
+import tempfile
+from processor import load_csv, process_etax
+from synth_data import generate, thai_tax_id, to_scientific
+import random
+
+class TestSynthData(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_helpers(self):
+        self.assertEqual(to_scientific("680361000996"), "6.80361000996E+11")
+        self.assertEqual(int(float(to_scientific("100400"))), 100400)
+        tax_id = thai_tax_id(random.Random(1))
+        total = sum(int(d) * (13 - i) for i, d in enumerate(tax_id[:12]))
+        self.assertEqual(int(tax_id[12]), (11 - total % 11) % 10)
+
+    def test_generated_files_run_through_pipeline(self):
+        result = generate(self.tmp.name, rows=600, invoices_per_file=40, lines_per_invoice=3,
+                          miss_rate=0.2, encoding="tis-620", sci_notation=0.5, seed=7)
+        self.assertGreater(len(result["transactions"]), 1)
+        self.assertEqual(sum(len(load_csv(p)) for p in result["transactions"]), 600)
+
+        df = process_etax(result["transactions"][0], result["master_dir"])
+        statuses = set(df['สถานะการจับคู่'])
+        self.assertIn('Full Match', statuses)
+        self.assertIn('Customer Missing', statuses)
+        self.assertFalse(df['เลขที่ใบแจ้งหนี้2'].str.contains('E').any())
+        self.assertTrue(df['วันที่ใบแจ้งหนี้'].str.endswith('2568').all())
+
+    def test_same_seed_same_data(self):
+        a = generate(os.path.join(self.tmp.name, "a"), rows=50, seed=3)
+        b = generate(os.path.join(self.tmp.name, "b"), rows=50, seed=3)
+        with open(a["transactions"][0], "rb") as fa, open(b["transactions"][0], "rb") as fb:
+            self.assertEqual(fa.read(), fb.read())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import os
+import tempfile
+import time
+from unittest import mock
+from API_AXONS import AxonsETaxService
+from token_store import TokenStore
+
+class TestTokenStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "tokens.sqlite3")
+        self.fetches = 0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def fetch(self):
+        self.fetches += 1
+        return f"token-{self.fetches}", time.time() + 3600
+
+    def test_token_shared_between_stores(self):
+        first, second = TokenStore(self.db), TokenStore(self.db)
+        self.assertEqual(first.get("tsp", self.fetch)[0], "token-1")
+        self.assertEqual(second.get("tsp", self.fetch)[0], "token-1")
+        self.assertEqual(self.fetches, 1)
+
+    def test_expiring_or_invalidated_token_is_refetched(self):
+        store = TokenStore(self.db)
+        store.get("tsp", lambda: ("old", time.time() + 30))
+        self.assertEqual(store.get("tsp", self.fetch, margin=60)[0], "token-1")
+        TokenStore(self.db).invalidate("tsp")
+        self.assertEqual(store.get("tsp", self.fetch)[0], "token-2")
+
+    def test_service_token_comes_from_the_shared_store(self):
+        first = AxonsETaxService(token_store=TokenStore(self.db))
+        second = AxonsETaxService(token_store=TokenStore(self.db))
+        with mock.patch.object(AxonsETaxService, "_request_access_token", side_effect=self.fetch):
+            self.assertEqual(first.get_access_token(), "token-1")
+            self.assertEqual(second.get_access_token(), "token-1")
+            second.invalidate_access_token()
+            self.assertEqual(second.get_access_token(), "token-2")
+        self.assertEqual(self.fetches, 2)
+
+    def test_manual_token_only_when_configured(self):
+        service = AxonsETaxService(token_store=TokenStore(self.db))
+        with mock.patch.object(AxonsETaxService, "_request_access_token", side_effect=self.fetch):
+            with mock.patch.object(service.config, "ETAX_MANUAL_TOKEN", "manual"):
+                self.assertEqual(service.get_access_token(), "manual")
+            self.assertEqual(service.get_access_token(), "token-1")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import json
+import os
+import tempfile
+import tracing
+from tracing import FileExporter, MemoryExporter, span, start_trace, traced, doc_trace_id
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.exporter = MemoryExporter()
+        self.previous = tracing.set_exporter(self.exporter)
+
+    def tearDown(self):
+        tracing.set_exporter(self.previous)
+
+    def test_spans_nest_within_a_trace(self):
+        @traced("child")
+        def child():
+            with span("grandchild", step=2):
+                pass
+
+        with start_trace("document", trace_id=doc_trace_id("680361000996"), doc_number="680361000996") as root:
+            child()
+
+        spans = {s["name"]: s for s in self.exporter.spans}
+        self.assertEqual(set(spans), {"document", "child", "grandchild"})
+        self.assertTrue(all(s["traceId"] == root.trace_id for s in spans.values()))
+        self.assertEqual(spans["document"]["parentSpanId"], "")
+        self.assertEqual(spans["child"]["parentSpanId"], spans["document"]["spanId"])
+        self.assertEqual(spans["grandchild"]["parentSpanId"], spans["child"]["spanId"])
+        self.assertEqual(spans["grandchild"]["attributes"], {"step": 2})
+        self.assertEqual(doc_trace_id("680361000996"), root.trace_id)
+
+    def test_errors_and_links(self):
+        with start_trace("submit_batch", trace_id="job1"):
+            with self.assertRaises(ValueError):
+                with start_trace("document"):
+                    raise ValueError("bad document")
+
+        doc, batch = self.exporter.spans
+        self.assertEqual(doc["status"], {"code": "ERROR", "message": "ValueError: bad document"})
+        self.assertEqual(doc["attributes"]["link.traceId"], "job1")
+        self.assertNotEqual(doc["traceId"], "job1")
+        self.assertEqual(batch["status"]["code"], "OK")
+        self.assertIsNone(tracing.current_span())
+
+    def test_file_exporter_rotates_by_size(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "traces", "traces.jsonl")
+            line_bytes = len(json.dumps(tracing.Span("s00", "t").to_dict()) + "\n")
+            exporter = FileExporter(path, max_bytes=line_bytes * 3, backups=2)
+            # A second process appending to the same file
+            other = FileExporter(path, max_bytes=line_bytes * 3, backups=2)
+            tracing.set_exporter(exporter)
+            for i in range(10):
+                with start_trace(f"s{i:02d}", trace_id="t"):
+                    pass
+                if i == 6:
+                    other.export(tracing.Span("other", "t"))
+
+            self.assertEqual(sorted(os.listdir(os.path.dirname(path))),
+                             ["traces.jsonl", "traces.jsonl.1", "traces.jsonl.2"])
+            names = []
+            for suffix in (".2", ".1", ""):
+                with open(path + suffix, encoding="utf-8") as f:
+                    lines = [json.loads(line)["name"] for line in f]
+                self.assertLessEqual(len(lines), 3)
+                names += lines
+            # Oldest spans dropped; nothing lost between rotations
+            self.assertEqual(names[-4:], ["other", "s07", "s08", "s09"])
+
+if __name__ == '__main__':
+    unittest.main()
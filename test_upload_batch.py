@@ -0,0 +1,58 @@
+import unittest
+import hashlib
+import os
+import shutil
+import tempfile
+import pandas as pd
+from jobs import Job
+from result_store import ResultStore
+from synth_data import generate
+from upload_batch import find_duplicate_invoices, process_batch
+from upload_pool import UploadPool
+
+class TestUploadBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dataset = generate(self.tmp.name, rows=200, invoices_per_file=20, lines_per_invoice=4, seed=9)
+        self.upload_dir = os.path.join(self.tmp.name, "uploads")
+        os.makedirs(self.upload_dir)
+        self.pool = UploadPool(max_workers=2, queue_size=0)
+
+    def tearDown(self):
+        self.pool.shutdown()
+        self.tmp.cleanup()
+
+    def spool(self, source, name):
+        path = os.path.join(self.upload_dir, f"{len(os.listdir(self.upload_dir))}_{name}")
+        shutil.copy(source, path)
+        with open(path, "rb") as f:
+            sha = hashlib.sha256(f.read()).hexdigest()
+        return {"path": path, "sha256": sha, "filename": name}
+
+    def test_find_duplicate_invoices(self):
+        frames = {
+            "a.csv": pd.DataFrame({"เลขที่ใบแจ้งหนี้2": ["1", "1", "2"]}),
+            "b.csv": pd.DataFrame({"เลขที่ใบแจ้งหนี้2": ["2", "3"]}),
+        }
+        self.assertEqual(find_duplicate_invoices(frames), {"2": ["a.csv", "b.csv"]})
+
+    def test_batch_processes_files_and_reuses_repeats(self):
+        first, second = self.dataset["transactions"][:2]
+        files = [self.spool(first, "a.csv"), self.spool(second, "b.csv"), self.spool(first, "a.csv")]
+        job, store = Job("upload-batch"), ResultStore(ttl_seconds=60, max_bytes=0)
+
+        process_batch(job, files, self.dataset["master_dir"], os.path.join(self.tmp.name, "json"),
+                      self.pool, store, poll_interval=0.05)
+
+        self.assertEqual((job.total, job.success, job.errors), (3, 3, 0))
+        repeat = [r for r in job.results if r.get("duplicate_of")]
+        self.assertEqual([(r["filename"], r["duplicate_of"]) for r in repeat], [("a.csv (2)", "a.csv")])
+        self.assertEqual(job.summary["files"], 2)
+        self.assertEqual(job.summary["duplicate_invoice_count"], 0)
+        combined = store.get(job.summary["result_id"])
+        self.assertEqual(len(combined), sum(r["rows"] for r in job.results if not r.get("duplicate_of")))
+        # Archived once per distinct content
+        self.assertEqual(len(os.listdir(self.upload_dir)), 2)
+
+if __name__ == '__main__':
+    unittest.main()
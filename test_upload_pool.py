@@ -0,0 +1,71 @@
+import unittest
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from synth_data import generate
+from upload_pool import UploadPool, UploadPoolFull, UploadCancelled
+
+class TestUploadPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.dataset = generate(cls.tmp.name, rows=120, lines_per_invoice=4, seed=5)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        self.pool = UploadPool(max_workers=1, queue_size=0)
+        self.json_dir = os.path.join(self.tmp.name, self.id().rsplit(".", 1)[-1])
+        # run() deletes uploads it does not return a result for
+        self.upload = shutil.copy(self.dataset["transactions"][0], self.json_dir + ".csv")
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def run_upload(self, upload=None, **kwargs):
+        return self.pool.run(upload or self.upload, self.dataset["master_dir"],
+                             self.json_dir, poll_interval=0.05, **kwargs)
+
+    def test_processes_in_worker_and_bounds_admission(self):
+        rejected = shutil.copy(self.upload, self.json_dir + "-rejected.csv")
+
+        async def scenario():
+            first = asyncio.ensure_future(self.run_upload())
+            await asyncio.sleep(0)
+            with self.assertRaises(UploadPoolFull):
+                await self.run_upload(rejected)
+            return await first
+
+        result = asyncio.run(scenario())
+        self.assertEqual(result["rows"], 120)
+        self.assertEqual(len(result["df"]), 120)
+        self.assertEqual(result["json_count"], len(os.listdir(self.json_dir)))
+        self.assertIn(("process_etax",), result["metrics"]["etax_stage_duration_seconds"])
+        self.assertEqual(self.pool.in_flight, 0)
+        # The caller archives processed uploads; rejected ones are removed
+        self.assertTrue(os.path.exists(self.upload))
+        self.assertFalse(os.path.exists(rejected))
+
+    def test_disconnect_cancels(self):
+        async def gone():
+            return True
+
+        with self.assertRaises(UploadCancelled):
+            asyncio.run(self.run_upload(is_disconnected=gone))
+
+        # The running worker sees the cancel marker and skips its JSON output;
+        # the upload and the marker are removed once it is done
+        deadline = time.time() + 60
+        while (self.pool.in_flight or os.path.exists(self.upload)) and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.pool.in_flight, 0)
+        self.assertFalse(os.path.exists(self.json_dir))
+        self.assertFalse(os.path.exists(self.upload))
+        self.assertFalse(os.path.exists(self.upload + ".cancelled"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+import zipfile
+from upload_spool import spool_upload, archive_by_hash, extract_zip, upload_extension, UploadTooLarge
+from master_data import master_version
+
+class FakeUpload:
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+        self.reads = []
+
+    async def read(self, size=-1):
+        self.reads.append(size)
+        return self.stream.read(size)
+
+class TestUploadSpool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dest = os.path.join(self.tmp.name, "uploads", "upload.csv")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_streams_in_chunks_and_hashes(self):
+        data = os.urandom(10_000)
+        upload = FakeUpload(data)
+        result = asyncio.run(spool_upload(upload, self.dest, max_bytes=0, chunk_size=4096))
+        self.assertEqual(result["size"], 10_000)
+        self.assertEqual(result["sha256"], hashlib.sha256(data).hexdigest())
+        self.assertEqual(set(upload.reads), {4096})
+        with open(self.dest, "rb") as f:
+            self.assertEqual(f.read(), data)
+
+    def test_size_limit_enforced_while_streaming(self):
+        upload = FakeUpload(b"x" * 10_000)
+        with self.assertRaises(UploadTooLarge):
+            asyncio.run(spool_upload(upload, self.dest, max_bytes=5000, chunk_size=1024))
+        self.assertLessEqual(len(upload.reads), 5)
+        self.assertEqual(os.listdir(os.path.dirname(self.dest)), [])
+
+    def test_archive_by_hash_stores_content_once(self):
+        archive_dir = os.path.join(self.tmp.name, "uploads")
+        paths = []
+        for i in range(2):
+            result = asyncio.run(spool_upload(FakeUpload(b"same content"), os.path.join(archive_dir, f"u{i}.csv")))
+            paths.append(archive_by_hash(result["path"], result["sha256"], archive_dir))
+        self.assertEqual(paths[0], paths[1])
+        self.assertEqual(os.listdir(archive_dir), [os.path.basename(paths[0])])
+
+    def test_upload_extension_keeps_compressed_report_type(self):
+        self.assertEqual(upload_extension("Report.CSV.GZ"), ".csv.gz")
+        self.assertEqual(upload_extension("report.xlsx.zst"), ".xlsx.zst")
+        self.assertEqual(upload_extension("report.gz"), ".gz")
+        self.assertEqual(upload_extension("batch.v2.zip"), ".zip")
+
+    def test_extract_zip_keeps_reports_only(self):
+        zip_path = os.path.join(self.tmp.name, "batch.zip")
+        with zipfile.ZipFile(zip_path, "w") as zf:
+            zf.writestr("station1/report.csv", "a,b\n1,2\n")
+            zf.writestr("station2/report.xlsx", b"xlsx")
+            zf.writestr("notes.txt", "skip")
+            zf.writestr("__MACOSX/.report.csv", "skip")
+        members = extract_zip(zip_path, os.path.join(self.tmp.name, "out"))
+        self.assertEqual([m["name"] for m in members], ["station1/report.csv", "station2/report.xlsx"])
+        self.assertEqual(members[0]["sha256"], hashlib.sha256(b"a,b\n1,2\n").hexdigest())
+
+        with self.assertRaises(UploadTooLarge):
+            extract_zip(zip_path, os.path.join(self.tmp.name, "small"), max_bytes=5)
+        self.assertEqual(os.listdir(os.path.join(self.tmp.name, "small")), [])
+
+    def test_master_version_tracks_content(self):
+        master_dir = os.path.join(self.tmp.name, "Master")
+        os.makedirs(master_dir)
+        path = os.path.join(master_dir, "Customer_Tax ID.csv")
+        with open(path, "w") as f:
+            f.write("a,b\n1,2\n")
+        v1 = master_version(master_dir)
+        self.assertEqual(master_version(master_dir), v1)
+        with open(path, "a") as f:
+            f.write("3,4\n")
+        self.assertNotEqual(master_version(master_dir), v1)
+
+if __name__ == '__main__':
+    unittest.main()
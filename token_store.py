@@ -0,0 +1,89 @@
+"""
+token_store.py - OAuth2 access tokens shared by all server processes.
+With several web workers each process would otherwise request (and cache)
+its own token. Tokens live in a small SQLite database instead; a refresh
+takes the database write lock, so only one process fetches a new token
+while the others wait for it and then reuse it.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    name TEXT PRIMARY KEY,
+    token TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class TokenStore:
+    """Cross-process token cache (one connection per store, opened on first use)."""
+
+    def __init__(self, path: str = None, timeout: float = 60):
+        self.path = path or Config.TOKEN_DB_PATH
+        # Longer than a token request, so waiting processes outlast the refresh
+        self.timeout = timeout
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _read(self, name: str):
+        row = self._conn.execute("SELECT token, expires_at FROM tokens WHERE name = ?", (name,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def get(self, name: str, fetch, margin: float = 60) -> tuple:
+        """
+        Valid token for name, fetching a new one when missing or expiring.
+
+        Args:
+            fetch: Callable returning (token, expires_at epoch seconds); called
+                by at most one process at a time.
+            margin: Seconds before expiry at which a token counts as expired.
+
+        Returns:
+            (token, expires_at)
+        """
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect()
+            cached = self._read(name)
+            if cached and time.time() < cached[1] - margin:
+                return cached
+
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have refreshed it while we waited for the lock
+                cached = self._read(name)
+                if not (cached and time.time() < cached[1] - margin):
+                    cached = fetch()
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO tokens (name, token, expires_at) VALUES (?, ?, ?)",
+                        (name, *cached)
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return cached
+
+    def invalidate(self, name: str):
+        """Drop a token the upstream rejected, so the next get() fetches a new one."""
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect()
+            self._conn.execute("DELETE FROM tokens WHERE name = ?", (name,))
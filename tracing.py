@@ -0,0 +1,213 @@
+"""
+tracing.py - Lightweight trace spans for uploads and per-document submission.
+Spans nest through contextvars and are exported as JSON lines using the
+OTLP/JSON span field names (traceId, spanId, parentSpanId, ...), one span per
+line, so a batch can be analysed offline or replayed into a collector.
+
+Trace scopes:
+    upload      trace_id = upload ID (returned by /upload)
+    submit job  trace_id = job ID
+    document    trace_id derived from DOC_NUMBER, so every attempt to
+                submit the same document lands in the same trace
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar("etax_current_span", default=None)
+_DOC_NAMESPACE = uuid.UUID("5f8c2a52-3f0e-4bb4-9d0e-6b2f5d1f7e11")
+
+
+class Span:
+    """One timed operation within a trace."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def to_dict(self) -> dict:
+        end_ns = self.end_ns or time.time_ns()
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": end_ns,
+            "durationMs": round((end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"}
+        }
+
+
+class FileExporter:
+    """
+    Appends finished spans to a JSON-lines file, rotating it by size.
+    Several server processes may share the file: a process that finds the
+    path rotated by another one reopens it instead of writing to the backup.
+    """
+
+    def __init__(self, path: str, max_bytes: int = None, backups: int = None):
+        """
+        Args:
+            max_bytes: Size at which the file is rotated to path.1 (0: never).
+            backups: Rotated files kept (path.1 ... path.N, oldest dropped).
+        """
+        self.path = path
+        self.max_bytes = Config.TRACE_MAX_BYTES if max_bytes is None else max_bytes
+        self.backups = Config.TRACE_BACKUPS if backups is None else backups
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _open(self):
+        trace_dir = os.path.dirname(self.path)
+        if trace_dir and not os.path.exists(trace_dir):
+            os.makedirs(trace_dir)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _rotated_elsewhere(self) -> bool:
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _rotate(self):
+        self._close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            if self._file is not None and self.max_bytes and self._rotated_elsewhere():
+                self._close()
+            if self._file is None:
+                self._open()
+            if self.max_bytes and self._file.tell() and self._file.tell() + len(line.encode("utf-8")) > self.max_bytes:
+                self._rotate()
+                self._open()
+            self._file.write(line)
+            self._file.flush()
+
+
+class MemoryExporter:
+    """Keeps finished spans in a list (tests and benchmarks)."""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            self.spans.append(span.to_dict())
+
+
+_exporter = FileExporter(Config.TRACE_PATH) if Config.TRACE_ENABLED else None
+
+
+def set_exporter(exporter):
+    """Replace the span exporter (None disables export); returns the previous one."""
+    global _exporter
+    previous, _exporter = _exporter, exporter
+    return previous
+
+
+def current_span() -> Span:
+    return _current_span.get()
+
+
+def remote_parent(trace_id: str, span_id: str) -> Span:
+    """Stand-in for a span living in another process, for use as span(parent=...)."""
+    s = Span("remote", trace_id)
+    s.span_id = span_id
+    return s
+
+
+def doc_trace_id(doc_number: str) -> str:
+    """Stable trace ID for a document number."""
+    return uuid.uuid5(_DOC_NAMESPACE, str(doc_number)).hex
+
+
+@contextmanager
+def _activate(s: Span):
+    """Make s the current span for the block, then end and export it."""
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        s.end_ns = time.time_ns()
+        exporter = _exporter
+        if exporter is not None:
+            try:
+                exporter.export(s)
+            except Exception as e:
+                logger.warning(f"Failed to export span {s.name}: {e}")
+
+
+def span(name: str, parent: Span = None, **attributes):
+    """
+    Time a block as a child of parent (default: the current span).
+    Without any parent the span starts a new trace.
+    """
+    parent = parent or _current_span.get()
+    if parent is None:
+        return _activate(Span(name, uuid.uuid4().hex, None, attributes))
+    return _activate(Span(name, parent.trace_id, parent.span_id, attributes))
+
+
+def start_trace(name: str, trace_id: str = None, **attributes):
+    """
+    Open the root span of a new trace. When called inside another trace the
+    enclosing span is recorded as link.traceId / link.spanId.
+    """
+    enclosing = _current_span.get()
+    if enclosing is not None:
+        attributes.setdefault("link.traceId", enclosing.trace_id)
+        attributes.setdefault("link.spanId", enclosing.span_id)
+    return _activate(Span(name, trace_id or uuid.uuid4().hex, None, attributes))
+
+
+def traced(name: str):
+    """Decorator: run the function inside span(name)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
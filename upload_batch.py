@@ -0,0 +1,203 @@
+"""
+upload_batch.py - Multi-file upload batches (many reports or a zip of them).
+Files are processed in parallel on the upload process pool, reusing cached
+results for files already processed against the same master data. The
+batch ends with one combined result and a report of invoice numbers that
+appear in more than one file.
+"""
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+import metrics
+import tracing
+from master_data import master_version
+from result_store import INVOICE_COLUMN, summarize_frame
+from upload_pool import UploadPoolFull
+from upload_spool import archive_by_hash, archived_path
+
+logger = logging.getLogger(__name__)
+
+# Duplicate invoices listed in the job summary; the count is always complete
+MAX_REPORTED_DUPLICATES = 200
+
+
+def find_duplicate_invoices(frames: dict) -> dict:
+    """
+    Invoice numbers present in more than one file.
+
+    Args:
+        frames: {filename: processed DataFrame}
+
+    Returns:
+        {invoice number: [filenames]}
+    """
+    seen = {}
+    for name, df in frames.items():
+        if INVOICE_COLUMN not in df.columns:
+            continue
+        for invoice in df[INVOICE_COLUMN].dropna().astype(str).unique():
+            seen.setdefault(invoice, []).append(name)
+    return {invoice: names for invoice, names in seen.items() if len(names) > 1}
+
+
+def _unique_names(files: list) -> list:
+    """Suffix repeated filenames (" (2)", " (3)", ...) so each file has its own label."""
+    used = set()
+    for entry in files:
+        name, n = entry["filename"], 2
+        while name in used:
+            name, n = f"{entry['filename']} ({n})", n + 1
+        used.add(name)
+        entry["filename"] = name
+    return files
+
+
+def _file_result(entry: dict, result_id: str, df, json_count, cached: bool) -> dict:
+    return {
+        "status": "success",
+        "filename": entry["filename"],
+        "result_id": result_id,
+        "rows": len(df),
+        "invoices": int(df[INVOICE_COLUMN].nunique()) if INVOICE_COLUMN in df.columns else None,
+        "json_count": json_count,
+        "cached": cached
+    }
+
+
+def _archive(entry: dict):
+    # A resumed batch may find the file already moved to its archive name
+    if os.path.exists(entry["path"]):
+        archive_by_hash(entry["path"], entry["sha256"], os.path.dirname(entry["path"]))
+
+
+def process_batch(job, files: list, master_dir: str, output_json_dir: str, pool, store, poll_interval: float = 1.0):
+    """
+    Job body for a batch upload. Results are keyed by file label, so a
+    resumed job keeps the files whose results are still in the store and
+    processes the rest again.
+
+    Args:
+        job: jobs.Job; one result per file, combined statistics via set_summary().
+        files: Spooled uploads, [{"path", "sha256", "filename", ...}].
+        pool: upload_pool.UploadPool the files are processed on.
+        store: result_store.ResultStore holding per-file and combined results.
+    """
+    job.set_total(len(files))
+    master_ver = master_version(master_dir)
+    frames = {}  # filename -> processed DataFrame
+    result_ids = {}  # filename -> result_id
+
+    with tracing.start_trace("upload_batch", trace_id=job.id, files=len(files)) as batch_span:
+        trace_parent = (batch_span.trace_id, batch_span.span_id)
+
+        # Files already processed (repeats within this batch, or earlier uploads)
+        queue = deque()
+        first_by_key = {}
+        repeats = []
+        for entry in _unique_names(files):
+            name = entry["filename"]
+            previous = job.result_for(name)
+            if previous and previous.get("result_id") and not previous.get("duplicate_of"):
+                df = store.get(previous["result_id"]) if previous["status"] == "success" else None
+                if df is not None:
+                    frames[name], result_ids[name] = df, previous["result_id"]
+                    first_by_key[f"{entry['sha256']}:{master_ver}"] = entry
+                    continue
+            if not os.path.exists(entry["path"]):
+                entry["path"] = archived_path(entry["path"], entry["sha256"])
+
+            key = f"{entry['sha256']}:{master_ver}"
+            if key in first_by_key:
+                repeats.append((entry, first_by_key[key]))
+                continue
+            first_by_key[key] = entry
+            cached_id = store.find(key)
+            df = store.get(cached_id) if cached_id else None
+            if df is not None:
+                _archive(entry)
+                metrics.UPLOAD_RESULTS.inc(source="cache")
+                frames[name] = df
+                result_ids[name] = cached_id
+                job.add_result(_file_result(entry, cached_id, df, store.meta(cached_id).get("json_count"), True), key=name)
+            else:
+                queue.append(entry)
+
+        # Keep at most one file per worker in flight so other uploads still get a slot
+        in_flight = {}
+        while queue or in_flight:
+            while queue and len(in_flight) < pool.max_workers:
+                entry = queue[0]
+                try:
+                    future = pool.submit(entry["path"], master_dir, output_json_dir, trace_parent)
+                except UploadPoolFull:
+                    break
+                in_flight[future] = queue.popleft()
+            if not in_flight:
+                time.sleep(poll_interval)
+                continue
+
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                entry = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool as e:
+                    logger.error("Upload worker terminated abruptly, recreating the pool")
+                    pool.shutdown()
+                    job.add_result({"status": "error", "filename": entry["filename"], "error": str(e)}, key=entry["filename"])
+                    continue
+                except Exception as e:
+                    logger.error(f"Batch {job.id}: {entry['filename']} failed: {e}")
+                    job.add_result({"status": "error", "filename": entry["filename"], "error": str(e)}, key=entry["filename"])
+                    continue
+
+                metrics.REGISTRY.merge(result["metrics"])
+                df = result["df"]
+                result_id = uuid.uuid4().hex
+                store.put(result_id, df, {
+                    "filename": entry["filename"],
+                    "sha256": entry["sha256"],
+                    "master_version": master_ver,
+                    "json_count": result["json_count"]
+                }, key=f"{entry['sha256']}:{master_ver}")
+                _archive(entry)
+                metrics.UPLOAD_RESULTS.inc(source="processed")
+                frames[entry["filename"]] = df
+                result_ids[entry["filename"]] = result_id
+                job.add_result(_file_result(entry, result_id, df, result["json_count"], False), key=entry["filename"])
+
+        # Identical copies are reported but left out of the combined result
+        for entry, original in repeats:
+            if original["filename"] not in frames:
+                job.add_result({"status": "error", "filename": entry["filename"],
+                                "error": f"Same content as {original['filename']}, which failed"}, key=entry["filename"])
+                continue
+            if os.path.exists(entry["path"]):
+                os.remove(entry["path"])
+            result = _file_result(entry, result_ids[original["filename"]], frames[original["filename"]], 0, True)
+            result["duplicate_of"] = original["filename"]
+            job.add_result(result, key=entry["filename"])
+
+        duplicates = find_duplicate_invoices(frames)
+        combined = pd.concat(frames.values(), ignore_index=True) if frames else pd.DataFrame()
+        if frames:
+            store.put(job.id, combined, {"filename": f"batch of {len(frames)} files", "batch": True})
+        batch_span.set_attribute("rows", len(combined))
+        batch_span.set_attribute("duplicate_invoices", len(duplicates))
+
+    if duplicates:
+        logger.warning(f"Batch {job.id}: {len(duplicates)} invoice number(s) appear in more than one file")
+    job.set_summary({
+        "result_id": job.id if frames else None,
+        "files": len(frames),
+        "duplicate_invoice_count": len(duplicates),
+        "duplicate_invoices": dict(list(duplicates.items())[:MAX_REPORTED_DUPLICATES]),
+        "summary": summarize_frame(combined) if frames else None
+    })
@@ -0,0 +1,194 @@
+"""
+upload_pool.py - Runs CPU-bound upload processing in worker processes.
+Keeps process_etax / save_to_individual_json off the FastAPI event loop, so
+concurrent uploads are processed in parallel and health checks stay
+responsive. Admission is bounded (workers + queue) and abandoned uploads are
+cancelled when the client disconnects.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class UploadPoolFull(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class UploadCancelled(Exception):
+    """Raised when the client disconnected before processing finished."""
+
+
+def cancel_marker(archive_path: str) -> str:
+    return archive_path + ".cancelled"
+
+
+def process_upload(archive_path: str, master_dir: str, output_json_dir: str, trace_parent: tuple = None) -> dict:
+    """
+    Worker-process body: process one uploaded file and write its JSON files.
+
+    Args:
+        archive_path: Saved upload.
+        master_dir: Directory with the Master CSV files.
+        output_json_dir: Destination for the per-invoice JSON files.
+        trace_parent: (trace_id, span_id) of the request's upload span.
+
+    Returns:
+        {"df": processed DataFrame, "json_count", "rows", "metrics": snapshot}; or
+        {"cancelled": True, ...} when the client went away mid-processing.
+    """
+    # Imported here so the parent process does not need pandas for the pool itself
+    import metrics
+    import tracing
+    from processor import process_etax, save_to_individual_json
+
+    parent = tracing.remote_parent(*trace_parent) if trace_parent else None
+    with tracing.span("upload.worker", parent=parent, pid=os.getpid()):
+        processed_df = process_etax(archive_path, master_dir)
+
+        # Skip writing output for uploads nobody is waiting for
+        if os.path.exists(cancel_marker(archive_path)):
+            os.remove(cancel_marker(archive_path))
+            logger.info(f"Upload {archive_path} cancelled by client, skipping JSON output")
+            return {"cancelled": True, "rows": len(processed_df), "metrics": metrics.REGISTRY.drain()}
+
+        saved_jsons = save_to_individual_json(processed_df, output_json_dir)
+        return {
+            "df": processed_df,
+            "json_count": len(saved_jsons),
+            "rows": len(processed_df),
+            "metrics": metrics.REGISTRY.drain()
+        }
+
+
+def _init_worker():
+    import metrics
+    # Workers are spawned (fresh interpreter), so counters start empty; drop
+    # anything recorded while importing so snapshots only cover upload work
+    metrics.REGISTRY.drain()
+
+
+def _remove_files(paths: list):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove {path}: {e}")
+
+
+class UploadPool:
+    """Bounded process pool for upload processing."""
+
+    def __init__(self, max_workers: int = None, queue_size: int = None):
+        self.max_workers = max_workers or Config.UPLOAD_WORKERS
+        self.capacity = self.max_workers + (Config.UPLOAD_QUEUE_SIZE if queue_size is None else queue_size)
+        self._executor = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # Spawned lazily; "spawn" keeps workers independent of the server's threads
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+        return self._executor
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._in_flight -= 1
+
+    def submit(self, archive_path: str, master_dir: str, output_json_dir: str, trace_parent: tuple = None):
+        """
+        Admit one upload and start it in the pool.
+
+        Returns:
+            concurrent.futures.Future resolving to process_upload()'s result.
+
+        Raises:
+            UploadPoolFull: No worker or queue slot is free.
+        """
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                raise UploadPoolFull(f"Upload queue is full ({self._in_flight} in progress)")
+            self._in_flight += 1
+
+        try:
+            future = self._pool().submit(process_upload, archive_path, master_dir, output_json_dir, trace_parent)
+        except Exception:
+            self._release()
+            raise
+        # The slot is freed when the worker finishes, even if the client left
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, archive_path: str, master_dir: str, output_json_dir: str,
+                  is_disconnected=None, trace_parent: tuple = None, poll_interval: float = 0.5) -> dict:
+        """
+        Process an upload in the pool and wait for it without blocking the loop.
+
+        Args:
+            is_disconnected: Optional async callable; when it returns True the
+                upload is cancelled (dropped if still queued, output skipped
+                if already running).
+
+        Raises:
+            UploadPoolFull: No worker or queue slot is free.
+            UploadCancelled: The client disconnected.
+
+        Unless a result is returned (the caller then archives the upload),
+        the upload file is deleted (also when the pool is full), together
+        with any cancel marker, as soon as no worker uses them any more.
+        """
+        future = None
+        returned = False
+        try:
+            future = self.submit(archive_path, master_dir, output_json_dir, trace_parent)
+            waiter = asyncio.wrap_future(future)
+            while True:
+                done, _ = await asyncio.wait({waiter}, timeout=poll_interval)
+                if done:
+                    try:
+                        result = waiter.result()
+                    except BrokenProcessPool:
+                        # A worker died (e.g. out of memory); start a fresh pool next time
+                        logger.error("Upload worker terminated abruptly, recreating the pool")
+                        self.shutdown()
+                        raise
+                    if result.get("cancelled"):
+                        raise UploadCancelled("Upload cancelled by client")
+                    returned = True
+                    return result
+                if is_disconnected is not None and await is_disconnected():
+                    if not future.cancel():
+                        # Already running: ask the worker to skip its output
+                        open(cancel_marker(archive_path), "w").close()
+                    logger.info(f"Client disconnected, cancelled upload {archive_path}")
+                    raise UploadCancelled("Upload cancelled by client")
+        finally:
+            leftovers = [cancel_marker(archive_path)] + ([] if returned else [archive_path])
+            if future is None or future.done():
+                _remove_files(leftovers)
+            else:
+                # Still running after a disconnect: clean up once the worker is done
+                future.add_done_callback(lambda _future: _remove_files(leftovers))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
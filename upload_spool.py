@@ -0,0 +1,173 @@
+"""
+upload_spool.py - Streams uploaded files to disk in fixed-size chunks.
+The upload is never held in memory as a whole: it is copied chunk by chunk,
+hashed on the way in and rejected as soon as it exceeds the size limit.
+Processed uploads are then archived under their content hash.
+"""
+import hashlib
+import logging
+import os
+import uuid
+import zipfile
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Transaction report formats accepted by processor.load_csv
+UPLOAD_EXTENSIONS = ('.csv', '.xls', '.xlsx')
+# Compressed reports (.csv.gz, .xlsx.zst, a .zip holding one report, ...)
+COMPRESSED_EXTENSIONS = ('.gz', '.zst', '.zip')
+
+
+def upload_extension(filename: str) -> str:
+    """
+    Lower-case extension of an uploaded file, keeping the report type of
+    compressed files (".csv.gz", ".xlsx.zst"); a bare ".gz" / ".zst" is
+    returned as is and read as CSV.
+    """
+    root, ext = os.path.splitext(filename.lower())
+    if ext in ('.gz', '.zst'):
+        inner = os.path.splitext(root)[1]
+        if inner in UPLOAD_EXTENSIONS:
+            return inner + ext
+    return ext
+
+
+def is_report_extension(ext: str) -> bool:
+    """True for an upload_extension() processor.load_csv can read, compressed or not."""
+    return ext in UPLOAD_EXTENSIONS or ext.endswith(COMPRESSED_EXTENSIONS)
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds Config.UPLOAD_MAX_BYTES."""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds the {limit // (1024 * 1024)} MB limit")
+        self.limit = limit
+
+
+async def spool_upload(upload, dest_path: str, max_bytes: int = None, chunk_size: int = None) -> dict:
+    """
+    Copy an UploadFile to dest_path.
+
+    Args:
+        upload: Starlette/FastAPI UploadFile (anything with async read(n)).
+        dest_path: Target file; written via a .part file and renamed when complete.
+        max_bytes: Size limit (default Config.UPLOAD_MAX_BYTES, 0 = unlimited).
+        chunk_size: Read size (default Config.UPLOAD_CHUNK_SIZE).
+
+    Returns:
+        {"path", "size", "sha256"}
+
+    Raises:
+        UploadTooLarge: The limit was hit; the partial file is removed.
+    """
+    max_bytes = Config.UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    chunk_size = chunk_size or Config.UPLOAD_CHUNK_SIZE
+    dest_dir = os.path.dirname(dest_path)
+    if dest_dir and not os.path.exists(dest_dir):
+        os.makedirs(dest_dir)
+
+    digest = hashlib.sha256()
+    size = 0
+    part_path = dest_path + ".part"
+    try:
+        with open(part_path, "wb") as f:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                digest.update(chunk)
+                f.write(chunk)
+        os.replace(part_path, dest_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+    logger.info(f"Spooled upload to {dest_path} ({size} bytes)")
+    return {"path": dest_path, "size": size, "sha256": digest.hexdigest()}
+
+
+def archived_path(path: str, sha256: str, archive_dir: str = None) -> str:
+    """Content-addressed archive name of a spooled upload (see archive_by_hash)."""
+    return os.path.join(archive_dir or os.path.dirname(path), f"{sha256}{upload_extension(path)}")
+
+
+def archive_by_hash(path: str, sha256: str, archive_dir: str) -> str:
+    """
+    Move a spooled upload to its content-addressed archive name
+    (<sha256><ext>). If that content is already archived, the new copy is
+    deleted instead, so repeated uploads of a file are stored once.
+
+    Returns:
+        Path of the archived file.
+    """
+    target = archived_path(path, sha256, archive_dir)
+    if os.path.exists(target):
+        os.remove(path)
+        logger.info(f"Upload already archived as {target}, dropped duplicate copy")
+    else:
+        os.replace(path, target)
+    return target
+
+
+def extract_zip(zip_path: str, dest_dir: str, max_bytes: int = None, chunk_size: int = None) -> list:
+    """
+    Extract the transaction reports from a zip upload (UPLOAD_EXTENSIONS,
+    plus .gz / .zst compressed reports, which stay compressed).
+    Members are streamed out chunk by chunk, hashed and size-checked like a
+    direct upload; folders, hidden files and other file types are skipped.
+
+    Returns:
+        [{"path", "size", "sha256", "name"}] in archive order.
+
+    Raises:
+        UploadTooLarge: A member exceeds max_bytes; files extracted so far are removed.
+        zipfile.BadZipFile: Not a zip archive.
+    """
+    max_bytes = Config.UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    chunk_size = chunk_size or Config.UPLOAD_CHUNK_SIZE
+    os.makedirs(dest_dir, exist_ok=True)
+
+    extracted = []
+    try:
+        with zipfile.ZipFile(zip_path) as zf:
+            for info in zf.infolist():
+                name = os.path.basename(info.filename)
+                ext = upload_extension(name)
+                if info.is_dir() or not name or name.startswith('.') or not is_report_extension(ext) or ext == '.zip':
+                    continue
+                if max_bytes and info.file_size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+
+                dest_path = os.path.join(dest_dir, f"zip_{uuid.uuid4().hex[:8]}{ext}")
+                digest = hashlib.sha256()
+                size = 0
+                # Track the file before writing so a failure mid-member cleans it up
+                entry = {"path": dest_path, "size": 0, "sha256": None, "name": info.filename}
+                extracted.append(entry)
+                with zf.open(info) as src, open(dest_path, "wb") as dst:
+                    while True:
+                        chunk = src.read(chunk_size)
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                        # The header size can lie; enforce the limit on actual bytes
+                        if max_bytes and size > max_bytes:
+                            raise UploadTooLarge(max_bytes)
+                        digest.update(chunk)
+                        dst.write(chunk)
+                entry.update(size=size, sha256=digest.hexdigest())
+    except BaseException:
+        for entry in extracted:
+            if os.path.exists(entry["path"]):
+                os.remove(entry["path"])
+        raise
+
+    logger.info(f"Extracted {len(extracted)} report(s) from {zip_path}")
+    return extracted